@@ -0,0 +1,266 @@
+"""
+##### Benchmarks and consistency checks for the data cleaning and ingredient
+##### extraction steps, run on the stored recipe data in the data folder:
+#####     python benchmarks.py check     run consistency checks only
+#####     python benchmarks.py           run benchmarks
+"""
+
+import os
+import sys
+import json
+import time
+import pandas as pd
+import nltk
+from nltk.tokenize import word_tokenize
+
+from non_ascii_elements_and_stop_words import non_ascii_elements
+
+# shared storage module is in the parent code folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from storage import load_recipes, save_recipes, save_recipe_chunks, \
+    iter_recipes, recipes_path
+
+
+# ingredient lists in recipe details, read without the other recipe details
+INGREDIENT_LIST_COLUMN = 'recipes_details.ingredient list'
+# file-name of the dataframe written and read back by check_storage_round_trip
+ROUND_TRIP_NAME = 'storage_round_trip_check'
+
+
+def recipe_text_values(recipes_details):
+    """
+    Collect all text values (strings and strings in lists) from recipe details
+    :param  recipes_details (iterable): recipe details dictionaries
+    :return  list of text values in the recipe details
+    """
+    text_values = []
+    for recipe in recipes_details:
+        for value in recipe.itervalues():
+            if isinstance(value, list):
+                text_values.extend(row for row in value
+                    if isinstance(row, basestring))
+            elif isinstance(value, basestring):
+                text_values.append(value)
+    return text_values
+
+
+def replace_all_loop(text):
+    """
+    Previous replace_all implementation, one str.replace pass per non-ascii \\
+    mapping entry (kept as the baseline for benchmark_replace_all)
+    :param  text (str): text from recipe details dictionary in database
+    :return  replaced ascii encodable text content in string format
+    """
+    vulgar_fraction_puctuation = non_ascii_elements()
+    for old_value, new_value in vulgar_fraction_puctuation.iteritems():
+        text = text.replace(old_value, new_value)
+    return text
+
+
+def benchmark_replace_all(name="recipes_data"):
+    """
+    Time the per-entry replace loop against the compiled translate table \\
+    on every text value of the merged recipe data, and check both give the \\
+    same output
+    :param  name (str): file-name of the stored recipe data
+    :return  dictionary of timings (seconds) and number of strings
+    """
+    from data_clean_and_merge import replace_all
+
+    text_values = recipe_text_values(
+        load_recipes(name, ['recipes_details'])['recipes_details'])
+    start = time.time()
+    loop_output = map(replace_all_loop, text_values)
+    loop_time = time.time() - start
+    start = time.time()
+    table_output = map(replace_all, text_values)
+    table_time = time.time() - start
+    mismatches = sum(1 for old, new in zip(loop_output, table_output) if old != new)
+    print "strings: %d \t mismatches: %d" % (len(text_values), mismatches)
+    print "replace loop: %.3fs \t translate table: %.3fs \t speedup: %.1fx" % \
+        (loop_time, table_time, loop_time / max(table_time, 1e-9))
+    return {'strings': len(text_values), 'mismatches': mismatches,
+        'loop_time': loop_time, 'table_time': table_time}
+
+
+def word_in_stopwords_scan(index, item):
+    """
+    Previous word_in_stopwords implementation, scanning every lemmatized \
+    stop-word with startswith (kept as the reference for \
+    check_stop_word_prefix_lookup)
+    :params  index (StopWordIndex): stop-word index to take the stop-words from
+             item (str): word from ingredient line items
+    :return  boolean, true if a version of item is in stop-words, else false
+    """
+    item = index.lemmatize(item.lower())
+    for each_set in [index.english_stop_words, index.stop_words]:
+        if item.lower().replace('-', '').replace('.', '') in each_set:
+            return True
+        for word in index.stop_words:
+            if word.startswith(item):
+                return True
+    return False
+
+
+def stop_word_lookup_words(ingredient_lists, index):
+    """
+    Get the words the stop-word lookup is called with for ingredient lists: \
+    lower-case lemmatized alphabetic tokens, as in ingredient_words_per_line
+    :params  ingredient_lists (iterable): ingredient line items for each recipe
+             index (StopWordIndex): stop-word index to lemmatize with
+    :return  set of lemmatized words
+    """
+    words = set()
+    for ingredient_list in ingredient_lists:
+        for ingredient_line in ingredient_list:
+            for token in word_tokenize(ingredient_line):
+                word = index.lemmatize(token.replace('/', ' ').lower())
+                if word.replace('-', '').isalpha():
+                    words.add(word)
+    return words
+
+
+def check_stop_word_prefix_lookup(name="recipes_data"):
+    """
+    Run the stop-word scan and the bisect prefix lookup over every word \
+    the ingredient extraction looks up in the ingredient lists of the \
+    recipe data and check that they agree
+    :param  name (str): file-name of the stored recipe data
+    :return  list of words for which the two implementations disagree
+    """
+    from data_format import get_stop_word_index
+
+    index = get_stop_word_index()
+    words = stop_word_lookup_words(load_recipes(name, [INGREDIENT_LIST_COLUMN])
+        [INGREDIENT_LIST_COLUMN], index)
+    mismatches = sorted(word for word in words
+        if index.is_stop_word(word) != word_in_stopwords_scan(index, word))
+    print "stop-word lookup: \t words: %d \t mismatches: %d" % (len(words),
+        len(mismatches))
+    return mismatches
+
+
+def round_trip_recipes():
+    """
+    Get a small recipe dataframe with the value kinds the storage layer has \
+    to keep as they are: dictionary keys holding ints, floats, strings and \
+    lists with missing values in other rows, nested objects (json encoded), \
+    rows without dictionary and list columns
+    :param  none
+    :return  pandas dataframe of recipes
+    """
+    return pd.DataFrame({'source': [u'BBC Food', u'Saveur', u'Epicurious'],
+        'cuisine': [u'italian', None, u'greek'],
+        'recipes_details': [{'r_link': u'/r/1', 'servings': 4, 'rating': 4.5,
+            'ingredient list': [u'1 cup rice'], 'nutrition': {'kcal': 300}},
+            {'r_link': u'/r/2', 'servings': None, 'rating': None,
+            'ingredient list': None, 'nutrition': None}, None],
+        'recipe_ingredients': [[u'rice'], [], None]},
+        columns=['source', 'cuisine', 'recipes_details', 'recipe_ingredients'])
+
+
+def json_values(values):
+    """
+    Encode column values in json, which tells ints from floats and None \
+    from NaN (they compare equal in python)
+    :param  values (iterable): column values
+    :return  list of json strings
+    """
+    return [json.dumps(value, sort_keys=True) for value in values]
+
+
+def check_storage_round_trip(name=ROUND_TRIP_NAME):
+    """
+    Save a recipe dataframe with the storage layer (whole and one row at a \
+    time), load it back (whole and in chunks) and check that all values are \
+    unchanged
+    :param  name (str): file-name to write the dataframe with, removed after
+    :return  list of columns whose values changed
+    """
+    recipes_data = round_trip_recipes()
+    save_recipes(recipes_data, name)
+    try:
+        loaded_data = load_recipes(name)
+        chunk_data = pd.concat(list(iter_recipes(name, chunk_size=2)))
+        save_recipe_chunks(lambda: (recipes_data.iloc[row:row + 1] for row in
+            xrange(len(recipes_data))), name)
+        row_chunk_data = load_recipes(name)
+    finally:
+        os.remove(recipes_path(name))
+    mismatches = [column for column in recipes_data.columns if
+        any(json_values(recipes_data[column]) != json_values(data[column])
+        for data in (loaded_data, chunk_data, row_chunk_data))]
+    print "storage round trip: \t columns: %d \t mismatches: %s" % (
+        len(recipes_data.columns), mismatches)
+    return mismatches
+
+
+def benchmark_pos_tagging(name="recipes_data", chunk_size=200):
+    """
+    Time per-line nltk pos_tag calls against pos_tag_sents batches of \
+    chunk_size recipes on the ingredient lists of the recipe data, and \
+    report ingredient lines tagged per second for both
+    :params  name (str): file-name of the stored recipe data
+             chunk_size (int): number of recipes tagged in one batch
+    :return  dictionary of lines per second for per-line and batched tagging
+    """
+    from data_format import word_tokenize_ingredients_batch
+
+    ingredient_lists = list(load_recipes(name, [INGREDIENT_LIST_COLUMN])
+        [INGREDIENT_LIST_COLUMN])
+    number_of_lines = sum(map(len, ingredient_lists))
+    start = time.time()
+    per_line_tags = [[nltk.pos_tag(word_tokenize(line), tagset='universal')
+        for line in ingredient_list] for ingredient_list in ingredient_lists]
+    per_line_time = time.time() - start
+    start = time.time()
+    batched_tags = []
+    for chunk_start in xrange(0, len(ingredient_lists), chunk_size):
+        batched_tags.extend(word_tokenize_ingredients_batch(
+            ingredient_lists[chunk_start:chunk_start + chunk_size]))
+    batched_time = time.time() - start
+    assert per_line_tags == batched_tags
+    lines_per_second = {'per_line': number_of_lines / max(per_line_time, 1e-9),
+        'batched': number_of_lines / max(batched_time, 1e-9)}
+    print "lines: %d \t per-line: %.0f lines/s \t batched: %.0f lines/s" % \
+        (number_of_lines, lines_per_second['per_line'], lines_per_second['batched'])
+    return lines_per_second
+
+
+def benchmark_ingredient_vectors(name="recipes_data_ingredients"):
+    """
+    Time building the ingredient vectors from the recipe data against \
+    loading the stored vectors (memory-mapped), and check both give the \
+    same matrices
+    :param  name (str): file-name of the recipe data with recipe ingredients
+    :return  dictionary of build and load timings (seconds)
+    """
+    from ingredient_vectors import build_ingredient_vectors, IngredientVectors
+
+    start = time.time()
+    built_vectors = build_ingredient_vectors(name)
+    build_time = time.time() - start
+    start = time.time()
+    loaded_vectors = IngredientVectors.load()
+    load_time = time.time() - start
+    assert loaded_vectors.data_version == built_vectors.data_version
+    assert (loaded_vectors.counts != built_vectors.counts).nnz == 0
+    assert (loaded_vectors.tfidf != built_vectors.tfidf).nnz == 0
+    print "ingredient vectors: \t build: %.3fs \t load: %.1fms" % (build_time,
+        load_time * 1000)
+    return {'build_time': build_time, 'load_time': load_time}
+
+
+if __name__ == '__main__':
+
+    if sys.argv[1:] == ['check']:
+        mismatches = check_storage_round_trip()
+        if mismatches:
+            sys.exit("storage round trip mismatches: %s" % mismatches)
+        mismatches = check_stop_word_prefix_lookup()
+        if mismatches:
+            sys.exit("stop-word lookup mismatches: %s" % mismatches[:20])
+    else:
+        benchmark_replace_all()
+        benchmark_pos_tagging()
+        benchmark_ingredient_vectors()
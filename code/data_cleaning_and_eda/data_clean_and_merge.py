@@ -1,18 +1,38 @@
 """
 ##### Clean the web scraped recipe data, combine data from all 6 recipe
-##### sources, and store combined data in MongoDB and pickle file
+##### sources, and store combined data in MongoDB and Parquet file
 """
 
+import os
+import re
+import sys
+import time
+import json
+import hashlib
+from collections import OrderedDict
 import pandas as pd
 import nltk
 from nltk.tokenize import word_tokenize
 from nltk.stem import WordNetLemmatizer
 from nltk.corpus import stopwords
-from pymongo import MongoClient
-import pickle
-
+from pymongo import MongoClient, ReplaceOne, DeleteOne
 from non_ascii_elements_and_stop_words import non_ascii_elements
 
+# shared storage module is in the parent code folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from storage import save_obj, load_obj, save_recipes, load_recipes
+from storage import recipes_path, DATA_FOLDER
+
+
+# recipe sources in merge order, as (source name, file-name of scraped data)
+SOURCES = [('BBC Food', 'recipes_data_bbc_food'),
+    ('Epicurious', 'recipes_data_epicurious'),
+    ('Chowhound', 'recipes_data_chowhound'),
+    ('BBC Good Food', 'recipes_data_bbc_good_food'),
+    ('Saveur', 'recipes_data_saveur')]
+# file-name of the incremental merge state (fingerprints and watermark)
+STATE_NAME = 'recipes_data_state'
+
 
 # create MongoDB database and collection
 DB_NAME = 'PROJECT_RECIPES'
@@ -24,24 +44,35 @@ db = client[DB_NAME]
 coll = db[COLLECTION_NAME]
 
 
-def save_obj(obj, name):
+def build_non_ascii_translator(replacements):
     """
-    Dump object in pickel file in data folder
-    :params  obj (object): object to be saved (can be in any form)
-             name (str): file-name to save object with
+    Split the non-ascii replacement mapping into a unicode translate table \
+    for single code-point keys and one compiled regex for multi-character keys
+    :param  replacements (dictionary): (non-ascii content, ascii value) pairs
+    :return  translate table (dict of code-point, replacement), compiled regex \
+                for multi-character keys (None if there are none) and the \
+                dictionary of multi-character replacements
     """
-    with open('../../data/' + name + '.pkl', 'wb') as f:
-        pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+    translation_table = {}
+    multi_char_replacements = {}
+    for old_value, new_value in replacements.iteritems():
+        if len(old_value) == 1:
+            translation_table[ord(old_value)] = unicode(new_value)
+        else:
+            multi_char_replacements[old_value] = unicode(new_value)
+    if not multi_char_replacements:
+        return translation_table, None, multi_char_replacements
+    # longest keys first, so that overlapping keys match the longer content
+    multi_char_pattern = re.compile(u'|'.join(map(re.escape,
+        sorted(multi_char_replacements, key=len, reverse=True))))
+    return translation_table, multi_char_pattern, multi_char_replacements
 
 
-def load_obj(name):
-    """
-    Load object from pickel file in data folder
-    :param  name (str): file-name to load object from
-    :return  object in original format
-    """
-    with open('../../data/' + name + '.pkl', 'rb') as f:
-        return pickle.load(f)
+# translate table and multi-character regex are built once at import, \
+# instead of rebuilding the replacement dictionary for every string
+NON_ASCII_TRANSLATION_TABLE, NON_ASCII_MULTI_CHAR_PATTERN, \
+    NON_ASCII_MULTI_CHAR_REPLACEMENTS = build_non_ascii_translator(
+        non_ascii_elements())
 
 
 def replace_all(text):
@@ -52,10 +83,11 @@ def replace_all(text):
     :param  text (str): text from recipe details dictionary in database
     :return  replaced ascii encodable text content in string format
     """
-    vulgar_fraction_puctuation = non_ascii_elements()
-    for old_value, new_value in vulgar_fraction_puctuation.iteritems():
-        text = text.replace(old_value, new_value)
-    return text
+    text = unicode(text)
+    if NON_ASCII_MULTI_CHAR_PATTERN is not None:
+        text = NON_ASCII_MULTI_CHAR_PATTERN.sub(lambda match:
+            NON_ASCII_MULTI_CHAR_REPLACEMENTS[match.group(0)], text)
+    return text.translate(NON_ASCII_TRANSLATION_TABLE)
 
 
 def convert_fractions_and_remove_brackets(data):
@@ -76,138 +108,286 @@ def convert_fractions_and_remove_brackets(data):
     return data
 
 
-def bbc_food_data():
+def load_source_rows(name):
     """
-    Load bbc food data, replace non-ascii chars with their correspinding ascii \
-    values and remove duplicates
-    :param  none
-    :return  pandas dataframe with all the non-ascii replaced and duplicates removed
-    """
-    bbc_data = load_obj('recipes_data_bbc_food').sort_index()
-    # remove float indices
-    bbc_data.reset_index(inplace=True)
-    bbc_data.drop('index', axis=1, inplace=True)
-    bbc_data['recipes_details'] = map(convert_fractions_and_remove_brackets,
-        bbc_data['recipes_details'])
-    bbc_data['recipe_title'] = map(lambda x: x['recipe title'],
-        bbc_data['recipes_details'])
-    bbc_data['recipe_link'] = map(lambda x: x['r_link'], bbc_data['recipes_details'])
-    bbc_data.drop_duplicates(['recipe_link', 'cuisine'], keep='first', inplace=True)
-    bbc_data.reset_index(inplace=True)
-    bbc_data.drop(['index', 'recipe_link'], axis=1, inplace=True)
-    return bbc_data
-
-
-def epicurious_data():
-    """
-    Load epicurious data, replace non-ascii chars with their correspinding ascii \
-    values and remove duplicates
-    :param  none
-    :return  pandas dataframe with all the non-ascii replaced and duplicates removed
-    """
-    epicurious_data = load_obj('recipes_data_epicurious').sort_index()
-    # remove float indices
-    epicurious_data.reset_index(inplace=True)
-    epicurious_data.drop('index', axis=1, inplace=True)
-    epicurious_data['recipes_details'] = map(convert_fractions_and_remove_brackets,
-        epicurious_data['recipes_details'])
-    epicurious_data['recipe_title'] = map(lambda x: x['recipe title'],
-        epicurious_data['recipes_details'])
-    epicurious_data['recipe_link'] = map(lambda x: x['r_link'],
-        epicurious_data['recipes_details'])
-    epicurious_data.drop_duplicates(['recipe_link', 'cuisine'],
-        keep='first', inplace=True)
-    epicurious_data.reset_index(inplace=True)
-    epicurious_data.drop(['index', 'recipe_link'], axis=1, inplace=True)
-    return epicurious_data
-
-
-def chowhound_data():
-    """
-    Load chowhound data, replace non-ascii chars with their correspinding ascii \
-    values and remove duplicates
-    :param  none
-    :return  pandas dataframe with all the non-ascii replaced and duplicates removed
-    """
-    chowhound_data = load_obj('recipes_data_chowhound').sort_index()
-    chowhound_data.reset_index(inplace=True)
-    chowhound_data.drop('index', axis=1, inplace=True)
-    chowhound_data['recipes_details'] = map(convert_fractions_and_remove_brackets,
-        chowhound_data['recipes_details'])
-    chowhound_data['recipe_title'] = map(lambda x: x['recipe title'],
-        chowhound_data['recipes_details'])
-    chowhound_data['recipe_link'] = map(lambda x: x['r_link'],
-        chowhound_data['recipes_details'])
-    chowhound_data.drop_duplicates(['recipe_link', 'cuisine'], keep='first',
-        inplace=True)
-    chowhound_data.reset_index(inplace=True)
-    chowhound_data.drop(['index', 'recipe_link'], axis=1, inplace=True)
-    return chowhound_data
-
-
-def bbc_good_food_data():
-    """
-    Load bbc good food data, replace non-ascii chars with their correspinding ascii \
-    values and remove duplicates
-    :param  none
-    :return  pandas dataframe with all the non-ascii replaced and duplicates removed
-    """
-    bbc_good_food_data = load_obj('recipes_data_bbc_good_food').sort_index()
-    # remove float indices
-    bbc_good_food_data.reset_index(inplace=True)
-    bbc_good_food_data.drop('index', axis=1, inplace=True)
-    bbc_good_food_data['recipes_details'] = map(convert_fractions_and_remove_brackets,
-        bbc_good_food_data['recipes_details'])
-    bbc_good_food_data['recipe_title'] = map(lambda x: x['recipe title'],
-        bbc_good_food_data['recipes_details'])
-    bbc_good_food_data['recipe_link'] = map(lambda x: x['r_link'],
-        bbc_good_food_data['recipes_details'])
-    bbc_good_food_data.drop_duplicates(['recipe_link', 'cuisine'],
-        keep='first', inplace=True)
-    bbc_good_food_data.reset_index(inplace=True)
-    bbc_good_food_data.drop(['index', 'recipe_link'], axis=1, inplace=True)
-    return bbc_good_food_data
-
-
-def saveur_data():
-    """
-    Load saveur data, replace non-ascii chars with their correspinding ascii \
-    values and remove duplicates
-    :param  none
-    :return  pandas dataframe with all the non-ascii replaced and duplicates removed
-    """
-    saveur_data = load_obj('recipes_data_saveur').sort_index()
-    saveur_data.reset_index(inplace=True)
-    saveur_data.drop('index', axis=1, inplace=True)
-    saveur_data['recipes_details'] = map(convert_fractions_and_remove_brackets,
-        saveur_data['recipes_details'])
-    saveur_data['recipe_title'] = map(lambda x: x['recipe title'],
-        saveur_data['recipes_details'])
-    saveur_data['recipe_link'] = map(lambda x: x['r_link'],
-        saveur_data['recipes_details'])
-    saveur_data.drop_duplicates(['recipe_link', 'cuisine'], keep='first', inplace=True)
-    saveur_data.reset_index(inplace=True)
-    saveur_data.drop(['index', 'recipe_link'], axis=1, inplace=True)
-    return saveur_data
+    Load scraped data for one source and yield its rows in index order, \
+    releasing the dataframe once all rows are consumed
+    :param  name (str): file-name of the scraped data for source
+    :return  generator of rows as dictionaries of (column, value) pairs
+    """
+    source_data = load_recipes(name).sort_index()
+    columns = list(source_data.columns)
+    for row in source_data.itertuples(index=False):
+        yield dict(zip(columns, row))
+
+
+def clean_recipe_rows(rows):
+    """
+    Replace non-ascii chars with their correspinding ascii values in recipe \
+    details of each row and add the recipe title
+    :param  rows (iterable): rows of scraped data as dictionaries
+    :return  generator of cleaned rows
+    """
+    for row in rows:
+        row['recipes_details'] = convert_fractions_and_remove_brackets(
+            row['recipes_details'])
+        row['recipe_title'] = row['recipes_details']['recipe title']
+        yield row
+
+
+def unique_recipe_rows(rows):
+    """
+    Remove duplicate recipes, keeping the first row for each \
+    (recipe_link, cuisine) pair
+    :param  rows (iterable): cleaned rows as dictionaries
+    :return  generator of rows without duplicates
+    """
+    seen_keys = set()
+    for row in rows:
+        key = (row['recipes_details']['r_link'], row['cuisine'])
+        if key in seen_keys:
+            continue
+        seen_keys.add(key)
+        yield row
+
+
+def source_recipes(name, fingerprints=None):
+    """
+    Load data for one source, replace non-ascii chars with their correspinding \
+    ascii values and remove duplicates
+    :params  name (str): file-name of the scraped data for source
+             fingerprints (OrderedDict): if given, filled with the fingerprint \
+                of each recipe key of the scraped rows, in row order
+    :return  generator of cleaned rows without duplicates
+    """
+    rows = load_source_rows(name)
+    if fingerprints is not None:
+        rows = fingerprinted_rows(rows, fingerprints)
+    return unique_recipe_rows(clean_recipe_rows(rows))
+
+
+def merged_recipes(sources=SOURCES, state=None):
+    """
+    Stream cleaned rows without duplicates from all sources, one source at \
+    a time in merge order
+    :params  sources (list): (source name, file-name of scraped data) pairs
+             state (dictionary): if given, filled with the incremental merge \
+                state of each source (file and recipe fingerprints)
+    :return  generator of cleaned rows as dictionaries
+    """
+    for source, name in sources:
+        fingerprints = None
+        if state is not None:
+            fingerprints = OrderedDict()
+            state['sources'][source] = {'file_fingerprint':
+                file_fingerprint(source_path(name)), 'recipes': fingerprints}
+        for row in source_recipes(name, fingerprints):
+            yield row
 
 
 def combine_data():
     """
     Clean data from all sources, merge the data to form a new pandas dataframe \
-    and store the merged data in mongoDB and pickle file
+    and store the merged data in mongoDB and Parquet file, and the state of \
+    the merge for the next incremental merge
     :param  none
     :return  none
     """
-    recipes_data = pd.DataFrame()
-    recipes_data = recipes_data.append(bbc_food_data(), ignore_index=True)
-    recipes_data = recipes_data.append(epicurious_data(), ignore_index=True)
-    recipes_data = recipes_data.append(chowhound_data(), ignore_index=True)
-    recipes_data = recipes_data.append(bbc_good_food_data(), ignore_index=True)
-    recipes_data = recipes_data.append(saveur_data(), ignore_index=True)
-    save_obj(recipes_data, "recipes_data")
+    run_start = time.time()
+    state = {'watermark': None, 'sources': {}}
+    recipes_data = pd.DataFrame(list(merged_recipes(state=state)))
+    save_recipes(recipes_data, "recipes_data")
     coll.insert_many(recipes_data.to_dict('records'))
+    state['watermark'] = run_start
+    save_obj(state, STATE_NAME)
+
+
+def source_path(name):
+    """
+    Get path of the file holding scraped data for source in data folder, \
+    the Parquet file or the pickle file if not yet migrated
+    :param  name (str): file-name of the scraped data for source
+    :return  path of the file
+    """
+    if os.path.exists(recipes_path(name)):
+        return recipes_path(name)
+    return DATA_FOLDER + name + '.pkl'
+
+
+def file_fingerprint(path):
+    """
+    Get content fingerprint of file
+    :param  path (str): path of the file
+    :return  sha1 hex digest of file content
+    """
+    file_hash = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), ''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def recipe_fingerprint(recipe):
+    """
+    Get content fingerprint of recipe details dictionary
+    :param  recipe (dictionary): dict of recipe details for one recipe
+    :return  sha1 hex digest of recipe details
+    """
+    return hashlib.sha1(json.dumps(recipe, sort_keys=True)).hexdigest()
+
+
+def recipe_key(recipe, cuisine):
+    """
+    Get key of recipe in merged data, the same (recipe_link, cuisine) pair \
+    that duplicates are removed on
+    :params  recipe (dictionary): dict of recipe details for one recipe
+             cuisine (str): cuisine of recipe
+    :return  tuple of cleaned recipe link and cuisine
+    """
+    return replace_all(recipe['r_link']), cuisine
+
+
+def recipe_filter(source, key):
+    """
+    Get MongoDB filter for one recipe of the merged data
+    :params  source (str): recipe source name
+             key (tuple): cleaned recipe link and cuisine of recipe
+    :return  dictionary filter on source, cuisine and recipe link
+    """
+    return {'source': source, 'cuisine': key[1], 'recipes_details.r_link': key[0]}
+
+
+def fingerprinted_rows(rows, fingerprints):
+    """
+    Record the fingerprint of the first row of each recipe key (the row kept \
+    by the merge) before the rows are cleaned
+    :params  rows (iterable): rows of scraped data for source as dictionaries
+             fingerprints (OrderedDict): fingerprint by recipe key, filled in \
+                row order
+    :return  generator of the same rows
+    """
+    for row in rows:
+        key = recipe_key(row['recipes_details'], row['cuisine'])
+        if key not in fingerprints:
+            fingerprints[key] = recipe_fingerprint(row['recipes_details'])
+        yield row
+
+
+def merge_order(recipes_data, state):
+    """
+    Sort merged rows in the order of the full merge: by source in SOURCES \
+    order, then by position of the recipe key in the source data
+    :params  recipes_data (dataframe): merged recipe data
+             state (dictionary): incremental merge state, with the recipe \
+                keys of each source in row order
+    :return  sorted dataframe with a new index
+    """
+    source_ranks = dict((source, rank) for rank, (source, name) in
+        enumerate(SOURCES))
+    recipe_positions = dict((source, dict((key, position) for position, key in
+        enumerate(source_state['recipes']))) for source, source_state in
+        state['sources'].iteritems())
+    row_order = [(source_ranks[source], recipe_positions[source].get(
+        recipe_key(recipe, cuisine))) for source, recipe, cuisine in
+        zip(recipes_data['source'], recipes_data['recipes_details'],
+        recipes_data['cuisine'])]
+    rows = sorted(xrange(len(row_order)), key=row_order.__getitem__)
+    return recipes_data.iloc[rows].reset_index(drop=True)
+
+
+def source_changes(rows, recipe_fingerprints):
+    """
+    Compare recipes of one source with their fingerprints from the last merge \
+    keeping the first recipe for each (recipe_link, cuisine) pair
+    :params  rows (list): rows of scraped data for source as dictionaries
+             recipe_fingerprints (dictionary): fingerprint by recipe key, \
+                from the last merge
+    :return  fingerprint by recipe key for rows, positions of new or changed \
+                recipes in rows and keys of removed recipes
+    """
+    fingerprints = OrderedDict()
+    changed_positions = []
+    for position, row in enumerate(rows):
+        key = recipe_key(row['recipes_details'], row['cuisine'])
+        if key in fingerprints:
+            continue
+        fingerprints[key] = recipe_fingerprint(row['recipes_details'])
+        if recipe_fingerprints.get(key) != fingerprints[key]:
+            changed_positions.append(position)
+    removed_keys = [removed_key for removed_key in recipe_fingerprints
+        if removed_key not in fingerprints]
+    return fingerprints, changed_positions, removed_keys
+
+
+def combine_data_incremental():
+    """
+    Merge only new or changed recipes into the merged data. Sources whose \
+    data file is unchanged since the last merge (by modification time \
+    against the watermark, then by content fingerprint) are skipped. For the \
+    others, only recipes whose fingerprint changed are cleaned, replacing \
+    their rows in the merged data, which is then sorted in the order of the \
+    full merge, and MongoDB writes are upserts and deletes by (source, \
+    cuisine, recipe link). The first run, without a saved state, builds the \
+    merged data from all recipes
+    :param  none
+    :return  none
+    """
+    try:
+        state = load_obj(STATE_NAME)
+    except IOError:
+        state = {'watermark': None, 'sources': {}}
+    if state['sources']:
+        recipes_data = load_recipes("recipes_data")
+    else:
+        recipes_data = pd.DataFrame()
+    run_start = time.time()
+    operations = []
+    for source, name in SOURCES:
+        source_state = state['sources'].get(source)
+        path = source_path(name)
+        if source_state and os.path.getmtime(path) <= state['watermark']:
+            continue
+        fingerprint = file_fingerprint(path)
+        if source_state and source_state['file_fingerprint'] == fingerprint:
+            continue
+        rows = list(load_source_rows(name))
+        recipe_fingerprints = source_state['recipes'] if source_state else {}
+        fingerprints, changed_positions, removed_keys = source_changes(
+            rows, recipe_fingerprints)
+        print "%s: \t new or changed recipes: %d \t removed recipes: %d" % \
+            (source, len(changed_positions), len(removed_keys))
+        changed_rows = list(clean_recipe_rows(rows[position]
+            for position in changed_positions))
+        changed_keys = set(removed_keys)
+        changed_keys.update(recipe_key(row['recipes_details'], row['cuisine'])
+            for row in changed_rows)
+        if len(recipes_data):
+            stale_rows = [(row_source == source) and
+                (recipe_key(recipe, cuisine) in changed_keys)
+                for row_source, recipe, cuisine in zip(recipes_data['source'],
+                recipes_data['recipes_details'], recipes_data['cuisine'])]
+            recipes_data = recipes_data[[not stale for stale in stale_rows]]
+        recipes_data = pd.concat([recipes_data, pd.DataFrame(changed_rows)],
+            ignore_index=True)
+        for key in removed_keys:
+            operations.append(DeleteOne(recipe_filter(source, key)))
+        for row in changed_rows:
+            key = recipe_key(row['recipes_details'], row['cuisine'])
+            operations.append(ReplaceOne(recipe_filter(source, key), row,
+                upsert=True))
+        state['sources'][source] = {'file_fingerprint': fingerprint,
+            'recipes': fingerprints}
+    if operations:
+        recipes_data = merge_order(recipes_data, state)
+        save_recipes(recipes_data, "recipes_data")
+        coll.bulk_write(operations, ordered=False)
+    state['watermark'] = run_start
+    save_obj(state, STATE_NAME)
 
 
 if __name__ == '__main__':
 
-    combine_data()
+    if '--full' in sys.argv:
+        combine_data()
+    else:
+        combine_data_incremental()
@@ -3,16 +3,44 @@
 ##### recipes
 """
 
+from bisect import bisect_left
+from collections import OrderedDict
+import os
+import sys
+from multiprocessing import Pool, cpu_count
+import hashlib
 import pandas as pd
-import pickle
 import nltk
 from nltk.tokenize import word_tokenize
 from nltk.stem import WordNetLemmatizer
 from nltk.corpus import stopwords
+from pymongo import MongoClient
 from non_ascii_elements_and_stop_words import recipe_stop_words_cooking
 from non_ascii_elements_and_stop_words import recipe_stop_words_processing
 from non_ascii_elements_and_stop_words import recipe_stop_words_sizes
 from non_ascii_elements_and_stop_words import recipe_stop_words_other
+from near_duplicates import keep_near_duplicates
+
+# shared storage module is in the parent code folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from storage import save_obj, load_obj, save_recipes, load_recipes
+
+
+# maximum number of words kept in the lemmatizer cache
+LEMMA_CACHE_SIZE = 100000
+# number of ingredient lines tagged in one batch, and sent to a worker
+# process at a time in parallel mode
+INGREDIENT_CHUNK_SIZE = 2000
+# file-name of the extracted ingredients cache (by ingredient line)
+INGREDIENT_LINE_CACHE_NAME = 'ingredient_line_cache'
+# version of the ingredient extraction (the functions from
+# ingredient_words_per_line to recipe_ingredients_from_tagged_lines), part of
+# the ingredient line cache key with the nltk version (tagger, lemmatizer):
+# change it whenever the extraction changes, so that cached ingredients are
+# extracted again
+INGREDIENT_EXTRACTION_VERSION = '1'
+# which recipes to keep from each near-duplicate cluster (see near_duplicates)
+NEAR_DUPLICATE_KEEP = 'first'
 
 
 # create MongoDB database and collection
@@ -25,24 +53,162 @@ db = client[DB_NAME]
 coll = db[COLLECTION_NAME]
 
 
-def save_obj(obj, name):
+class StopWordIndex(object):
     """
-    Dump object in pickel file in data folder
-    :params  obj (object): object to be saved (can be in any form)
-             name (str): file-name to save object with
+    Build the lemmatized stop-words and the nltk english stop-words once, and \
+    lemmatize words through an LRU cache with hit/miss counters, so that each \
+    ingredient word costs a cached lemmatization and set lookups
     """
-    with open('../../data/' + name + '.pkl', 'wb') as f:
-        pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+
+    def __init__(self, cache_size=LEMMA_CACHE_SIZE):
+        """
+        :param  cache_size (int): maximum number of words kept in the \
+                    lemmatizer cache
+        """
+        self.lemmatizer = WordNetLemmatizer()
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.english_stop_words = frozenset(stopwords.words('english'))
+        set_of_stop_words = recipe_stop_words_cooking() | \
+            recipe_stop_words_processing() | recipe_stop_words_sizes() | \
+            recipe_stop_words_other()
+        self.stop_words = frozenset(self.lemmatize(x.replace('-', ''))
+            for x in set_of_stop_words)
+        # sorted stop-words for the bisect prefix lookup in is_stop_word_prefix
+        self.sorted_stop_words = sorted(self.stop_words)
+        # version of the stop-word sets, part of the ingredient line cache keys
+        self.version = hashlib.sha1(u'\n'.join(self.sorted_stop_words + [u''] +
+            sorted(self.english_stop_words)).encode('utf-8')).hexdigest()
+
+    def lemmatize(self, word):
+        """
+        Lemmatize input word using WordNet Lemmatizer, through the LRU cache
+        :param  word (str): word to be lemmatized
+        :return  lemmatized word in string format
+        """
+        if word in self.cache:
+            self.hits += 1
+            # re-insert the word to mark it as most recently used
+            lemma = self.cache.pop(word)
+            self.cache[word] = lemma
+            return lemma
+        self.misses += 1
+        lemma = self.lemmatizer.lemmatize(word)
+        self.cache[word] = lemma
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return lemma
+
+    def is_stop_word(self, item):
+        """
+        Checks if the lower-case lemmatized word is a stop word or not (both \
+        nltk stopwords as well as the pre-defined stop-words), or a prefix of \
+        one of the pre-defined stop-words
+        :param  item (str): word from ingredient line items
+        :return  boolean, true if a version of item is in stop-words, else false
+        """
+        item = self.lemmatize(item.lower())
+        stripped_item = item.lower().replace('-', '').replace('.', '')
+        if stripped_item in self.english_stop_words or \
+            stripped_item in self.stop_words:
+            return True
+        return self.is_stop_word_prefix(item)
+
+    def is_stop_word_prefix(self, item):
+        """
+        Checks if item is a prefix of any pre-defined stop-word. The first \
+        sorted stop-word not smaller than item starts with item if any \
+        stop-word does, so the lookup is one bisect instead of a scan
+        :param  item (str): lemmatized word from ingredient line items
+        :return  boolean, true if a stop-word starts with item, else false
+        """
+        position = bisect_left(self.sorted_stop_words, item)
+        return position < len(self.sorted_stop_words) and \
+            self.sorted_stop_words[position].startswith(item)
+
+    def cache_info(self):
+        """
+        Get lemmatizer cache statistics
+        :param  none
+        :return  dictionary with cache hits, misses, current size and max size
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+            'size': len(self.cache), 'max_size': self.cache_size}
+
+
+# stop-word index shared by all calls in this process, built on first use
+_stop_word_index = None
+
+
+def get_stop_word_index():
+    """
+    Get the stop-word index for this process, building it on first use
+    :param  none
+    :return  StopWordIndex object
+    """
+    global _stop_word_index
+    if _stop_word_index is None:
+        _stop_word_index = StopWordIndex()
+    return _stop_word_index
 
 
-def load_obj(name):
+class IngredientLineCache(object):
     """
-    Load object from pickel file in data folder
-    :param  name (str): file-name to load object from
-    :return  object in original format
+    On-disk cache of the ingredients extracted from each ingredient line, \
+    keyed by a hash of the whitespace-normalized line, the stop-word version \
+    and the extraction version, so that re-runs only tag and filter lines \
+    not seen before
     """
-    with open('../../data/' + name + '.pkl', 'rb') as f:
-        return pickle.load(f)
+
+    def __init__(self, version, name=INGREDIENT_LINE_CACHE_NAME,
+                 extraction_version=INGREDIENT_EXTRACTION_VERSION):
+        """
+        :params  version (str): version of the stop-word sets
+                 name (str): file-name of the cache in data folder
+                 extraction_version (str): version of the ingredient extraction
+        """
+        self.version = version
+        self.extraction_version = '%s nltk %s' % (extraction_version,
+            nltk.__version__)
+        self.name = name
+        try:
+            self.entries = load_obj(name)
+        except IOError:
+            self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, ingredient_line):
+        """
+        Get cache key for ingredient line
+        :param  ingredient_line (str): ingredient line item
+        :return  hex digest of the extraction and stop-word versions and \
+                    normalized line
+        """
+        normalized_line = u' '.join(unicode(ingredient_line).split())
+        return hashlib.sha1(self.extraction_version + '\n' + self.version +
+            '\n' + normalized_line.encode('utf-8')).hexdigest()
+
+    def hit_ratio(self):
+        """
+        Get fraction of ingredient lines found in the cache
+        :param  none
+        :return  cache hit ratio (float), 0 if no lines were looked up
+        """
+        lookups = self.hits + self.misses
+        if not lookups:
+            return 0.
+        return self.hits / float(lookups)
+
+    def save(self):
+        """
+        Dump cache entries in pickle file in data folder
+        :param  none
+        :return  none
+        """
+        save_obj(self.entries, self.name)
 
 
 def lemmatize_text(word):
@@ -51,8 +217,7 @@ def lemmatize_text(word):
     :param  word (str): word to be lemmatized using word
     :return  lemmatized word in string format
     """
-    wordnet_lemmatizer = WordNetLemmatizer()
-    return wordnet_lemmatizer.lemmatize(word)
+    return get_stop_word_index().lemmatize(word)
 
 
 def stop_words_lemmatized():
@@ -61,13 +226,7 @@ def stop_words_lemmatized():
     :param  none
     :return  set of lemmatized stop words
     """
-    set_of_stop_words = recipe_stop_words_cooking() | \
-        recipe_stop_words_processing() | recipe_stop_words_sizes() | \
-        recipe_stop_words_other()
-    stop_words_lematized = map(lambda x: lemmatize_text
-        (x.replace('-', '')), set_of_stop_words)
-    stopwords_count = len(stop_words_lematized)
-    return stop_words_lematized
+    return get_stop_word_index().stop_words
 
 
 def word_tokenize_ingredients(ingredient_list_per_recipe):
@@ -81,6 +240,27 @@ def word_tokenize_ingredients(ingredient_list_per_recipe):
         ingredient_list_per_recipe)
 
 
+def word_tokenize_ingredients_batch(ingredient_lists):
+    """
+    Tokenize ingredient lists for a chunk of recipes, tagging the lines of all \
+    recipes together with one nltk pos_tag_sents call and splitting the \
+    tagged lines back per recipe
+    :params  ingredient_lists (list): ingredient line items for each recipe
+    :return  list of word and word_tag tuples in ingredient line items, \
+                for each recipe
+    """
+    tokenized_lines = [word_tokenize(line) for ingredient_list_per_recipe in
+        ingredient_lists for line in ingredient_list_per_recipe]
+    tagged_lines = nltk.pos_tag_sents(tokenized_lines, tagset='universal')
+    tagged_lines_per_recipe = []
+    start = 0
+    for ingredient_list_per_recipe in ingredient_lists:
+        end = start + len(ingredient_list_per_recipe)
+        tagged_lines_per_recipe.append(tagged_lines[start:end])
+        start = end
+    return tagged_lines_per_recipe
+
+
 def word_in_stopwords(item):
     """
     Checks if the lower-case lemmatized word is a stop word or not (both \
@@ -89,16 +269,7 @@ def word_in_stopwords(item):
     :param  item (str): word from ingredient line items
     :return  boolean, true if a version of item is in stop-words, else false
     """
-
-    item = lemmatize_text(item.lower())
-    lemmatized_stop_words = set(stop_words_lemmatized())
-    for each_set in [set(stopwords.words('english')), lemmatized_stop_words]:
-        if item.lower().replace('-', '').replace('.', '') in each_set:
-            return True
-        for word in lemmatized_stop_words:
-            if word.startswith(item):
-                return True
-    return False
+    return get_stop_word_index().is_stop_word(item)
 
 
 def ingredient_words_per_line(ingredient_line):
@@ -169,6 +340,22 @@ def ingredients_per_line(ingredient_word_list):
     return ingredients_list_per_line
 
 
+def recipe_ingredients_from_tagged_lines(tagged_ingredient_lines):
+    """
+    Get ingredients for all tagged lines in ingredient list for recipe after \
+    joining n-grams
+    :param  tagged_ingredient_lines (list): word and word_tag tuples for each \
+                ingredient line item of one recipe
+    :return  list of unique ingredients for recipe
+    """
+    recipe_ingredient_list = []
+    for ingredient_line in tagged_ingredient_lines:
+        ingredient_word_list_per_line = ingredient_words_per_line(ingredient_line)
+        ingredients_list_per_line = ingredients_per_line(ingredient_word_list_per_line)
+        recipe_ingredient_list.extend(ingredients_list_per_line)
+    return list(set(recipe_ingredient_list))
+
+
 def recipe_ingredient_list_generator(ingredient_list_per_recipe):
     """
     Get ingredients for all lines in ingredient list for recipe after joining \
@@ -180,40 +367,117 @@ def recipe_ingredient_list_generator(ingredient_list_per_recipe):
     """
 
     ingredient_list_per_recipe = word_tokenize_ingredients(ingredient_list_per_recipe)
-    recipe_ingredient_list = []
-    for ingredient_line in ingredient_list_per_recipe:
-        ingredient_word_list_per_line = ingredient_words_per_line(ingredient_line)
-        ingredients_list_per_line = ingredients_per_line(ingredient_word_list_per_line)
-        recipe_ingredient_list.extend(ingredients_list_per_line)
-    return list(set(recipe_ingredient_list))
+    return recipe_ingredients_from_tagged_lines(ingredient_list_per_recipe)
 
 
-def ingredient_data():
+def ingredient_lines_chunk(ingredient_lines):
+    """
+    Get ingredients for each of a chunk of ingredient lines, tagging all the \
+    lines in one batch
+    :param  ingredient_lines (list): ingredient line items (string)
+    :return  list of ingredients for each ingredient line
     """
-    Load cleaned and merged data in pandas dataframe, get ingredients for all \
-    recipes, insert ingredients into dataframe, remove recipes with no ingredients \
-    store final dataframe in MondoDB and pickle file
+    tagged_lines = word_tokenize_ingredients_batch([ingredient_lines])[0]
+    return [ingredients_per_line(ingredient_words_per_line(ingredient_line))
+        for ingredient_line in tagged_lines]
+
+
+def init_ingredient_worker():
+    """
+    Load the nltk tokenizer, tagger and wordnet models and build the stop-word \
+    index once when a worker process starts, instead of on its first recipe
     :param  none
     :return  none
     """
+    get_stop_word_index().lemmatize('onions')
+    word_tokenize_ingredients(['2 onions, chopped'])
+
+
+def recipe_ingredient_lists(ingredient_lists, cache, workers=1,
+    chunk_size=INGREDIENT_CHUNK_SIZE):
+    """
+    Get ingredients for the ingredient lists of all recipes. Only ingredient \
+    lines not in the cache are tagged, in chunks of lines tagged in one batch, \
+    either serially or on a pool of worker processes, and added to the cache. \
+    Results are returned in the order of the ingredient lists in both modes
+    :params  ingredient_lists (list): ingredient line items for each recipe
+             cache (IngredientLineCache): extracted ingredients by line
+             workers (int): number of worker processes, 1 to run serially
+             chunk_size (int): number of ingredient lines tagged in one batch \
+                and sent to a worker at a time
+    :return  list of unique ingredients for each recipe
+    """
+    line_keys_per_recipe = []
+    unseen_lines = OrderedDict()
+    for ingredient_list_per_recipe in ingredient_lists:
+        line_keys = map(cache.key, ingredient_list_per_recipe)
+        for line, key in zip(ingredient_list_per_recipe, line_keys):
+            if key in cache.entries or key in unseen_lines:
+                cache.hits += 1
+            else:
+                cache.misses += 1
+                unseen_lines[key] = line
+        line_keys_per_recipe.append(line_keys)
+    lines = unseen_lines.values()
+    chunks = [lines[start:start + chunk_size]
+        for start in xrange(0, len(lines), chunk_size)]
+    if workers <= 1:
+        chunk_ingredients = map(ingredient_lines_chunk, chunks)
+    else:
+        pool = Pool(workers, initializer=init_ingredient_worker)
+        try:
+            chunk_ingredients = pool.map(ingredient_lines_chunk, chunks, 1)
+        finally:
+            pool.close()
+            pool.join()
+    line_ingredients = [ingredients for chunk in chunk_ingredients
+        for ingredients in chunk]
+    cache.entries.update(zip(unseen_lines.keys(), line_ingredients))
+    return [list(set(ingredient for key in recipe_line_keys
+        for ingredient in cache.entries[key]))
+        for recipe_line_keys in line_keys_per_recipe]
+
+
+def ingredient_data(workers=1, chunk_size=INGREDIENT_CHUNK_SIZE,
+    near_duplicate_keep=NEAR_DUPLICATE_KEEP):
+    """
+    Load cleaned and merged data in pandas dataframe, cluster near-duplicate \
+    recipes across sources and keep recipes from each cluster, get ingredients \
+    for all recipes, insert ingredients into dataframe, remove recipes with no \
+    ingredients store final dataframe in MondoDB and Parquet file
+    :params  workers (int): number of worker processes for ingredient \
+                extraction, 1 to run serially
+             chunk_size (int): number of ingredient lines tagged in one \
+                batch and sent to a worker at a time
+             near_duplicate_keep (str): which recipes to keep from each \
+                near-duplicate cluster ('first', 'most_ingredients' or 'all')
+    :return  none
+    """
 
-    recipes_data = load_obj("recipes_data").sort_index()
+    recipes_data = load_recipes("recipes_data").sort_index()
+    recipes_data = keep_near_duplicates(recipes_data, near_duplicate_keep)
     recipes_data['ingredient_list'] = map(lambda x: x['ingredient list'],
         recipes_data['recipes_details'])
     print "recipes_data_ing_list"
-    recipes_data['recipe_ingredients'] = map(recipe_ingredient_list_generator,
-        recipes_data['ingredient_list'])
+    cache = IngredientLineCache(get_stop_word_index().version)
+    recipes_data['recipe_ingredients'] = recipe_ingredient_lists(
+        list(recipes_data['ingredient_list']), cache, workers, chunk_size)
+    cache.save()
+    print "ingredient line cache hits: %d \t misses: %d \t hit ratio: %.3f" % \
+        (cache.hits, cache.misses, cache.hit_ratio())
     print "recipes_data_ing"
     indices_with_no_ing = recipes_data[recipes_data['ingredient_list']\
     .astype(str) == '[]'].index
     recipes_data = recipes_data.drop(recipes_data.index[indices_with_no_ing])
     recipes_data.reset_index(inplace=True)
     recipes_data.drop('index', axis=1, inplace=True)
-    save_obj(recipes_data, "recipes_data_ingredients")
+    if workers <= 1:
+        print "lemmatizer cache:", get_stop_word_index().cache_info()
+    save_recipes(recipes_data, "recipes_data_ingredients")
     coll.insert_many(recipes_data.to_dict('records'))
     return
 
 
 if __name__ == '__main__':
 
-    ingredient_data()
+    ingredient_data(workers=cpu_count())
@@ -0,0 +1,377 @@
+"""
+##### Count and TF-IDF vectors of the recipe ingredients found by data_format,
+##### over a frozen vocabulary of the ingredients seen in at least two recipes.
+##### Vectors are CSR sparse matrices (int32 indices, float32 values) stored
+##### in an uncompressed .npz file in the data folder and memory-mapped on load
+"""
+
+import os
+import sys
+import time
+import zlib
+import hashlib
+from collections import Counter
+import numpy as np
+from scipy import sparse
+
+# shared storage module is in the parent code folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from storage import load_recipes, save_arrays, load_arrays
+
+
+# file-name of the recipe data with recipe ingredients (from data_format)
+RECIPES_NAME = 'recipes_data_ingredients'
+# column holding the list of unique ingredients of each recipe
+INGREDIENTS_COLUMN = 'recipe_ingredients'
+# file-name of the stored ingredient vectors
+VECTORS_NAME = 'ingredient_vectors'
+# file-names of the stored ingredient vocabularies (named and hashed)
+VOCABULARY_NAME = 'ingredient_vocabulary'
+HASHED_VOCABULARY_NAME = 'ingredient_vocabulary_hashed'
+# minimum number of recipes an ingredient is seen in to be in the vocabulary
+MIN_INGREDIENT_COUNT = 2
+# dtypes of sparse matrix indices and values
+INDEX_DTYPE = np.int32
+VALUE_DTYPE = np.float32
+
+
+def recipe_ingredient_lists(name=RECIPES_NAME):
+    """
+    Load the recipe ingredients of all recipes, reading only that column
+    :param  name (str): file-name of the recipe data with recipe ingredients
+    :return  list of ingredient lists, in the row order of the recipe data
+    """
+    return [list(ingredients) if ingredients is not None else [] for
+        ingredients in load_recipes(name, [INGREDIENTS_COLUMN])[INGREDIENTS_COLUMN]]
+
+
+def data_version(ingredient_lists):
+    """
+    Get version of the ingredient data the vectors are built from, to tell \
+    if stored vectors (and results computed from them) are out of date
+    :param  ingredient_lists (iterable): ingredient lists of all recipes
+    :return  sha1 hex digest of the ingredient lists, in order
+    """
+    version_hash = hashlib.sha1()
+    for ingredients in ingredient_lists:
+        version_hash.update(u'\x1f'.join(sorted(ingredients)).encode('utf-8'))
+        version_hash.update('\x1e')
+    return version_hash.hexdigest()
+
+
+def smoothed_idf(document_frequencies, number_of_recipes):
+    """
+    Get smoothed inverse document frequencies, as in scikit-learn: \
+    ln((1 + recipes) / (1 + document frequency)) + 1
+    :params  document_frequencies (numpy array): number of recipes for \
+                each column
+             number_of_recipes (int): number of recipes in the corpus
+    :return  numpy array of idf values, in column order
+    """
+    return (np.log((1. + number_of_recipes) / (1. + document_frequencies)) +
+        1).astype(VALUE_DTYPE)
+
+
+def csr_counts(column_lists, number_of_columns):
+    """
+    Get CSR count matrix from the columns of each row
+    :params  column_lists (iterable): column of each ingredient (with repeats) \
+                for each row
+             number_of_columns (int): number of matrix columns
+    :return  CSR sparse matrix of counts, one row per list
+    """
+    indptr = [0]
+    indices = []
+    counts = []
+    for columns in column_lists:
+        row_counts = Counter(columns)
+        for column in sorted(row_counts):
+            indices.append(column)
+            counts.append(row_counts[column])
+        indptr.append(len(indices))
+    return sparse.csr_matrix((np.array(counts, dtype=VALUE_DTYPE),
+        np.array(indices, dtype=INDEX_DTYPE), np.array(indptr,
+        dtype=INDEX_DTYPE)), shape=(len(indptr) - 1, number_of_columns))
+
+
+def ingredient_hash(ingredient, number_of_features):
+    """
+    Get column of ingredient with the hashing trick
+    :params  ingredient (str): ingredient name
+             number_of_features (int): number of hashed columns
+    :return  column of ingredient
+    """
+    return (zlib.crc32(ingredient.encode('utf-8')) & 0xffffffff) % \
+        number_of_features
+
+
+class IngredientVocabulary(object):
+    """
+    Frozen ingredient vocabulary: ingredient names in sorted order (the \
+    vector columns), the column of each ingredient, and the number of \
+    recipes each ingredient is seen in (document frequency)
+    """
+
+    def __init__(self, ingredients, document_frequencies, number_of_recipes):
+        """
+        :params  ingredients (iterable): ingredient names, in column order
+                 document_frequencies (iterable): number of recipes each \
+                    ingredient is seen in
+                 number_of_recipes (int): number of recipes in the corpus
+        """
+        self.ingredients = [unicode(ingredient) for ingredient in ingredients]
+        self.columns = dict((ingredient, column) for column, ingredient in
+            enumerate(self.ingredients))
+        self.document_frequencies = np.asarray(document_frequencies,
+            dtype=INDEX_DTYPE)
+        self.number_of_recipes = int(number_of_recipes)
+
+    @classmethod
+    def from_document_frequencies(cls, document_frequencies, number_of_recipes,
+                                  min_count=MIN_INGREDIENT_COUNT):
+        """
+        Build vocabulary of the ingredients seen in at least min_count recipes
+        :params  document_frequencies (dictionary): (ingredient, number of \
+                    recipes) pairs
+                 number_of_recipes (int): number of recipes in the corpus
+                 min_count (int): minimum number of recipes for an ingredient
+        :return  IngredientVocabulary
+        """
+        ingredients = sorted(ingredient for ingredient, count in
+            document_frequencies.iteritems() if count >= min_count)
+        return cls(ingredients, [document_frequencies[ingredient] for
+            ingredient in ingredients], number_of_recipes)
+
+    @classmethod
+    def from_ingredient_lists(cls, ingredient_lists,
+                              min_count=MIN_INGREDIENT_COUNT):
+        """
+        Build vocabulary of the ingredients seen in at least min_count recipes
+        :params  ingredient_lists (iterable): ingredient lists of all recipes
+                 min_count (int): minimum number of recipes for an ingredient
+        :return  IngredientVocabulary
+        """
+        document_frequencies = Counter()
+        number_of_recipes = 0
+        for ingredients in ingredient_lists:
+            document_frequencies.update(set(ingredients))
+            number_of_recipes += 1
+        return cls.from_document_frequencies(document_frequencies,
+            number_of_recipes, min_count)
+
+    def __len__(self):
+        return len(self.ingredients)
+
+    def idf(self):
+        """
+        Get smoothed inverse document frequency of each ingredient
+        :param  none
+        :return  numpy array of idf values, in column order
+        """
+        return smoothed_idf(self.document_frequencies, self.number_of_recipes)
+
+    def count_matrix(self, ingredient_lists):
+        """
+        Get count vectors of ingredient lists, ingredients not in the \
+        vocabulary are left out
+        :param  ingredient_lists (iterable): ingredient lists, one per row
+        :return  CSR sparse matrix of ingredient counts, one row per list
+        """
+        return csr_counts(([self.columns[ingredient] for ingredient in
+            ingredients if ingredient in self.columns] for ingredients in
+            ingredient_lists), len(self))
+
+    def save(self, name=VOCABULARY_NAME):
+        """
+        Write vocabulary with its idf values in .npz file in data folder
+        :param  name (str): file-name to save vocabulary with
+        :return  none
+        """
+        save_arrays({'ingredients': np.array(self.ingredients, dtype=unicode),
+            'document_frequencies': self.document_frequencies,
+            'number_of_recipes': np.array(self.number_of_recipes),
+            'idf': self.idf()}, name)
+
+    @classmethod
+    def load(cls, name=VOCABULARY_NAME):
+        """
+        Load vocabulary from .npz file in data folder
+        :param  name (str): file-name to load vocabulary from
+        :return  IngredientVocabulary
+        """
+        arrays = load_arrays(name)
+        return cls(arrays['ingredients'], arrays['document_frequencies'],
+            arrays['number_of_recipes'])
+
+
+class HashedIngredientVocabulary(object):
+    """
+    Ingredient vocabulary with the hashing trick: ingredients are hashed to \
+    a fixed number of columns, without keeping ingredient names, and the \
+    number of recipes of each column is counted. Columns seen in fewer than \
+    min_count recipes are left out of the vectors
+    """
+
+    def __init__(self, document_frequencies, number_of_recipes,
+                 min_count=MIN_INGREDIENT_COUNT):
+        """
+        :params  document_frequencies (iterable): number of recipes each \
+                    column is seen in (one entry per hashed column)
+                 number_of_recipes (int): number of recipes in the corpus
+                 min_count (int): minimum number of recipes for a column
+        """
+        self.document_frequencies = np.asarray(document_frequencies,
+            dtype=INDEX_DTYPE)
+        self.number_of_recipes = int(number_of_recipes)
+        self.min_count = int(min_count)
+        self.kept_columns = self.document_frequencies >= self.min_count
+
+    def __len__(self):
+        return len(self.document_frequencies)
+
+    def column(self, ingredient):
+        """
+        Get hashed column of ingredient
+        :param  ingredient (str): ingredient name
+        :return  column of ingredient
+        """
+        return ingredient_hash(ingredient, len(self))
+
+    def idf(self):
+        """
+        Get smoothed inverse document frequency of each column
+        :param  none
+        :return  numpy array of idf values, in column order
+        """
+        return smoothed_idf(self.document_frequencies, self.number_of_recipes)
+
+    def count_matrix(self, ingredient_lists):
+        """
+        Get count vectors of ingredient lists over the hashed columns, \
+        ingredients of columns left out of the vocabulary are left out
+        :param  ingredient_lists (iterable): ingredient lists, one per row
+        :return  CSR sparse matrix of hashed ingredient counts, one row per list
+        """
+        return csr_counts(([column for column in map(self.column, ingredients)
+            if self.kept_columns[column]] for ingredients in ingredient_lists),
+            len(self))
+
+    def save(self, name=HASHED_VOCABULARY_NAME):
+        """
+        Write vocabulary with its idf values in .npz file in data folder
+        :param  name (str): file-name to save vocabulary with
+        :return  none
+        """
+        save_arrays({'document_frequencies': self.document_frequencies,
+            'number_of_recipes': np.array(self.number_of_recipes),
+            'min_count': np.array(self.min_count), 'idf': self.idf()}, name)
+
+    @classmethod
+    def load(cls, name=HASHED_VOCABULARY_NAME):
+        """
+        Load vocabulary from .npz file in data folder
+        :param  name (str): file-name to load vocabulary from
+        :return  HashedIngredientVocabulary
+        """
+        arrays = load_arrays(name)
+        return cls(arrays['document_frequencies'], arrays['number_of_recipes'],
+            arrays['min_count'])
+
+
+def tfidf_matrix(counts, idf):
+    """
+    Get TF-IDF vectors from count vectors, each row scaled to unit length \
+    (rows without ingredients stay empty). The TF-IDF matrix has the same \
+    sparsity structure as the count matrix
+    :params  counts (CSR matrix): count vectors
+             idf (numpy array): idf value of each column
+    :return  CSR sparse matrix of TF-IDF vectors
+    """
+    data = counts.data * idf[counts.indices]
+    row_lengths = np.sqrt(np.bincount(np.repeat(np.arange(counts.shape[0]),
+        np.diff(counts.indptr)), weights=data.astype(np.float64) ** 2,
+        minlength=counts.shape[0]))
+    data /= np.repeat(row_lengths, np.diff(counts.indptr))
+    return sparse.csr_matrix((data.astype(VALUE_DTYPE), counts.indices,
+        counts.indptr), shape=counts.shape)
+
+
+class IngredientVectors(object):
+    """
+    Count and TF-IDF vectors of all recipes (one row per recipe, in the row \
+    order of the recipe data) with their vocabulary and data version
+    """
+
+    def __init__(self, vocabulary, counts, tfidf, version):
+        """
+        :params  vocabulary (IngredientVocabulary): vector columns
+                 counts (CSR matrix): count vectors
+                 tfidf (CSR matrix): TF-IDF vectors, same structure as counts
+                 version (str): data version of the recipe ingredients
+        """
+        self.vocabulary = vocabulary
+        self.counts = counts
+        self.tfidf = tfidf
+        self.data_version = version
+
+    def save(self, name=VECTORS_NAME):
+        """
+        Write vectors in .npz file in data folder, count and TF-IDF values \
+        share one set of indices
+        :param  name (str): file-name to save vectors with
+        :return  none
+        """
+        save_arrays({'ingredients': np.array(self.vocabulary.ingredients,
+                dtype=unicode),
+            'document_frequencies': self.vocabulary.document_frequencies,
+            'number_of_recipes': np.array(self.vocabulary.number_of_recipes),
+            'shape': np.array(self.counts.shape), 'indptr': self.counts.indptr,
+            'indices': self.counts.indices, 'counts': self.counts.data,
+            'tfidf': self.tfidf.data, 'data_version': np.array(self.data_version)},
+            name)
+
+    @classmethod
+    def load(cls, name=VECTORS_NAME, mmap=True):
+        """
+        Load vectors from .npz file in data folder, memory-mapping the matrices
+        :params  name (str): file-name to load vectors from
+                 mmap (bool): memory-map arrays, else read them into memory
+        :return  IngredientVectors
+        """
+        arrays = load_arrays(name, mmap)
+        vocabulary = IngredientVocabulary(arrays['ingredients'],
+            arrays['document_frequencies'], arrays['number_of_recipes'])
+        shape = tuple(arrays['shape'])
+        counts = sparse.csr_matrix((arrays['counts'], arrays['indices'],
+            arrays['indptr']), shape=shape, copy=False)
+        tfidf = sparse.csr_matrix((arrays['tfidf'], arrays['indices'],
+            arrays['indptr']), shape=shape, copy=False)
+        return cls(vocabulary, counts, tfidf, str(arrays['data_version']))
+
+
+def build_ingredient_vectors(name=RECIPES_NAME, min_count=MIN_INGREDIENT_COUNT,
+                             vectors_name=VECTORS_NAME):
+    """
+    Build ingredient vocabulary, count and TF-IDF vectors for all recipes \
+    and store them in data folder
+    :params  name (str): file-name of the recipe data with recipe ingredients
+             min_count (int): minimum number of recipes for an ingredient
+             vectors_name (str): file-name to save vectors with
+    :return  IngredientVectors
+    """
+    start = time.time()
+    ingredient_lists = recipe_ingredient_lists(name)
+    vocabulary = IngredientVocabulary.from_ingredient_lists(ingredient_lists,
+        min_count)
+    counts = vocabulary.count_matrix(ingredient_lists)
+    vectors = IngredientVectors(vocabulary, counts,
+        tfidf_matrix(counts, vocabulary.idf()), data_version(ingredient_lists))
+    vectors.save(vectors_name)
+    print "recipes: %d \t ingredients: %d \t non-zeros: %d \t %.1fs" % (
+        counts.shape[0], len(vocabulary), counts.nnz, time.time() - start)
+    return vectors
+
+
+if __name__ == '__main__':
+
+    build_ingredient_vectors()
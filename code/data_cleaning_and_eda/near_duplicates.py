@@ -0,0 +1,187 @@
+"""
+##### Find near-duplicate recipes across sources (e.g. the same recipe on
+##### BBC Food and BBC Good Food) using MinHash signatures of recipe title
+##### and ingredient words and locality-sensitive hashing (LSH) on signature bands
+"""
+
+import re
+import zlib
+from collections import defaultdict
+import numpy as np
+
+
+# number of hash functions in each MinHash signature
+NUM_PERMUTATIONS = 128
+# number of LSH bands the signatures are split into (rows per band is
+# NUM_PERMUTATIONS / LSH_BANDS), recipes sharing a band are candidates
+LSH_BANDS = 32
+# minimum estimated jaccard similarity for candidates to be near-duplicates
+SIMILARITY_THRESHOLD = 0.7
+# seed for the MinHash hash functions
+MINHASH_SEED = 1
+# prime modulus for the MinHash hash functions
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+# exclusive upper bound of the hash function coefficients and of the 32-bit
+# shingle hashes, so a * x + b < 2 ** 64 is computed in uint64 without wrapping
+# before it is reduced mod MERSENNE_PRIME
+COEFFICIENT_LIMIT = 1 << 32
+# policies for which recipes of a near-duplicate cluster to keep
+KEEP_POLICIES = ['first', 'most_ingredients', 'all']
+
+
+def recipe_shingles(recipe):
+    """
+    Get set of lower-case words from recipe title and ingredient list
+    :param  recipe (dictionary): dict of recipe details for one recipe
+    :return  set of words in recipe title and ingredient list
+    """
+    text = u' '.join([recipe.get('recipe title') or u''] +
+        list(recipe.get('ingredient list') or []))
+    return set(re.findall(r'[a-z]+', text.lower()))
+
+
+def minhash_signatures(shingle_sets, num_permutations=NUM_PERMUTATIONS,
+    seed=MINHASH_SEED):
+    """
+    Get MinHash signature for each set of shingles, with the hash functions \
+    (a * x + b) mod MERSENNE_PRIME of the crc32 hash x of each shingle
+    :params  shingle_sets (list): set of shingles (str) for each recipe
+             num_permutations (int): number of hash functions in signature
+             seed (int): seed for the hash function coefficients
+    :return  numpy array of signatures, one row per set of shingles \
+                (rows of empty sets are all the maximum value)
+    """
+    random_state = np.random.RandomState(seed)
+    a = random_state.randint(1, COEFFICIENT_LIMIT, num_permutations,
+        dtype=np.int64).astype(np.uint64)
+    b = random_state.randint(0, COEFFICIENT_LIMIT, num_permutations,
+        dtype=np.int64).astype(np.uint64)
+    signatures = np.full((len(shingle_sets), num_permutations),
+        np.iinfo(np.uint64).max, dtype=np.uint64)
+    for row, shingles in enumerate(shingle_sets):
+        if not shingles:
+            continue
+        hashes = np.array([zlib.crc32(shingle.encode('utf-8')) &
+            (COEFFICIENT_LIMIT - 1) for shingle in shingles], dtype=np.uint64)
+        signatures[row] = ((np.outer(hashes, a) + b) % MERSENNE_PRIME).min(axis=0)
+    return signatures
+
+
+def find_root(parents, item):
+    """
+    Find cluster root of item in union-find parents list, compressing the path
+    :params  parents (list): parent position of each item
+             item (int): position of item
+    :return  position of cluster root
+    """
+    root = item
+    while parents[root] != root:
+        root = parents[root]
+    while parents[item] != root:
+        parents[item], item = root, parents[item]
+    return root
+
+
+def near_duplicate_clusters(signatures, empty_rows=(), bands=LSH_BANDS,
+    threshold=SIMILARITY_THRESHOLD):
+    """
+    Cluster near-duplicate signatures. Signatures are bucketed by each band, \
+    and each signature in a bucket is compared with one signature of each \
+    distinct cluster seen before it in that bucket (not with every other \
+    signature), so the work grows with the number of signatures and clusters \
+    per bucket rather than the number of pairs, and a false-positive \
+    collision does not hide the near-duplicates that follow it. Compared \
+    signatures with estimated jaccard similarity of at least threshold are \
+    joined in the same cluster
+    :params  signatures (numpy array): MinHash signature for each recipe
+             empty_rows (iterable): positions of recipes without shingles, \
+                which are kept in their own clusters
+             bands (int): number of LSH bands
+             threshold (float): minimum estimated jaccard similarity
+    :return  numpy array of cluster id for each recipe, numbered in order of \
+                first recipe in cluster
+    """
+    number_of_rows, num_permutations = signatures.shape
+    rows_per_band = num_permutations // bands
+    empty_rows = set(empty_rows)
+    parents = range(number_of_rows)
+    for band in xrange(bands):
+        band_signatures = signatures[:, band * rows_per_band:
+            (band + 1) * rows_per_band]
+        buckets = defaultdict(list)
+        for row in xrange(number_of_rows):
+            if row not in empty_rows:
+                buckets[band_signatures[row].tobytes()].append(row)
+        for bucket in buckets.itervalues():
+            # first row of each distinct cluster seen in the bucket
+            representatives = []
+            for row in bucket:
+                compared_roots = set()
+                for representative in representatives:
+                    root = find_root(parents, representative)
+                    if root == find_root(parents, row) or root in compared_roots:
+                        continue
+                    compared_roots.add(root)
+                    similarity = np.mean(signatures[row] ==
+                        signatures[representative])
+                    if similarity >= threshold:
+                        parents[find_root(parents, row)] = root
+                if find_root(parents, row) not in set(find_root(parents,
+                    representative) for representative in representatives):
+                    representatives.append(row)
+    cluster_ids = {}
+    clusters = np.empty(number_of_rows, dtype=np.int64)
+    for row in xrange(number_of_rows):
+        clusters[row] = cluster_ids.setdefault(find_root(parents, row),
+            len(cluster_ids))
+    return clusters
+
+
+def recipe_clusters(recipes_details, bands=LSH_BANDS,
+    threshold=SIMILARITY_THRESHOLD):
+    """
+    Get near-duplicate cluster id for each recipe
+    :params  recipes_details (iterable): dict of recipe details for each recipe
+             bands (int): number of LSH bands
+             threshold (float): minimum estimated jaccard similarity
+    :return  numpy array of cluster id for each recipe
+    """
+    shingle_sets = map(recipe_shingles, recipes_details)
+    empty_rows = [row for row, shingles in enumerate(shingle_sets) if not shingles]
+    return near_duplicate_clusters(minhash_signatures(shingle_sets), empty_rows,
+        bands, threshold)
+
+
+def keep_near_duplicates(recipes_data, keep='first'):
+    """
+    Add near-duplicate cluster id for each recipe to recipes dataframe, and \
+    keep recipes from each cluster and cuisine based on keep policy: 'first' \
+    keeps the first recipe (in merge order), 'most_ingredients' keeps the \
+    recipe with the longest ingredient list, 'all' keeps all recipes. Recipes \
+    of a cluster under different cuisines are all kept, as the merged data \
+    keeps one row per cuisine for a recipe listed under several cuisines
+    :params  recipes_data (dataframe): recipes with recipes_details and \
+                cuisine columns
+             keep (str): keep policy, one of KEEP_POLICIES
+    :return  pandas dataframe with cluster_id column and kept recipes
+    """
+    if keep not in KEEP_POLICIES:
+        raise ValueError("keep must be one of %s, not %r" % (KEEP_POLICIES, keep))
+    recipes_data = recipes_data.copy()
+    recipes_data['cluster_id'] = recipe_clusters(recipes_data['recipes_details'])
+    if keep == 'all':
+        return recipes_data
+    if keep == 'first':
+        order = np.arange(len(recipes_data))
+    else:
+        number_of_ingredients = recipes_data['recipes_details'].map(
+            lambda x: len(x.get('ingredient list') or [])).values
+        # stable sort, so that ties keep the first recipe in merge order
+        order = np.argsort(-number_of_ingredients, kind='mergesort')
+    kept_positions = ~recipes_data[['cluster_id', 'cuisine']].iloc[order]\
+        .duplicated(keep='first').values
+    kept_rows = np.zeros(len(recipes_data), dtype=bool)
+    kept_rows[order[kept_positions]] = True
+    print "near-duplicate recipes removed: %d" % (len(recipes_data) -
+        int(kept_rows.sum()))
+    return recipes_data[kept_rows].reset_index(drop=True)
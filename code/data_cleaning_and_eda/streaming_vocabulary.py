@@ -0,0 +1,239 @@
+"""
+##### Build the ingredient vocabulary and document frequencies without loading
+##### all recipes in memory: recipe ingredients are read in chunks (Parquet row
+##### groups, MongoDB cursor batches) and counted in a bounded-memory counter,
+##### or hashed to a fixed number of columns (hashing trick)
+"""
+
+import os
+import sys
+import time
+import numpy as np
+from pymongo import MongoClient
+
+from ingredient_vectors import IngredientVocabulary, HashedIngredientVocabulary
+from ingredient_vectors import ingredient_hash, RECIPES_NAME, INGREDIENTS_COLUMN
+from ingredient_vectors import MIN_INGREDIENT_COUNT
+
+# shared storage module is in the parent code folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from storage import iter_recipes
+
+
+# number of recipes read in one chunk
+CHUNK_SIZE = 5000
+# maximum number of ingredients tracked by the document frequency counter
+MAX_COUNTER_SIZE = 1000000
+# fraction of MAX_COUNTER_SIZE the counter is pruned down to when full
+PRUNED_COUNTER_RATIO = 0.5
+# sources to read recipe ingredients from
+INGREDIENT_SOURCES = ['storage', 'mongo']
+
+
+# MongoDB database and collection of recipes with ingredients (from data_format)
+DB_NAME = 'PROJECT_RECIPES'
+COLLECTION_NAME = 'RECIPES_DATA_WITH_INGREDIENTS'
+
+# connect to mongodb to read recipe ingredients
+client = MongoClient()
+db = client[DB_NAME]
+coll = db[COLLECTION_NAME]
+
+
+def storage_ingredient_chunks(name=RECIPES_NAME, chunk_size=CHUNK_SIZE):
+    """
+    Read ingredient lists of stored recipe data in chunks, one Parquet row \
+    group at a time (a pickled dataframe not yet migrated is loaded whole)
+    :params  name (str): file-name of the recipe data with recipe ingredients
+             chunk_size (int): maximum number of recipes in each chunk
+    :return  generator of lists of ingredient lists
+    """
+    for recipes_data in iter_recipes(name, [INGREDIENTS_COLUMN], chunk_size):
+        yield [list(ingredients) if ingredients is not None else [] for
+            ingredients in recipes_data[INGREDIENTS_COLUMN]]
+
+
+def mongo_ingredient_chunks(chunk_size=CHUNK_SIZE):
+    """
+    Read ingredient lists of recipes in MongoDB in chunks, fetching only the \
+    recipe ingredients in cursor batches of chunk_size
+    :param  chunk_size (int): maximum number of recipes in each chunk
+    :return  generator of lists of ingredient lists
+    """
+    cursor = coll.find({}, {INGREDIENTS_COLUMN: True, '_id': False})\
+        .batch_size(chunk_size)
+    chunk = []
+    for document in cursor:
+        chunk.append(document.get(INGREDIENTS_COLUMN) or [])
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def ingredient_chunks(source='storage', name=RECIPES_NAME, chunk_size=CHUNK_SIZE):
+    """
+    Read ingredient lists of all recipes in chunks
+    :params  source (str): 'storage' (Parquet or pickle file in data folder) \
+                or 'mongo'
+             name (str): file-name of the recipe data (storage source)
+             chunk_size (int): maximum number of recipes in each chunk
+    :return  generator of lists of ingredient lists
+    """
+    if source not in INGREDIENT_SOURCES:
+        raise ValueError("source must be one of %s, not %r" % (INGREDIENT_SOURCES,
+            source))
+    if source == 'mongo':
+        return mongo_ingredient_chunks(chunk_size)
+    return storage_ingredient_chunks(name, chunk_size)
+
+
+class DocumentFrequencyCounter(object):
+    """
+    Number of recipes each ingredient is seen in, in bounded memory (lossy \
+    counting): when more than max_size ingredients are tracked, the rarest \
+    are dropped and max_error is raised. The count of an ingredient (its \
+    count since last tracked plus the max_error when it was tracked) is \
+    never under its true count and over it by at most max_error, and no \
+    ingredient seen in more than max_error recipes is dropped. Counts are \
+    exact while max_error is 0
+    """
+
+    def __init__(self, max_size=MAX_COUNTER_SIZE):
+        """
+        :param  max_size (int): maximum number of ingredients tracked
+        """
+        self.max_size = max_size
+        # (count, max_error when first tracked) of each ingredient
+        self.counts = {}
+        self.max_error = 0
+        self.number_of_recipes = 0
+
+    def update(self, ingredient_lists):
+        """
+        Count ingredient lists of a chunk of recipes, each ingredient once \
+        per recipe
+        :param  ingredient_lists (list): ingredient lists of recipes
+        :return  none
+        """
+        for ingredients in ingredient_lists:
+            for ingredient in set(ingredients):
+                entry = self.counts.get(ingredient)
+                if entry is None:
+                    self.counts[ingredient] = [1, self.max_error]
+                else:
+                    entry[0] += 1
+            self.number_of_recipes += 1
+            if len(self.counts) > self.max_size:
+                self.prune()
+
+    def prune(self):
+        """
+        Drop rarest ingredients, raising max_error until at most \
+        PRUNED_COUNTER_RATIO of max_size ingredients are tracked
+        :param  none
+        :return  none
+        """
+        while len(self.counts) > self.max_size * PRUNED_COUNTER_RATIO:
+            self.max_error += 1
+            self.counts = dict((ingredient, entry) for ingredient, entry in
+                self.counts.iteritems() if sum(entry) > self.max_error)
+
+    def document_frequencies(self):
+        """
+        Get number of recipes of each tracked ingredient (upper bound when \
+        max_error is not 0)
+        :param  none
+        :return  dictionary of (ingredient, number of recipes) pairs
+        """
+        return dict((ingredient, count + error) for ingredient, (count, error)
+            in self.counts.iteritems())
+
+
+class HashedDocumentFrequencyCounter(object):
+    """
+    Number of recipes each hashed ingredient column is seen in, in a fixed \
+    size array of number_of_features counts
+    """
+
+    def __init__(self, number_of_features):
+        """
+        :param  number_of_features (int): number of hashed columns
+        """
+        self.number_of_features = number_of_features
+        self.counts = np.zeros(number_of_features, dtype=np.int64)
+        self.number_of_recipes = 0
+
+    def update(self, ingredient_lists):
+        """
+        Count ingredient lists of a chunk of recipes, each column once per recipe
+        :param  ingredient_lists (list): ingredient lists of recipes
+        :return  none
+        """
+        columns = [column for ingredients in ingredient_lists for column in
+            set(ingredient_hash(ingredient, self.number_of_features)
+            for ingredient in ingredients)]
+        self.counts += np.bincount(np.array(columns, dtype=np.int64),
+            minlength=self.number_of_features)
+        self.number_of_recipes += len(ingredient_lists)
+
+
+def build_vocabulary(chunks, min_count=MIN_INGREDIENT_COUNT,
+                     max_counter_size=MAX_COUNTER_SIZE, hash_features=None):
+    """
+    Build ingredient vocabulary from chunks of ingredient lists, holding one \
+    chunk and the counter in memory at a time
+    :params  chunks (iterable): lists of ingredient lists
+             min_count (int): minimum number of recipes for an ingredient
+             max_counter_size (int): maximum number of ingredients tracked
+             hash_features (int): number of hashed columns for the hashing \
+                trick, None to keep ingredient names
+    :return  IngredientVocabulary, or HashedIngredientVocabulary with the \
+                hashing trick
+    """
+    if hash_features:
+        counter = HashedDocumentFrequencyCounter(hash_features)
+    else:
+        counter = DocumentFrequencyCounter(max_counter_size)
+    for chunk in chunks:
+        counter.update(chunk)
+    if hash_features:
+        return HashedIngredientVocabulary(counter.counts,
+            counter.number_of_recipes, min_count)
+    if counter.max_error >= min_count:
+        print "vocabulary counts are approximate, max error %d >= min count %d" \
+            % (counter.max_error, min_count)
+    return IngredientVocabulary.from_document_frequencies(
+        counter.document_frequencies(), counter.number_of_recipes, min_count)
+
+
+def build_streaming_vocabulary(source='storage', name=RECIPES_NAME,
+                               chunk_size=CHUNK_SIZE,
+                               min_count=MIN_INGREDIENT_COUNT,
+                               max_counter_size=MAX_COUNTER_SIZE,
+                               hash_features=None):
+    """
+    Build ingredient vocabulary and idf values from recipes read in chunks \
+    and store the vocabulary in data folder
+    :params  source (str): 'storage' or 'mongo'
+             name (str): file-name of the recipe data (storage source)
+             chunk_size (int): number of recipes read in one chunk
+             min_count (int): minimum number of recipes for an ingredient
+             max_counter_size (int): maximum number of ingredients tracked
+             hash_features (int): number of hashed columns for the hashing \
+                trick, None to keep ingredient names
+    :return  IngredientVocabulary or HashedIngredientVocabulary
+    """
+    start = time.time()
+    vocabulary = build_vocabulary(ingredient_chunks(source, name, chunk_size),
+        min_count, max_counter_size, hash_features)
+    vocabulary.save()
+    print "recipes: %d \t vocabulary columns: %d \t %.1fs" % (
+        vocabulary.number_of_recipes, len(vocabulary), time.time() - start)
+    return vocabulary
+
+
+if __name__ == '__main__':
+
+    build_streaming_vocabulary()
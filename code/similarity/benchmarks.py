@@ -0,0 +1,250 @@
+"""
+##### Benchmarks and consistency checks for the cuisine similarity steps, run
+##### on the stored ingredient vectors in the data folder
+"""
+
+import time
+import numpy as np
+from scipy.spatial.distance import cdist
+
+from cuisine_distances import cuisine_distances, cuisine_centroids
+from cuisine_distances import distance_matrix, METRICS
+from cuisine_distances import CUISINE_COLUMN, nearest_cuisines
+from similar_cuisines import build_similar_cuisine_index, SimilarCuisineIndex
+from recipe_search import load_recipe_search, similar_cuisine_recipes
+from recipe_search import NUMBER_OF_RECIPES, NUMBER_OF_TABLES, PROBE_RADIUS
+from ingredient_vectors import IngredientVectors, RECIPES_NAME
+from storage import load_recipes
+
+
+# scipy metric names of the scikit-learn metric names
+SCIPY_METRICS = {'l1': 'cityblock', 'manhattan': 'cityblock', 'l2': 'euclidean',
+    'matching': 'hamming'}
+# metrics scipy computes on boolean (non-zero) vectors
+BOOLEAN_METRICS = ['matching', 'yule']
+# (tables, radius) settings of the recipe search recall benchmark
+SEARCH_SETTINGS = [(4, 0), (8, 0), (4, 1), (8, 1), (4, 2), (8, 2)]
+# least recall of the default search setting (all tables, default radius)
+MIN_RECALL = 0.75
+# maximum number of ingredients of a benchmark query
+QUERY_INGREDIENTS = 5
+
+
+def stored_centroids(name=RECIPES_NAME, matrix='tfidf'):
+    """
+    Get cuisine vectors of the stored ingredient vectors
+    :params  name (str): file-name of the recipe data (for the cuisines)
+             matrix (str): recipe vectors to combine, 'tfidf' or 'counts'
+    :return  sorted list of unique cuisines and numpy array of cuisine vectors
+    """
+    vectors = IngredientVectors.load()
+    cuisines = [unicode(cuisine) for cuisine in
+        load_recipes(name, [CUISINE_COLUMN])[CUISINE_COLUMN]]
+    return cuisine_centroids(getattr(vectors, matrix), cuisines)
+
+
+def check_distance_metrics(metrics=METRICS):
+    """
+    Compute the cuisine distance matrices with the blocked numpy metrics and \
+    with scipy's cdist, and check that they agree
+    :param  metrics (list): metrics, from METRICS
+    :return  list of metrics for which the two implementations disagree
+    """
+    names, centroids = stored_centroids()
+    mismatches = []
+    for metric in metrics:
+        scipy_metric = SCIPY_METRICS.get(metric, metric)
+        scipy_centroids = centroids != 0 if metric in BOOLEAN_METRICS else \
+            centroids
+        with np.errstate(divide='ignore', invalid='ignore'):
+            expected = np.nan_to_num(cdist(scipy_centroids, scipy_centroids,
+                scipy_metric))
+        if not np.allclose(distance_matrix(centroids, metric), expected,
+            atol=1e-9):
+            mismatches.append(metric)
+    print "cuisines: %d \t metrics: %d \t mismatches: %s" % (len(names),
+        len(metrics), mismatches)
+    return mismatches
+
+
+def benchmark_distance_matrices(metrics=METRICS):
+    """
+    Time computing all cuisine distance matrices from the stored ingredient \
+    vectors (without cache) against reading them from the cache, and \
+    against scipy's cdist on the same cuisine vectors
+    :param  metrics (list): metrics, from METRICS
+    :return  dictionary of timings (seconds)
+    """
+    start = time.time()
+    cuisine_distances(metrics)
+    compute_time = time.time() - start
+    start = time.time()
+    cuisine_distances(metrics)
+    cached_time = time.time() - start
+    names, centroids = stored_centroids()
+    start = time.time()
+    for metric in metrics:
+        distance_matrix(centroids, metric)
+    numpy_time = time.time() - start
+    start = time.time()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for metric in metrics:
+            cdist(centroids, centroids, SCIPY_METRICS.get(metric, metric))
+    scipy_time = time.time() - start
+    print "distances: %.3fs \t cached: %.3fs \t metrics only: numpy %.3fs, \
+scipy %.3fs" % (compute_time, cached_time, numpy_time, scipy_time)
+    return {'compute_time': compute_time, 'cached_time': cached_time,
+        'numpy_time': numpy_time, 'scipy_time': scipy_time}
+
+
+def check_similar_cuisine_index(metrics=METRICS):
+    """
+    Build the similar cuisine index and check that its ranked cuisines are \
+    the cuisines ranked from the distance matrices, for every metric
+    :param  metrics (list): metrics, from METRICS
+    :return  list of metrics for which the rankings disagree
+    """
+    build_similar_cuisine_index(metrics)
+    index = SimilarCuisineIndex()
+    distances = cuisine_distances(metrics)
+    number = len(distances.cuisines) - 1
+    mismatches = [metric for metric in metrics if nearest_cuisines(distances,
+        metric, number) != dict((cuisine, [similar_cuisine for similar_cuisine,
+        distance in index.similar_cuisines(cuisine, number, metric)])
+        for cuisine in distances.cuisines)]
+    print "similar cuisine index: \t metrics: %d \t mismatches: %s" % (
+        len(metrics), mismatches)
+    return mismatches
+
+
+def benchmark_similar_cuisine_lookup(metric='braycurtis', repeat=1000):
+    """
+    Time finding the 5 most similar cuisines of every cuisine by ranking \
+    the cached distance matrix against looking them up in the similar \
+    cuisine index (including loading the index)
+    :params  metric (str): metric to rank cuisines by
+             repeat (int): number of times every cuisine is looked up
+    :return  dictionary of timings (seconds) per lookup
+    """
+    distances = cuisine_distances([metric])
+    start = time.time()
+    for i in xrange(repeat):
+        nearest_cuisines(distances, metric)
+    ranking_time = (time.time() - start) / (repeat * len(distances.cuisines))
+    start = time.time()
+    index = SimilarCuisineIndex(metric=metric)
+    load_time = time.time() - start
+    start = time.time()
+    for i in xrange(repeat):
+        for cuisine in distances.cuisines:
+            index.similar_cuisines(cuisine)
+    lookup_time = (time.time() - start) / (repeat * len(distances.cuisines))
+    print "similar cuisines: \t ranking: %.1fus \t index lookup: %.1fus \t \
+index load: %.1fms" % (ranking_time * 1e6, lookup_time * 1e6, load_time * 1000)
+    return {'ranking_time': ranking_time, 'lookup_time': lookup_time,
+        'load_time': load_time}
+
+
+def recipe_queries(recipe_search, number_of_queries, seed=0):
+    """
+    Get benchmark queries: up to QUERY_INGREDIENTS ingredients of random \
+    recipes, with the recipe's cuisine as selected cuisine
+    :params  recipe_search (RecipeSearch): recipe search
+             number_of_queries (int): number of queries
+             seed (int): seed for the random recipes
+    :return  list of (cuisine, ingredients) tuples
+    """
+    random = np.random.RandomState(seed)
+    ingredients = recipe_search.vectors.vocabulary.ingredients
+    row_cuisines = {}
+    for cuisine, rows in recipe_search.cuisine_rows.iteritems():
+        row_cuisines.update((row, cuisine) for row in rows.tolist())
+    counts = recipe_search.vectors.counts
+    queries = []
+    while len(queries) < number_of_queries:
+        row = random.randint(counts.shape[0])
+        columns = counts.indices[counts.indptr[row]:counts.indptr[row + 1]]
+        if not len(columns):
+            continue
+        columns = random.permutation(columns)[:QUERY_INGREDIENTS]
+        queries.append((row_cuisines[row], [ingredients[column] for column in
+            columns]))
+    return queries
+
+
+def timed_searches(recipe_search, index, queries, number, repeat,
+                   **search_args):
+    """
+    Run recipe searches of queries in the 5 most similar cuisines repeat times
+    :params  recipe_search (RecipeSearch): recipe search
+             index (SimilarCuisineIndex): similar cuisines
+             queries (list): (cuisine, ingredients) tuples
+             number (int): number of recipes returned
+             repeat (int): number of times the queries are run
+             search_args: tables, radius or exact, passed to search
+    :return  list of results of each query and fastest seconds per query
+    """
+    search_times = []
+    for i in xrange(repeat):
+        start = time.time()
+        results = [similar_cuisine_recipes(recipe_search, index, cuisine,
+            ingredients, number, **search_args) for cuisine, ingredients in
+            queries]
+        search_times.append((time.time() - start) / len(queries))
+    return results, min(search_times)
+
+
+def benchmark_recipe_search(number_of_queries=200, settings=SEARCH_SETTINGS,
+                            number=NUMBER_OF_RECIPES, repeat=5):
+    """
+    Time recipe searches in the 5 most similar cuisines with the LSH index \
+    at each (tables, radius) setting against the exact search, and measure \
+    their recall: fraction of the exact nearest recipes found (recipes as \
+    near as the exact last one count, for ties)
+    :params  number_of_queries (int): number of queries
+             settings (list): (tables, radius) settings
+             number (int): number of recipes returned
+             repeat (int): number of times the queries of a setting are run \
+                (fastest run timed)
+    :return  dictionary of (recall, seconds per query) of each setting, \
+                'exact' for the exact search
+    """
+    start = time.time()
+    recipe_search = load_recipe_search()
+    bits = [cuisine_index.bits for cuisine_index in
+        recipe_search.indexes.itervalues()]
+    print "recipe search index: \t recipes: %d \t tables: %d \t bits: %d-%d \t \
+%.3fs" % (recipe_search.vectors.tfidf.shape[0], recipe_search.tables,
+        min(bits), max(bits), time.time() - start)
+    index = SimilarCuisineIndex()
+    queries = recipe_queries(recipe_search, number_of_queries)
+    exact_results, exact_time = timed_searches(recipe_search, index, queries,
+        number, repeat, exact=True)
+    print "exact search: \t %.2fms per query" % (exact_time * 1000)
+    results = {'exact': (1., exact_time)}
+    for tables, radius in settings:
+        search_results, search_time = timed_searches(recipe_search, index,
+            queries, number, repeat, tables=tables, radius=radius)
+        found = 0
+        expected = 0
+        for exact, search in zip(exact_results, search_results):
+            if exact:
+                last_distance = exact[-1][1] + 1e-6
+                found += sum(distance <= last_distance for row, distance in search)
+                expected += len(exact)
+        recall = float(found) / max(expected, 1)
+        print "lsh search: \t tables: %d \t radius: %d \t recall: %.3f \t \
+%.2fms per query" % (tables, radius, recall, search_time * 1000)
+        results[(tables, radius)] = (recall, search_time)
+    return results
+
+
+if __name__ == '__main__':
+
+    assert not check_distance_metrics()
+    benchmark_distance_matrices()
+    assert not check_similar_cuisine_index()
+    benchmark_similar_cuisine_lookup()
+    search_results = benchmark_recipe_search()
+    recall, search_time = search_results[(NUMBER_OF_TABLES, PROBE_RADIUS)]
+    assert recall >= MIN_RECALL and search_time < search_results['exact'][1]
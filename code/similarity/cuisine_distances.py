@@ -0,0 +1,398 @@
+"""
+##### Pairwise distances between cuisines: the recipe vectors of each cuisine
+##### are combined into one cuisine vector (centroid) with a single sparse
+##### matrix product, and the cuisine-by-cuisine distance matrices of all the
+##### similarity metrics are computed with blocked numpy operations. Results
+##### are cached in the data folder, keyed on the version of the data
+"""
+
+import os
+import sys
+import time
+import hashlib
+import numpy as np
+from scipy import sparse
+
+# shared storage module is in the parent code folder, ingredient vectors
+# module in the data cleaning and eda code folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+    'data_cleaning_and_eda'))
+from storage import load_recipes, save_arrays, load_arrays, arrays_path
+from ingredient_vectors import IngredientVectors, RECIPES_NAME, VECTORS_NAME
+
+
+# column holding the cuisine (group) of each recipe
+CUISINE_COLUMN = 'cuisine'
+# pairwise distance metrics of the similarity analysis (scikit-learn and
+# scipy.spatial.distance names), computed with scipy's definitions
+METRICS = ['cityblock', 'cosine', 'euclidean', 'l1', 'l2', 'manhattan',
+    'braycurtis', 'canberra', 'chebyshev', 'correlation', 'jaccard',
+    'matching', 'yule']
+# metric used for the similar cuisine recommendations
+SIMILARITY_METRIC = 'braycurtis'
+# metrics that are other names of a metric
+METRIC_ALIASES = {'l1': 'cityblock', 'manhattan': 'cityblock', 'l2': 'euclidean'}
+# maximum number of elements in the (rows, cuisines, ingredients) blocks of
+# element-wise metrics
+BLOCK_ELEMENTS = 1 << 22
+# file-name of the cached distance matrices
+DISTANCES_NAME = 'cuisine_distances'
+
+
+def cuisine_indicator(cuisines):
+    """
+    Get cuisine indicator matrix, which averages the rows of each cuisine \
+    when multiplied with a recipe matrix
+    :param  cuisines (list): cuisine of each recipe (matrix row)
+    :return  sorted list of unique cuisines and CSR matrix of shape \
+                (cuisines, recipes) with 1 / number of recipes of the cuisine \
+                in the columns of its recipes
+    """
+    names, rows = np.unique(np.asarray(cuisines, dtype=unicode),
+        return_inverse=True)
+    recipes_per_cuisine = np.bincount(rows, minlength=len(names))
+    indicator = sparse.csr_matrix((1. / recipes_per_cuisine[rows],
+        (rows, np.arange(len(rows)))), shape=(len(names), len(rows)))
+    return list(names), indicator
+
+
+def cuisine_centroids(matrix, cuisines):
+    """
+    Combine recipe vectors of each cuisine into one cuisine vector (mean of \
+    the recipe vectors), with one sparse matrix product
+    :params  matrix (CSR matrix): recipe vectors, one row per recipe
+             cuisines (list): cuisine of each recipe
+    :return  sorted list of unique cuisines and dense numpy array of cuisine \
+                vectors, one row per cuisine
+    """
+    names, indicator = cuisine_indicator(cuisines)
+    return names, (indicator * matrix).toarray().astype(np.float64)
+
+
+def blocked_distances(centroids, distance, block_elements=BLOCK_ELEMENTS):
+    """
+    Compute element-wise metric for all pairs of cuisine vectors, on blocks \
+    of rows broadcast against all vectors, so that no block is larger than \
+    block_elements
+    :params  centroids (numpy array): cuisine vectors, one row per cuisine
+             distance (function): function of two broadcast arrays of \
+                vectors giving distances reduced over the last axis
+             block_elements (int): maximum number of elements in a block
+    :return  numpy array of distances, shape (cuisines, cuisines)
+    """
+    number_of_cuisines, number_of_columns = centroids.shape
+    block_rows = max(1, block_elements // max(1, number_of_cuisines *
+        number_of_columns))
+    distances = np.empty((number_of_cuisines, number_of_cuisines))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for start in xrange(0, number_of_cuisines, block_rows):
+            distances[start:start + block_rows] = distance(
+                centroids[start:start + block_rows, None, :], centroids[None, :, :])
+    return distances
+
+
+def cityblock_distance(u, v):
+    """
+    Get cityblock (l1, manhattan) distances: sum of absolute differences
+    :params  u, v (numpy arrays): broadcast vectors, values on the last axis
+    :return  numpy array of distances
+    """
+    return np.abs(u - v).sum(axis=-1)
+
+
+def chebyshev_distance(u, v):
+    """
+    Get chebyshev distances: largest absolute difference
+    :params  u, v (numpy arrays): broadcast vectors, values on the last axis
+    :return  numpy array of distances
+    """
+    return np.abs(u - v).max(axis=-1)
+
+
+def braycurtis_distance(u, v):
+    """
+    Get bray-curtis distances: sum of absolute differences over sum of \
+    absolute sums
+    :params  u, v (numpy arrays): broadcast vectors, values on the last axis
+    :return  numpy array of distances
+    """
+    return np.abs(u - v).sum(axis=-1) / np.abs(u + v).sum(axis=-1)
+
+
+def canberra_distance(u, v):
+    """
+    Get canberra distances: sum of absolute differences over sums of \
+    absolute values, 0 / 0 terms (both values 0) count as 0
+    :params  u, v (numpy arrays): broadcast vectors, values on the last axis
+    :return  numpy array of distances
+    """
+    return np.nansum(np.abs(u - v) / (np.abs(u) + np.abs(v)), axis=-1)
+
+
+def jaccard_distance(u, v):
+    """
+    Get jaccard distances as scipy computes them for numeric vectors: \
+    fraction of the columns where either value is not 0 that have \
+    different values, 0 where all values are 0
+    :params  u, v (numpy arrays): broadcast vectors, values on the last axis
+    :return  numpy array of distances
+    """
+    nonzero = ((u != 0) | (v != 0)).sum(axis=-1)
+    unequal = (u != v).sum(axis=-1)
+    return np.where(nonzero == 0, 0., unequal / np.maximum(nonzero, 1.))
+
+
+# element-wise metrics, by metric name
+BLOCKED_METRICS = {'cityblock': cityblock_distance,
+    'chebyshev': chebyshev_distance, 'braycurtis': braycurtis_distance,
+    'canberra': canberra_distance, 'jaccard': jaccard_distance}
+
+
+def cosine_distances(centroids):
+    """
+    Get cosine distances of all pairs of vectors from their dot products
+    :param  centroids (numpy array): vectors, one row per cuisine
+    :return  numpy array of distances, shape (cuisines, cuisines)
+    """
+    products = centroids.dot(centroids.T)
+    lengths = np.sqrt(np.diag(products))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        distances = 1. - products / np.outer(lengths, lengths)
+    return np.clip(distances, 0., 2.)
+
+
+def euclidean_distances(centroids):
+    """
+    Get euclidean distances of all pairs of vectors from their dot products
+    :param  centroids (numpy array): vectors, one row per cuisine
+    :return  numpy array of distances, shape (cuisines, cuisines)
+    """
+    products = centroids.dot(centroids.T)
+    squared_lengths = np.diag(products)
+    distances = np.sqrt(np.maximum(squared_lengths[:, None] +
+        squared_lengths[None, :] - 2 * products, 0.))
+    np.fill_diagonal(distances, 0.)
+    return distances
+
+
+def correlation_distances(centroids):
+    """
+    Get correlation distances of all pairs of vectors, the cosine distances \
+    of the vectors centered on their means
+    :param  centroids (numpy array): vectors, one row per cuisine
+    :return  numpy array of distances, shape (cuisines, cuisines)
+    """
+    return cosine_distances(centroids - centroids.mean(axis=1)[:, None])
+
+
+def boolean_counts(centroids):
+    """
+    Get number of columns where both, only the first, only the second and \
+    none of each pair of vectors are not 0, from products of the boolean \
+    (non-zero) vectors
+    :param  centroids (numpy array): vectors, one row per cuisine
+    :return  tuple of numpy arrays (true-true, true-false, false-true, \
+                false-false counts), each of shape (cuisines, cuisines)
+    """
+    present = (centroids != 0).astype(np.float64)
+    both = present.dot(present.T)
+    present_counts = present.sum(axis=1)
+    first_only = present_counts[:, None] - both
+    second_only = present_counts[None, :] - both
+    neither = centroids.shape[1] - both - first_only - second_only
+    return both, first_only, second_only, neither
+
+
+def matching_distances(centroids):
+    """
+    Get matching (hamming on boolean vectors) distances of all pairs of \
+    vectors: fraction of columns where exactly one vector is not 0
+    :param  centroids (numpy array): vectors, one row per cuisine
+    :return  numpy array of distances, shape (cuisines, cuisines)
+    """
+    both, first_only, second_only, neither = boolean_counts(centroids)
+    return (first_only + second_only) / max(centroids.shape[1], 1)
+
+
+def yule_distances(centroids):
+    """
+    Get yule dissimilarities of all pairs of boolean (non-zero) vectors, 0 \
+    where undefined (0 / 0)
+    :param  centroids (numpy array): vectors, one row per cuisine
+    :return  numpy array of distances, shape (cuisines, cuisines)
+    """
+    both, first_only, second_only, neither = boolean_counts(centroids)
+    unequal = 2. * first_only * second_only
+    denominator = both * neither + first_only * second_only
+    return np.where(denominator == 0, 0., unequal / np.maximum(denominator, 1.))
+
+
+# metrics computed from products of the vectors, by metric name
+PRODUCT_METRICS = {'cosine': cosine_distances, 'euclidean': euclidean_distances,
+    'correlation': correlation_distances, 'matching': matching_distances,
+    'yule': yule_distances}
+
+
+def distance_matrix(centroids, metric, block_elements=BLOCK_ELEMENTS):
+    """
+    Get distances of all pairs of cuisine vectors for metric
+    :params  centroids (numpy array): cuisine vectors, one row per cuisine
+             metric (str): one of METRICS
+             block_elements (int): maximum number of elements in a block of \
+                element-wise metrics
+    :return  numpy array of distances, shape (cuisines, cuisines)
+    """
+    if metric not in METRICS:
+        raise ValueError("metric must be one of %s, not %r" % (METRICS, metric))
+    metric = METRIC_ALIASES.get(metric, metric)
+    if metric in PRODUCT_METRICS:
+        return PRODUCT_METRICS[metric](centroids)
+    return blocked_distances(centroids, BLOCKED_METRICS[metric], block_elements)
+
+
+def distance_version(vectors_version, cuisines, matrix):
+    """
+    Get version of the data the distances are computed from
+    :params  vectors_version (str): data version of the ingredient vectors
+             cuisines (list): cuisine of each recipe
+             matrix (str): recipe vectors used, 'tfidf' or 'counts'
+    :return  sha1 hex digest of vectors version, cuisines and matrix name
+    """
+    version_hash = hashlib.sha1('%s\x1e%s\x1e' % (vectors_version, matrix))
+    version_hash.update(u'\x1f'.join(cuisines).encode('utf-8'))
+    return version_hash.hexdigest()
+
+
+class CuisineDistances(object):
+    """
+    Distance matrices between cuisines, by metric, with the version of the \
+    data they are computed from
+    """
+
+    def __init__(self, cuisines, distances, version):
+        """
+        :params  cuisines (list): cuisine names, in row (and column) order
+                 distances (dictionary): (metric, distance matrix) pairs
+                 version (str): version of the data
+        """
+        self.cuisines = list(cuisines)
+        self.distances = distances
+        self.version = version
+
+    def save(self, name=DISTANCES_NAME):
+        """
+        Write distance matrices in .npz file in data folder
+        :param  name (str): file-name to save distances with
+        :return  none
+        """
+        arrays = dict(('distances_' + metric, distances) for metric, distances
+            in self.distances.iteritems())
+        arrays['cuisines'] = np.array(self.cuisines, dtype=unicode)
+        arrays['version'] = np.array(self.version)
+        save_arrays(arrays, name)
+
+    @classmethod
+    def load(cls, name=DISTANCES_NAME):
+        """
+        Load distance matrices from .npz file in data folder
+        :param  name (str): file-name to load distances from
+        :return  CuisineDistances, or None if there is no file
+        """
+        if not os.path.exists(arrays_path(name)):
+            return None
+        arrays = load_arrays(name, mmap=False)
+        distances = dict((key[len('distances_'):], value) for key, value in
+            arrays.iteritems() if key.startswith('distances_'))
+        return cls(map(unicode, arrays['cuisines']), distances,
+            str(arrays['version']))
+
+
+def vectors_and_cuisines(name=RECIPES_NAME, vectors_name=VECTORS_NAME):
+    """
+    Load stored ingredient vectors and the cuisine of each recipe (vector row)
+    :params  name (str): file-name of the recipe data (for the cuisines)
+             vectors_name (str): file-name of the ingredient vectors
+    :return  IngredientVectors and list of cuisines
+    """
+    vectors = IngredientVectors.load(vectors_name)
+    cuisines = [unicode(cuisine) for cuisine in
+        load_recipes(name, [CUISINE_COLUMN])[CUISINE_COLUMN]]
+    if len(cuisines) != vectors.counts.shape[0]:
+        raise ValueError("%d recipes in %s, %d in %s, rebuild ingredient vectors"
+            % (len(cuisines), name, vectors.counts.shape[0], vectors_name))
+    return vectors, cuisines
+
+
+def current_distance_version(matrix='tfidf', name=RECIPES_NAME,
+                             vectors_name=VECTORS_NAME):
+    """
+    Get version of the current data for distances, to tell if stored \
+    results computed from the distances are out of date
+    :params  matrix (str): recipe vectors to combine, 'tfidf' or 'counts'
+             name (str): file-name of the recipe data (for the cuisines)
+             vectors_name (str): file-name of the ingredient vectors
+    :return  version of the data (see distance_version)
+    """
+    vectors, cuisines = vectors_and_cuisines(name, vectors_name)
+    return distance_version(vectors.data_version, cuisines, matrix)
+
+
+def cuisine_distances(metrics=METRICS, matrix='tfidf', name=RECIPES_NAME,
+                      vectors_name=VECTORS_NAME, distances_name=DISTANCES_NAME,
+                      use_cache=True):
+    """
+    Get distance matrices between cuisines for metrics, from the cache in \
+    data folder if it holds them for the current data version, else \
+    computed from the stored ingredient vectors (and added to the cache)
+    :params  metrics (list): metrics, from METRICS
+             matrix (str): recipe vectors to combine, 'tfidf' or 'counts'
+             name (str): file-name of the recipe data (for the cuisines)
+             vectors_name (str): file-name of the ingredient vectors
+             distances_name (str): file-name of the cached distances
+             use_cache (bool): read and update the cache
+    :return  CuisineDistances with the distance matrices of metrics
+    """
+    vectors, cuisines = vectors_and_cuisines(name, vectors_name)
+    version = distance_version(vectors.data_version, cuisines, matrix)
+    cached = CuisineDistances.load(distances_name) if use_cache else None
+    if cached is None or cached.version != version:
+        cached = CuisineDistances(sorted(set(cuisines)), {}, version)
+    missing_metrics = [metric for metric in metrics if metric not in
+        cached.distances]
+    if missing_metrics:
+        names, centroids = cuisine_centroids(getattr(vectors, matrix), cuisines)
+        for metric in missing_metrics:
+            cached.distances[metric] = distance_matrix(centroids, metric)
+        if use_cache:
+            cached.save(distances_name)
+    return CuisineDistances(cached.cuisines, dict((metric,
+        cached.distances[metric]) for metric in metrics), version)
+
+
+def nearest_cuisines(distances, metric=SIMILARITY_METRIC, number=5):
+    """
+    Get the nearest other cuisines of each cuisine for metric
+    :params  distances (CuisineDistances): distance matrices between cuisines
+             metric (str): metric to rank cuisines by
+             number (int): number of nearest cuisines
+    :return  dictionary of (cuisine, list of nearest cuisines) pairs
+    """
+    matrix = distances.distances[metric]
+    nearest = {}
+    for row, cuisine in enumerate(distances.cuisines):
+        order = [column for column in np.argsort(matrix[row], kind='mergesort')
+            if column != row]
+        nearest[cuisine] = [distances.cuisines[column] for column in
+            order[:number]]
+    return nearest
+
+
+if __name__ == '__main__':
+
+    start = time.time()
+    distances = cuisine_distances()
+    print "cuisines: %d \t metrics: %d \t %.3fs" % (len(distances.cuisines),
+        len(distances.distances), time.time() - start)
+    for cuisine, similar_cuisines in sorted(nearest_cuisines(distances).iteritems()):
+        print "%s: \t %s" % (cuisine, ", ".join(similar_cuisines))
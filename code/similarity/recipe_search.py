@@ -0,0 +1,321 @@
+"""
+##### Approximate nearest-neighbor search of recipes for a set of ingredients:
+##### the TF-IDF vectors of the recipes of each cuisine are indexed with random
+##### projection locality-sensitive hashing (LSH, cosine), and a query only
+##### compares the recipes sharing a hash bucket with it, in the cuisines
+##### searched (the similar cuisines of the selected cuisine)
+"""
+
+import os
+import sys
+from itertools import combinations
+import numpy as np
+
+from cuisine_distances import CUISINE_COLUMN
+from similar_cuisines import NUMBER_OF_SIMILAR_CUISINES
+
+# shared storage module is in the parent code folder, ingredient vectors
+# module in the data cleaning and eda code folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+    'data_cleaning_and_eda'))
+from storage import load_recipes
+from ingredient_vectors import IngredientVectors, tfidf_matrix, RECIPES_NAME
+
+
+# number of hash tables, each with its own random projections
+NUMBER_OF_TABLES = 8
+# target number of recipes per hash bucket, the tables of a cuisine get log2 of
+# its number of recipes over it bits (fewer recipes per bucket: more bits,
+# fewer recipes compared and lower recall)
+TARGET_BUCKET_SIZE = 8
+# number of random projections of each table, the most bits a cuisine uses
+# (each cuisine uses the first projections of each table)
+MAX_BITS_PER_TABLE = 16
+# hamming radius of the buckets probed around the query bucket in each table
+# (0 probes the query bucket only, 1 also the buckets one bit away, ...)
+PROBE_RADIUS = 1
+# seed for the random projections
+PROJECTION_SEED = 1
+# number of recipes returned for a query
+NUMBER_OF_RECIPES = 20
+
+
+def random_projections(number_of_columns, tables=NUMBER_OF_TABLES,
+                       bits=MAX_BITS_PER_TABLE, seed=PROJECTION_SEED):
+    """
+    Get random projections (gaussian hyperplane normals) for all tables
+    :params  number_of_columns (int): number of vector columns (ingredients)
+             tables (int): number of hash tables
+             bits (int): number of projections in each table
+             seed (int): seed for the projections
+    :return  numpy array of shape (columns, tables * bits)
+    """
+    return np.random.RandomState(seed).standard_normal((number_of_columns,
+        tables * bits)).astype(np.float32)
+
+
+def cuisine_bits(number_of_recipes, bucket_size=TARGET_BUCKET_SIZE,
+                 max_bits=MAX_BITS_PER_TABLE):
+    """
+    Get number of bits of the tables of a cuisine, so its buckets hold about \
+    bucket_size recipes
+    :params  number_of_recipes (int): number of recipes of the cuisine
+             bucket_size (int): target number of recipes per bucket
+             max_bits (int): number of projections in each table
+    :return  number of bits, between 0 (one bucket) and max_bits
+    """
+    if number_of_recipes <= bucket_size:
+        return 0
+    return min(max_bits, int(np.ceil(np.log2(float(number_of_recipes) /
+        bucket_size))))
+
+
+def projection_signs(vectors, projections, tables):
+    """
+    Get signs of the projections of vectors
+    :params  vectors (CSR matrix): vectors, one row per recipe (or query)
+             projections (numpy array): random projections of all tables
+             tables (int): number of tables
+    :return  boolean numpy array, shape (vectors, tables, projections per table)
+    """
+    return (np.asarray(vectors * projections) > 0).reshape(vectors.shape[0],
+        tables, -1)
+
+
+def hash_codes(signs, bits):
+    """
+    Get hash code of vectors in each table, the signs of the first bits \
+    projections of the table as the bits of one integer
+    :params  signs (numpy array): signs of the projections of the vectors
+             bits (int): number of bits of each code
+    :return  numpy array of codes, shape (tables, vectors)
+    """
+    return (signs[:, :, :bits] * (1 << np.arange(bits, dtype=np.int64)))\
+        .sum(axis=2).T
+
+
+def segment_positions(starts, lengths):
+    """
+    Get positions of all items of consecutive segments of an array
+    :params  starts (numpy array): start position of each segment
+             lengths (numpy array): number of items of each segment
+    :return  numpy array of positions, segment by segment
+    """
+    ends = np.cumsum(lengths)
+    if not len(ends):
+        return ends
+    return np.arange(ends[-1]) + np.repeat(starts - ends + lengths, lengths)
+
+
+def row_products(matrix, rows, vector):
+    """
+    Get dot products of rows of a CSR matrix with a dense vector, from the \
+    CSR arrays directly (no sliced matrix is built)
+    :params  matrix (CSR matrix): matrix
+             rows (numpy array): positions of rows
+             vector (numpy array): dense vector, one value per column
+    :return  numpy array of dot products, one per row
+    """
+    starts = matrix.indptr[rows]
+    lengths = matrix.indptr[rows + 1] - starts
+    positions = segment_positions(starts, lengths)
+    return np.bincount(np.repeat(np.arange(len(rows)), lengths),
+        matrix.data[positions] * vector[matrix.indices[positions]], len(rows))
+
+
+def probe_masks(bits, radius=PROBE_RADIUS):
+    """
+    Get bit masks of the buckets within hamming radius of a bucket
+    :params  bits (int): number of bits in each code
+             radius (int): hamming radius
+    :return  numpy array of masks, 0 (the bucket itself) first
+    """
+    masks = [0]
+    for number_of_flips in xrange(1, radius + 1):
+        masks.extend(sum(1 << bit for bit in flipped_bits) for flipped_bits in
+            combinations(xrange(bits), number_of_flips))
+    return np.array(masks, dtype=np.int64)
+
+
+class CuisineLSHIndex(object):
+    """
+    LSH buckets of the recipes of one cuisine: the recipes sorted by table \
+    and hash code (one key per table and recipe), with the start of each \
+    bucket, so the recipes of the probed buckets of all tables are found \
+    without a search
+    """
+
+    def __init__(self, rows, codes, bits):
+        """
+        :params  rows (numpy array): positions of the cuisine's recipes in \
+                    the recipe vectors
+                 codes (numpy array): hash codes of the recipes, shape \
+                    (tables, recipes)
+                 bits (int): number of bits of each code
+        """
+        self.rows = rows
+        self.bits = bits
+        keys = (codes + (np.arange(len(codes), dtype=np.int64) << bits)[:, None])\
+            .ravel()
+        order = np.argsort(keys, kind='mergesort')
+        # start of each bucket (table and code) in the sorted keys, and end of
+        # the last one
+        self.bucket_starts = np.concatenate([[0], np.cumsum(np.bincount(keys,
+            minlength=len(codes) << bits))]).astype(np.int32)
+        # recipe (position in rows) of each sorted key
+        self.recipes = (order % len(rows)).astype(np.int32)
+        # probe masks of each radius searched
+        self.masks = {}
+
+    def candidates(self, query_signs, radius, tables):
+        """
+        Get recipes sharing a probed bucket with the query in any table
+        :params  query_signs (numpy array): signs of the projections of query
+                 radius (int): hamming radius of the probed buckets
+                 tables (int): number of tables probed
+        :return  numpy array of positions of candidate recipes in the vectors
+        """
+        if radius not in self.masks:
+            self.masks[radius] = probe_masks(self.bits, radius)
+        query_codes = hash_codes(query_signs, self.bits)[:tables, 0]
+        probed_keys = ((query_codes[:, None] ^ self.masks[radius]) + (np.arange(
+            tables, dtype=np.int64) << self.bits)[:, None]).ravel()
+        starts = self.bucket_starts[probed_keys]
+        lengths = self.bucket_starts[probed_keys + 1] - starts
+        # positions of the sorted keys in all probed buckets
+        positions = segment_positions(starts, lengths)
+        candidates = np.zeros(len(self.rows), dtype=bool)
+        candidates[self.recipes[positions]] = True
+        return self.rows[candidates]
+
+
+class RecipeSearch(object):
+    """
+    Search of the recipes closest (cosine distance of TF-IDF vectors) to a \
+    set of ingredients, in a group of cuisines, with one LSH index per \
+    cuisine. The tables of a cuisine have enough bits for about bucket_size \
+    recipes per bucket, so the number of recipes compared does not grow \
+    with the cuisines. Probing fewer tables or a smaller radius is faster \
+    and finds fewer of the exact nearest recipes (lower recall)
+    """
+
+    def __init__(self, vectors, cuisines, tables=NUMBER_OF_TABLES,
+                 bucket_size=TARGET_BUCKET_SIZE, max_bits=MAX_BITS_PER_TABLE,
+                 seed=PROJECTION_SEED):
+        """
+        :params  vectors (IngredientVectors): ingredient vectors of all recipes
+                 cuisines (list): cuisine of each recipe (vector row)
+                 tables (int): number of hash tables
+                 bucket_size (int): target number of recipes per bucket
+                 max_bits (int): number of projections in each table
+                 seed (int): seed for the projections
+        """
+        self.vectors = vectors
+        self.idf = vectors.vocabulary.idf()
+        self.tables = tables
+        self.projections = random_projections(len(vectors.vocabulary), tables,
+            max_bits, seed)
+        cuisines = np.asarray(cuisines, dtype=unicode)
+        self.cuisine_rows = {}
+        self.indexes = {}
+        for cuisine in np.unique(cuisines):
+            rows = np.flatnonzero(cuisines == cuisine).astype(np.int32)
+            bits = cuisine_bits(len(rows), bucket_size, max_bits)
+            self.cuisine_rows[unicode(cuisine)] = rows
+            self.indexes[unicode(cuisine)] = CuisineLSHIndex(rows, hash_codes(
+                projection_signs(vectors.tfidf[rows], self.projections, tables),
+                bits), bits)
+
+    def query_vector(self, ingredients):
+        """
+        Get TF-IDF vector of a set of ingredients, ingredients not in the \
+        vocabulary are left out
+        :param  ingredients (list): ingredient names
+        :return  CSR matrix with one row
+        """
+        return tfidf_matrix(self.vectors.vocabulary.count_matrix([ingredients]),
+            self.idf)
+
+    def nearest_recipes(self, query, rows, number):
+        """
+        Rank recipes by cosine distance to query vector
+        :params  query (CSR matrix): query vector (unit length)
+                 rows (numpy array): positions of recipes to rank
+                 number (int): number of recipes returned
+        :return  list of (recipe position, distance) tuples, nearest first
+        """
+        query_vector = np.zeros(query.shape[1])
+        query_vector[query.indices] = query.data
+        distances = 1. - row_products(self.vectors.tfidf, rows, query_vector)
+        if len(rows) > number:
+            nearest = np.argpartition(distances, number - 1)[:number]
+        else:
+            nearest = np.arange(len(rows))
+        nearest = nearest[np.lexsort((rows[nearest], distances[nearest]))]
+        return zip(rows[nearest].tolist(), distances[nearest].tolist())
+
+    def search(self, ingredients, cuisines, number=NUMBER_OF_RECIPES,
+               tables=None, radius=PROBE_RADIUS, exact=False):
+        """
+        Get recipes of cuisines nearest to a set of ingredients
+        :params  ingredients (list): ingredient names
+                 cuisines (list): cuisines searched
+                 number (int): number of recipes returned
+                 tables (int): number of tables probed (at most the number \
+                    of tables built), None for all tables
+                 radius (int): hamming radius of the probed buckets
+                 exact (bool): compare all recipes of the cuisines instead
+        :return  list of (recipe position, distance) tuples, nearest first, \
+                    empty if no ingredient is in the vocabulary
+        """
+        if tables is not None and not 1 <= tables <= self.tables:
+            raise ValueError("tables must be between 1 and %d: %r" % (self.tables,
+                tables))
+        query = self.query_vector(ingredients)
+        # a query without known ingredients is at the same distance of all recipes
+        if not query.nnz:
+            return []
+        if exact:
+            rows = np.concatenate([self.cuisine_rows[cuisine] for cuisine in
+                cuisines])
+        else:
+            query_signs = projection_signs(query, self.projections, self.tables)
+            rows = np.concatenate([self.indexes[cuisine].candidates(query_signs,
+                radius, tables or self.tables) for cuisine in cuisines])
+        if not len(rows):
+            return []
+        return self.nearest_recipes(query, rows, number)
+
+
+def load_recipe_search(name=RECIPES_NAME, tables=NUMBER_OF_TABLES,
+                       bucket_size=TARGET_BUCKET_SIZE):
+    """
+    Build recipe search from the stored ingredient vectors and the cuisines \
+    of the recipe data
+    :params  name (str): file-name of the recipe data (for the cuisines)
+             tables (int): number of hash tables
+             bucket_size (int): target number of recipes per bucket
+    :return  RecipeSearch
+    """
+    return RecipeSearch(IngredientVectors.load(), [unicode(cuisine) for cuisine
+        in load_recipes(name, [CUISINE_COLUMN])[CUISINE_COLUMN]], tables,
+        bucket_size)
+
+
+def similar_cuisine_recipes(recipe_search, similar_cuisine_index, cuisine,
+                            ingredients, number=NUMBER_OF_RECIPES, **search_args):
+    """
+    Get recipes of the most similar cuisines of cuisine nearest to a set of \
+    ingredients
+    :params  recipe_search (RecipeSearch): recipe search
+             similar_cuisine_index (SimilarCuisineIndex): similar cuisines
+             cuisine (str): selected cuisine
+             ingredients (list): ingredient names
+             number (int): number of recipes returned
+             search_args: tables, radius or exact, passed to search
+    :return  list of (recipe position, distance) tuples, nearest first
+    """
+    cuisines = [similar_cuisine for similar_cuisine, distance in
+        similar_cuisine_index.similar_cuisines(cuisine, NUMBER_OF_SIMILAR_CUISINES)]
+    return recipe_search.search(ingredients, cuisines, number, **search_args)
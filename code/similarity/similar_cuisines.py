@@ -0,0 +1,134 @@
+"""
+##### Precomputed similar cuisine index for the recommendations: for each
+##### metric and cuisine, the other cuisines ranked by distance, stored in one
+##### compact .npz file that is memory-mapped when the app starts, so finding
+##### the similar cuisines of a cuisine is an array lookup under any metric
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+from cuisine_distances import cuisine_distances, current_distance_version
+from cuisine_distances import METRICS, SIMILARITY_METRIC
+
+# shared storage module is in the parent code folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from storage import save_arrays, load_arrays
+
+
+# file-name of the similar cuisine index
+INDEX_NAME = 'similar_cuisine_index'
+# number of similar cuisines returned for a cuisine
+NUMBER_OF_SIMILAR_CUISINES = 5
+
+
+def ranked_neighbors(distances, number_of_neighbors=None):
+    """
+    Rank the other cuisines of each cuisine by distance, ties in cuisine order
+    :params  distances (numpy array): distance matrix, shape (cuisines, cuisines)
+             number_of_neighbors (int): number of neighbors kept for each \
+                cuisine, None for all other cuisines
+    :return  numpy arrays of neighbor positions (int16) and distances \
+                (float32), shape (cuisines, number of neighbors)
+    """
+    number_of_cuisines = len(distances)
+    if number_of_neighbors is None:
+        number_of_neighbors = number_of_cuisines - 1
+    # undefined distances (nan) are ranked last
+    order = np.argsort(np.where(np.isnan(distances), np.inf, distances), axis=1,
+        kind='mergesort')
+    # each cuisine is left out of its own neighbors
+    order = order[order != np.arange(number_of_cuisines)[:, None]].reshape(
+        number_of_cuisines, number_of_cuisines - 1)
+    neighbors = order[:, :number_of_neighbors]
+    return neighbors.astype(np.int16), np.take_along_axis(distances, neighbors,
+        axis=1).astype(np.float32)
+
+
+def build_similar_cuisine_index(metrics=METRICS, number_of_neighbors=None,
+                                name=INDEX_NAME):
+    """
+    Build similar cuisine index from the cuisine distance matrices of all \
+    metrics, and store it in data folder
+    :params  metrics (list): metrics, from METRICS
+             number_of_neighbors (int): number of neighbors kept for each \
+                cuisine, None for all other cuisines
+             name (str): file-name to save index with
+    :return  none
+    """
+    start = time.time()
+    distances = cuisine_distances(metrics)
+    neighbors, neighbor_distances = zip(*[ranked_neighbors(
+        distances.distances[metric], number_of_neighbors) for metric in metrics])
+    save_arrays({'cuisines': np.array(distances.cuisines, dtype=unicode),
+        'metrics': np.array(metrics, dtype=unicode),
+        'neighbors': np.array(neighbors), 'distances': np.array(neighbor_distances),
+        'version': np.array(distances.version)}, name)
+    print "similar cuisine index: \t cuisines: %d \t metrics: %d \t %.3fs" % (
+        len(distances.cuisines), len(metrics), time.time() - start)
+
+
+class SimilarCuisineIndex(object):
+    """
+    Similar cuisines of each cuisine under each metric, memory-mapped from \
+    the stored index, with the metric used by default (switched without \
+    recomputing anything). An index built from other data than the current \
+    ingredient vectors and cuisines is refused
+    """
+
+    def __init__(self, name=INDEX_NAME, metric=SIMILARITY_METRIC,
+                 check_version=True):
+        """
+        :params  name (str): file-name of the stored index
+                 metric (str): metric used by default
+                 check_version (bool): raise ValueError if the index is out \
+                    of date with the current data
+        """
+        arrays = load_arrays(name)
+        self.cuisines = [unicode(cuisine) for cuisine in arrays['cuisines']]
+        self.cuisine_rows = dict((cuisine, row) for row, cuisine in
+            enumerate(self.cuisines))
+        self.metric_rows = dict((unicode(metric_name), row) for row, metric_name
+            in enumerate(arrays['metrics']))
+        # plain array views of the memory-mapped arrays, for fast indexing
+        self.neighbors = np.asarray(arrays['neighbors'])
+        self.distances = np.asarray(arrays['distances'])
+        self.version = str(arrays['version'])
+        if check_version and self.version != current_distance_version():
+            raise ValueError("%s is out of date with the ingredient vectors and "
+                "cuisines, rebuild it: python similar_cuisines.py" % name)
+        self.metric = None
+        self.set_metric(metric)
+
+    def set_metric(self, metric):
+        """
+        Set metric used by default
+        :param  metric (str): metric in the index
+        :return  none
+        """
+        if metric not in self.metric_rows:
+            raise ValueError("metric must be one of %s, not %r" %
+                (sorted(self.metric_rows), metric))
+        self.metric = metric
+
+    def similar_cuisines(self, cuisine, number=NUMBER_OF_SIMILAR_CUISINES,
+                         metric=None):
+        """
+        Get most similar other cuisines of cuisine
+        :params  cuisine (str): cuisine name
+                 number (int): number of similar cuisines
+                 metric (str): metric in the index, None for the default metric
+        :return  list of (cuisine, distance) tuples, most similar first
+        """
+        position = (self.metric_rows[metric or self.metric],
+            self.cuisine_rows[cuisine], slice(number))
+        return [(self.cuisines[neighbor], distance) for neighbor, distance in
+            zip(self.neighbors[position].tolist(),
+            self.distances[position].tolist())]
+
+
+if __name__ == '__main__':
+
+    build_similar_cuisine_index()
@@ -0,0 +1,557 @@
+"""
+##### Shared storage for the recipe data in the data folder. Recipe dataframes
+##### are stored as columnar Parquet files, with dictionary columns (recipe
+##### details) flattened into one column per key and lists as list columns,
+##### dataframes read from a database are written one chunk (row group) at a
+##### time, other objects (states, caches) are stored in pickle files, and numeric
+##### arrays (feature matrices) in uncompressed .npz files memory-mapped on load.
+##### Run as a script to migrate pickled recipe dataframes to Parquet files:
+#####     python storage.py [file-name ...]
+"""
+
+import os
+import sys
+import json
+import pickle
+import struct
+import zipfile
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# data folder, relative to the code folders the scripts are run from
+DATA_FOLDER = '../../data/'
+# separator between dictionary column name and key in flattened column names
+NESTED_SEPARATOR = '.'
+# key of the flattened column holding the keys present in each dictionary
+KEYS_COLUMN = '__keys__'
+# schema metadata key for the flattened and json encoded column names
+STORAGE_METADATA_KEY = 'recipes_storage'
+# number of rows in each Parquet row group, the unit read by iter_recipes
+ROW_GROUP_SIZE = 10000
+# name of the stored dataframe index column in Parquet files
+INDEX_COLUMN = '__index_level_0__'
+
+
+def save_obj(obj, name):
+    """
+    Dump object in pickel file in data folder
+    :params  obj (object): object to be saved (can be in any form)
+             name (str): file-name to save object with
+    """
+    with open(DATA_FOLDER + name + '.pkl', 'wb') as f:
+        pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+
+
+def load_obj(name):
+    """
+    Load object from pickel file in data folder
+    :param  name (str): file-name to load object from
+    :return  object in original format
+    """
+    with open(DATA_FOLDER + name + '.pkl', 'rb') as f:
+        return pickle.load(f)
+
+
+def recipes_path(name):
+    """
+    Get path of Parquet file for recipe dataframe in data folder
+    :param  name (str): file-name of recipe dataframe
+    :return  path of Parquet file
+    """
+    return DATA_FOLDER + name + '.parquet'
+
+
+def is_missing(value):
+    """
+    Check if value is missing (None or NaN)
+    :param  value (object): dataframe value
+    :return  boolean, true if value is None or NaN, else false
+    """
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def is_native_column(values):
+    """
+    Check if values of object column can be stored as a native Parquet column, \
+    that is if all present values are strings, or all are lists of strings, \
+    or all are numbers
+    :param  values (iterable): column values
+    :return  boolean, true if column can be stored natively, else false
+    """
+    kinds = set()
+    for value in values:
+        if is_missing(value):
+            continue
+        if isinstance(value, basestring):
+            kinds.add('string')
+        elif isinstance(value, list) and all(isinstance(item, basestring)
+            for item in value):
+            kinds.add('list')
+        elif isinstance(value, (int, long, float)) and not isinstance(value, bool):
+            kinds.add('number')
+        else:
+            return False
+    return len(kinds) <= 1
+
+
+def is_dictionary_column(values):
+    """
+    Check if all present values of object column are dictionaries
+    :param  values (iterable): column values
+    :return  boolean, true if column holds dictionaries, else false
+    """
+    present_values = [value for value in values if not is_missing(value)]
+    return bool(present_values) and all(isinstance(value, dict)
+        for value in present_values)
+
+
+def add_flat_column(flat_data, column, values, json_columns):
+    """
+    Add column to flattened dataframe, encoding values in json if they can \
+    not be stored natively
+    :params  flat_data (dataframe): flattened dataframe
+             column (str): column name
+             values (list or series): column values
+             json_columns (list): names of json encoded columns, appended to
+    :return  none
+    """
+    if getattr(values, 'dtype', object) == object and not is_native_column(values):
+        values = [None if is_missing(value) else json.dumps(value)
+            for value in values]
+        json_columns.append(column)
+    if isinstance(values, list):
+        # object dtype, so that ints with missing values are not cast to floats
+        values = pd.Series(values, index=flat_data.index, dtype=object)
+    flat_data[column] = values.values
+
+
+def flatten_recipes(recipes_data):
+    """
+    Flatten dictionary columns of recipe dataframe into one column per key, \
+    plus a column with the keys present in each dictionary
+    :param  recipes_data (dataframe): recipe dataframe
+    :return  flattened dataframe, names of flattened dictionary columns and \
+                names of json encoded columns
+    """
+    flat_data = pd.DataFrame(index=recipes_data.index)
+    nested_columns, json_columns = [], []
+    for column in recipes_data.columns:
+        values = recipes_data[column]
+        if values.dtype != object or not is_dictionary_column(values):
+            add_flat_column(flat_data, column, values, json_columns)
+            continue
+        nested_columns.append(column)
+        dictionaries = [None if is_missing(value) else value for value in values]
+        flat_data[column + NESTED_SEPARATOR + KEYS_COLUMN] = [None
+            if dictionary is None else sorted(dictionary) for dictionary in dictionaries]
+        for key in sorted(set(key for dictionary in dictionaries if dictionary
+            for key in dictionary)):
+            add_flat_column(flat_data, column + NESTED_SEPARATOR + key,
+                [None if dictionary is None else dictionary.get(key)
+                for dictionary in dictionaries], json_columns)
+    return flat_data, nested_columns, json_columns
+
+
+def save_recipes(recipes_data, name):
+    """
+    Write recipe dataframe in Parquet file in data folder
+    :params  recipes_data (dataframe): recipe dataframe to be saved
+             name (str): file-name to save dataframe with
+    :return  none
+    """
+    flat_data, nested_columns, json_columns = flatten_recipes(recipes_data)
+    table = pa.Table.from_pandas(flat_data, preserve_index=True)
+    metadata = dict(table.schema.metadata or {})
+    metadata[STORAGE_METADATA_KEY] = json.dumps({'nested_columns': nested_columns,
+        'json_columns': json_columns})
+    pq.write_table(table.replace_schema_metadata(metadata), recipes_path(name),
+        row_group_size=ROW_GROUP_SIZE)
+
+
+def merged_type(first_type, second_type):
+    """
+    Get Parquet column type holding the values of two chunks of a column
+    :params  first_type (pyarrow type): column type in one chunk
+             second_type (pyarrow type): column type in another chunk
+    :return  pyarrow type, None if the values must be json encoded
+    """
+    if first_type.equals(second_type) or pa.types.is_null(second_type):
+        return first_type
+    if pa.types.is_null(first_type):
+        return second_type
+    if pa.types.is_list(first_type) and pa.types.is_list(second_type):
+        value_type = merged_type(first_type.value_type, second_type.value_type)
+        return None if value_type is None else pa.list_(value_type)
+    if all(pa.types.is_integer(column_type) or pa.types.is_floating(column_type)
+        for column_type in (first_type, second_type)):
+        return pa.float64()
+    return None
+
+
+def chunks_layout(chunks):
+    """
+    Get flattened columns, their types and the flattened dictionary and json \
+    encoded columns for a recipe dataframe given in chunks of rows, so all \
+    chunks are written with one schema: a column flattened or stored \
+    natively in some chunks but not in others is json encoded
+    :param  chunks (iterable): recipe dataframes, chunks of rows
+    :return  list of (flattened column name, pyarrow type) pairs (without \
+                the index column), names of flattened dictionary columns and \
+                names of json encoded columns
+    """
+    column_types, nested_columns = OrderedDict(), []
+    json_columns, plain_columns = set(), set()
+    for chunk in chunks:
+        flat_data, chunk_nested_columns, chunk_json_columns = \
+            flatten_recipes(chunk)
+        nested_columns.extend(column for column in chunk_nested_columns if
+            column not in nested_columns)
+        json_columns.update(chunk_json_columns)
+        for field in pa.Table.from_pandas(flat_data, preserve_index=False).schema:
+            if field.name in chunk.columns and not pa.types.is_null(field.type):
+                plain_columns.add(field.name)
+            if field.name not in column_types:
+                column_types[field.name] = field.type
+                continue
+            field_type = merged_type(column_types[field.name], field.type)
+            if field_type is None:
+                json_columns.add(field.name)
+            else:
+                column_types[field.name] = field_type
+    # dictionary columns with other values in some chunks are json encoded whole
+    for column in [column for column in nested_columns if column in plain_columns]:
+        nested_columns.remove(column)
+        json_columns.add(column)
+        for flat_column in [flat_column for flat_column in column_types if
+            flat_column.startswith(column + NESTED_SEPARATOR)]:
+            del column_types[flat_column]
+            json_columns.discard(flat_column)
+    # dictionary columns missing in all rows of some chunks are not stored as is
+    for column in nested_columns:
+        column_types.pop(column, None)
+    columns = [(column, pa.string() if column in json_columns else column_type)
+        for column, column_type in column_types.iteritems()]
+    return columns, nested_columns, sorted(json_columns)
+
+
+def flatten_chunk(chunk, start, columns, nested_columns, json_columns):
+    """
+    Flatten chunk of rows of recipe dataframe into the flattened columns of \
+    the whole dataframe, as found by chunks_layout
+    :params  chunk (dataframe): recipe dataframe, chunk of rows
+             start (int): position of the chunk's first row in the dataframe
+             columns (list): flattened column names
+             nested_columns (list): names of flattened dictionary columns
+             json_columns (list): names of json encoded columns
+    :return  flattened dataframe, indexed by row position in the dataframe
+    """
+    flat_data = pd.DataFrame(index=pd.RangeIndex(start, start + len(chunk)))
+    for column in columns:
+        nested_column, key = (column.split(NESTED_SEPARATOR, 1) + [None])[:2]
+        if key is not None and nested_column in nested_columns:
+            dictionaries = [value if isinstance(value, dict) else None for value
+                in chunk[nested_column]] if nested_column in chunk.columns \
+                else [None] * len(chunk)
+            values = [None if dictionary is None else (sorted(dictionary)
+                if key == KEYS_COLUMN else dictionary.get(key)) for dictionary
+                in dictionaries]
+        elif column in chunk.columns:
+            values = chunk[column].tolist()
+        else:
+            values = [None] * len(chunk)
+        values = [None if is_missing(value) else value for value in values]
+        if column in json_columns:
+            values = [None if value is None else json.dumps(value)
+                for value in values]
+        # object dtype, so that ints with missing values are not cast to floats
+        flat_data[column] = pd.Series(values, index=flat_data.index, dtype=object)
+    return flat_data
+
+
+def save_recipe_chunks(get_chunks, name, row_group_size=ROW_GROUP_SIZE):
+    """
+    Write recipe dataframe given in chunks of rows in Parquet file in data \
+    folder one chunk at a time, so only one chunk is in memory (e.g. reading \
+    recipes from a database cursor). The chunks are read twice, once to find \
+    the flattened columns of all chunks, once to write them
+    :params  get_chunks (function): function without arguments that returns \
+                a new iterator of recipe dataframes, chunks of rows in order
+             name (str): file-name to save dataframe with
+             row_group_size (int): maximum number of rows in each row group
+    :return  number of rows written
+    """
+    columns, nested_columns, json_columns = chunks_layout(get_chunks())
+    if not columns:
+        save_recipes(pd.DataFrame(), name)
+        return 0
+    schema = pa.schema([pa.field(column, column_type) for column, column_type
+        in columns] + [pa.field(INDEX_COLUMN, pa.int64())])
+    writer, metadata, number_of_rows = None, None, 0
+    try:
+        for chunk in get_chunks():
+            flat_data = flatten_chunk(chunk, number_of_rows, [column for column,
+                column_type in columns], nested_columns, json_columns)
+            table = pa.Table.from_pandas(flat_data, schema=schema,
+                preserve_index=True)
+            if writer is None:
+                metadata = dict(table.schema.metadata or {})
+                metadata[STORAGE_METADATA_KEY] = json.dumps({'nested_columns':
+                    nested_columns, 'json_columns': json_columns})
+                writer = pq.ParquetWriter(recipes_path(name),
+                    table.schema.with_metadata(metadata))
+            writer.write_table(table.replace_schema_metadata(metadata),
+                row_group_size=row_group_size)
+            number_of_rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return number_of_rows
+
+
+def storage_metadata(schema):
+    """
+    Get names of flattened dictionary columns and json encoded columns from \
+    Parquet schema
+    :param  schema (pyarrow schema): schema of recipe Parquet file
+    :return  dictionary with nested_columns and json_columns lists
+    """
+    return json.loads((schema.metadata or {}).get(STORAGE_METADATA_KEY,
+        '{"nested_columns": [], "json_columns": []}'))
+
+
+def project_pickled_recipes(recipes_data, columns):
+    """
+    Select columns from pickled recipe dataframe, where a column named \
+    'column.key' selects key from dictionary column
+    :params  recipes_data (dataframe): recipe dataframe
+             columns (list): column names to select
+    :return  pandas dataframe with selected columns
+    """
+    projected_data = pd.DataFrame(index=recipes_data.index)
+    for column in columns:
+        if column in recipes_data.columns:
+            projected_data[column] = recipes_data[column]
+            continue
+        nested_column, key = column.split(NESTED_SEPARATOR, 1)
+        projected_data[column] = recipes_data[nested_column].map(lambda x:
+            x.get(key) if isinstance(x, dict) else None)
+    return projected_data
+
+
+def unflattened_columns(flat_columns, nested_columns):
+    """
+    Get original column names, in order, from flattened column names
+    :params  flat_columns (iterable): flattened column names
+             nested_columns (set): names of flattened dictionary columns
+    :return  list of original column names
+    """
+    columns = []
+    for column in flat_columns:
+        nested_column = column.split(NESTED_SEPARATOR, 1)[0]
+        if NESTED_SEPARATOR in column and nested_column in nested_columns:
+            column = nested_column
+        if column not in columns:
+            columns.append(column)
+    return columns
+
+
+def parquet_columns(schema, columns, nested_columns):
+    """
+    Get flattened Parquet columns to read for recipe dataframe columns
+    :params  schema (pyarrow schema): schema of recipe Parquet file
+             columns (list): column names to read, None to read all columns
+             nested_columns (set): names of flattened dictionary columns
+    :return  list of Parquet column names, None to read all columns
+    """
+    if columns is None:
+        return None
+    read_columns = []
+    for column in columns:
+        if column in nested_columns:
+            read_columns.extend(field for field in schema.names if
+                field.startswith(column + NESTED_SEPARATOR))
+        else:
+            read_columns.append(column)
+    return read_columns
+
+
+def recipes_from_table(table, metadata, columns=None):
+    """
+    Get recipe dataframe in original format from Parquet table, decoding \
+    list and json encoded columns and rebuilding dictionary columns
+    :params  table (pyarrow table): table read from recipe Parquet file
+             metadata (dictionary): storage metadata of the Parquet file
+             columns (list): column names to return, None for all columns
+    :return  pandas dataframe in original format
+    """
+    nested_columns = set(metadata['nested_columns'])
+    # ints with missing values are read as ints and None, not floats and NaN
+    flat_data = table.to_pandas(integer_object_nulls=True)
+    for field in table.schema:
+        if field.name not in flat_data.columns:
+            continue
+        if pa.types.is_list(field.type):
+            flat_data[field.name] = [None if value is None else list(value)
+                for value in flat_data[field.name]]
+        elif field.name in metadata['json_columns']:
+            flat_data[field.name] = [None if value is None else json.loads(value)
+                for value in flat_data[field.name]]
+    recipes_data = pd.DataFrame(index=flat_data.index)
+    for column in (columns if columns is not None else
+        unflattened_columns(flat_data.columns, nested_columns)):
+        if column not in nested_columns:
+            recipes_data[column] = flat_data[column]
+            continue
+        prefix = column + NESTED_SEPARATOR
+        keys_per_row = flat_data[prefix + KEYS_COLUMN]
+        # dictionary values as python values, missing values as None
+        key_values = dict((key, [None if is_missing(value) else value for value
+            in flat_data[field].tolist()]) for key, field in ((field[len(prefix):],
+            field) for field in flat_data.columns if field.startswith(prefix)))
+        recipes_data[column] = [None if keys is None else
+            dict((key, key_values[key][row]) for key in keys)
+            for row, keys in enumerate(keys_per_row)]
+    return recipes_data
+
+
+def load_recipes(name, columns=None):
+    """
+    Load recipe dataframe from Parquet file in data folder, memory-mapping \
+    the file and reading only the requested columns. A column named \
+    'column.key' reads a single key of dictionary column (e.g. \
+    'recipes_details.ingredient list'). Falls back to the pickle file for \
+    dataframes not yet migrated
+    :params  name (str): file-name to load dataframe from
+             columns (list): column names to read, None to read all columns
+    :return  pandas dataframe in original format
+    """
+    path = recipes_path(name)
+    if not os.path.exists(path):
+        recipes_data = load_obj(name)
+        if columns is None:
+            return recipes_data
+        return project_pickled_recipes(recipes_data, columns)
+    schema = pq.read_schema(path)
+    metadata = storage_metadata(schema)
+    table = pq.read_table(path, columns=parquet_columns(schema, columns,
+        set(metadata['nested_columns'])), memory_map=True,
+        use_pandas_metadata=True)
+    return recipes_from_table(table, metadata, columns)
+
+
+def iter_recipes(name, columns=None, chunk_size=ROW_GROUP_SIZE):
+    """
+    Load recipe dataframe in chunks of rows, reading one Parquet row group \
+    at a time, so only one row group is in memory. Dataframes not yet \
+    migrated are loaded whole from the pickle file and split in chunks
+    :params  name (str): file-name to load dataframe from
+             columns (list): column names to read, None to read all columns
+             chunk_size (int): maximum number of rows in each chunk
+    :return  generator of pandas dataframes in original format, in row order
+    """
+    path = recipes_path(name)
+    if not os.path.exists(path):
+        recipes_data = load_recipes(name, columns)
+        for start in xrange(0, len(recipes_data), chunk_size):
+            yield recipes_data.iloc[start:start + chunk_size]
+        return
+    schema = pq.read_schema(path)
+    metadata = storage_metadata(schema)
+    read_columns = parquet_columns(schema, columns,
+        set(metadata['nested_columns']))
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    for row_group in xrange(parquet_file.num_row_groups):
+        recipes_data = recipes_from_table(parquet_file.read_row_group(row_group,
+            columns=read_columns, use_pandas_metadata=True), metadata, columns)
+        for start in xrange(0, len(recipes_data), chunk_size):
+            yield recipes_data.iloc[start:start + chunk_size]
+
+
+def arrays_path(name):
+    """
+    Get path of .npz file for numpy arrays in data folder
+    :param  name (str): file-name of arrays
+    :return  path of .npz file
+    """
+    return DATA_FOLDER + name + '.npz'
+
+
+def save_arrays(arrays, name):
+    """
+    Write numpy arrays in uncompressed .npz file in data folder, each array \
+    is a .npy file stored as is in the zip file, so it can be memory-mapped
+    :params  arrays (dictionary): (array name, numpy array) pairs, without \
+                object arrays
+             name (str): file-name to save arrays with
+    :return  none
+    """
+    np.savez(arrays_path(name), **arrays)
+
+
+def load_arrays(name, mmap=True):
+    """
+    Load numpy arrays from .npz file in data folder, memory-mapping each \
+    array in place in the file (read-only) instead of reading it into memory
+    :params  name (str): file-name to load arrays from
+             mmap (bool): memory-map arrays, else read them into memory
+    :return  dictionary of (array name, numpy array) pairs
+    """
+    path = arrays_path(name)
+    if not mmap:
+        npz_file = np.load(path)
+        try:
+            return dict((key, npz_file[key]) for key in npz_file.files)
+        finally:
+            npz_file.close()
+    arrays = {}
+    with open(path, 'rb') as f:
+        for member in zipfile.ZipFile(f).infolist():
+            if member.compress_type != zipfile.ZIP_STORED:
+                raise ValueError("compressed array can not be memory-mapped: %s"
+                    % member.filename)
+            # array data follows the zip local file header and the .npy header
+            f.seek(member.header_offset)
+            local_header = f.read(zipfile.sizeFileHeader)
+            name_length, extra_length = struct.unpack('<HH', local_header[-4:])
+            array_start = f.tell() + name_length + extra_length
+            f.seek(array_start)
+            version = np.lib.format.read_magic(f)
+            shape, fortran_order, dtype = getattr(np.lib.format,
+                'read_array_header_%d_%d' % version)(f)
+            key = member.filename[:-len('.npy')]
+            if not shape or not np.prod(shape):
+                # scalars and empty arrays are read, as empty maps are not allowed
+                f.seek(array_start)
+                arrays[key] = np.lib.format.read_array(f)
+                continue
+            arrays[key] = np.memmap(path, dtype=dtype, mode='r', shape=shape,
+                order='F' if fortran_order else 'C', offset=f.tell())
+    return arrays
+
+
+def migrate_pickles(names=None):
+    """
+    Write Parquet files for pickled recipe dataframes in data folder. Pickle \
+    files are left in place and stay readable
+    :param  names (list): file-names to migrate, None for all pickle files \
+                holding a dataframe
+    :return  none
+    """
+    if names is None:
+        names = sorted(file_name[:-len('.pkl')] for file_name in
+            os.listdir(DATA_FOLDER) if file_name.endswith('.pkl'))
+    for name in names:
+        recipes_data = load_obj(name)
+        if not isinstance(recipes_data, pd.DataFrame):
+            continue
+        save_recipes(recipes_data, name)
+        print "migrated: %s \t rows: %d" % (name, len(recipes_data))
+
+
+if __name__ == '__main__':
+
+    migrate_pickles(sys.argv[1:] or None)
@@ -1,16 +1,18 @@
 """
 ##### Web scrape BBC Food website for recipes by cuisine
-##### store recipe details for all cuisines in MongoDB and a pickle file
+##### store recipe details for all cuisines in MongoDB and a Parquet file
 """
 
-from time import sleep
-import requests
 from bs4 import BeautifulSoup
 import re
 from math import ceil
-import pandas as pd
 from pymongo import MongoClient
-import pickle
+from fetch import http_client
+from pipeline import RecipePipeline
+from link_index import RecipeLinkIndex
+from writer import RecipeWriter
+from response_cache import SEARCH_PAGE, RECIPE_PAGE
+from recipe_parser import RecipeParser, has_class
 
 
 # sleep time between web requests (in seconds)
@@ -24,6 +26,28 @@ RECIPE_URL = 'http://www.bbc.co.uk{}'
 # number of recipes per page for search results
 NUMBER_OF_RECIPES_PER_PAGE = 15.
 
+# recipe fields on recipe pages, as field specs for the recipe parser
+RECIPE_FIELDS = {
+    'recipe title': {'path': '//h1[%s]' % has_class('fn'), 'schema': 'name',
+        'required': True},
+    'chef': {'path': '//span[%s]' % has_class('author')},
+    'description': {'path': '//span[%s]' % has_class('summary')},
+    'ingredient list': {'path': '//p[%s]' % has_class('ingredient'), 'many': True,
+        'schema': ['recipeIngredient', 'ingredients']},
+    'preperation steps': {'path': '//li[%s]' % has_class('instruction'),
+        'many': True, 'strip': True, 'schema': 'recipeInstructions'},
+    'prep_time': {'path': '//span[%s]' % has_class('prepTime')},
+    'cook_time': {'path': '//span[%s]' % has_class('cookTime')},
+    'servings': {'path': '//h3[%s]' % has_class('yield')},
+    'recommendations': {'path': '//h2[%s]' % has_class('description')},
+    'image_source': {'path': '//img[@id="food-image"]/@src'},
+}
+# parser for recipe pages
+page_parser = RecipeParser(RECIPE_FIELDS)
+# name of this module, imported by the parser processes to parse recipe
+# pages (__name__ is '__main__' when the scraper is run as a script)
+SCRAPER_NAME = 'bbc_food'
+
 
 # create MongoDB database and collection
 DB_NAME = 'PROJECT_RECIPIES'
@@ -33,40 +57,21 @@ COLLECTION_NAME = 'BBC'
 client = MongoClient()
 db = client[DB_NAME]
 coll = db[COLLECTION_NAME]
+# writer of recipe documents to the collection
+recipe_writer = RecipeWriter(coll)
 
 
-def save_obj(obj, name):
-    """
-    Dump object in pickel file in data folder
-    :params  obj (object): object to be saved (can be in any form)
-             name (str): file-name to save object with
-    """
-    with open('../../data/' + name + '.pkl', 'wb') as f:
-        pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
-
-
-def load_obj(name):
-    """
-    Load object from pickel file in data folder
-    :param  name (str): file-name to load object from
-    :return  object in original format
-    """
-    with open('../../data/' + name + '.pkl', 'rb') as f:
-        return pickle.load(f)
-
-
-def get_content_from_url(link):
+def get_content_from_url(link, page_type=RECIPE_PAGE):
     """
     Make web request and collect webpage content
-    :param  link (str): web page link
+    :params  link (str): web page link
+             page_type (str): SEARCH_PAGE or RECIPE_PAGE, for how long the \
+                cached page is used
     :return  html content for web page
     """
-    # sleep time before making web request
-    (SCRAPING_REQUEST_STAGGER)
-    response = requests.get(link)
-    if response.status_code != 200:
-        return False
-    return response.content
+    # shared http client waits for the host's request rate limit and caches
+    # responses
+    return http_client.get_content(link, SCRAPING_REQUEST_STAGGER, page_type)
 
 
 def get_number_of_recipes(cuisine):
@@ -76,7 +81,7 @@ def get_number_of_recipes(cuisine):
     :return  number of recipes (int) or None if no content for url
     """
     cuisine_link = URL + cuisine
-    cuisine_recipes = get_content_from_url(cuisine_link)
+    cuisine_recipes = get_content_from_url(cuisine_link, SEARCH_PAGE)
     if not cuisine_recipes:
         print "no content for:", cuisine_link
         return None
@@ -94,7 +99,7 @@ def get_cuisine_pages(cuisine, page):
     :return  list of recipe links for search page url or None (if no content)
     """
     link = CUISINE_URL.format(str(page), cuisine)
-    cuisine_recipe_links = get_content_from_url(link)
+    cuisine_recipe_links = get_content_from_url(link, SEARCH_PAGE)
     if not cuisine_recipe_links:
         print "no content for:", link
         return None
@@ -106,8 +111,7 @@ def get_recipe(r_link):
     """
     Make web request to recipe page and get the recipe content
     :param  r_link (str): recipe link
-    :return  html content for web page in beautifulsoup format
-                    or None (if no content)
+    :return  html content for web page or None (if no content)
     """
     recipe_link = RECIPE_URL.format(r_link)
     recipe_response = get_content_from_url(recipe_link)
@@ -115,174 +119,62 @@ def get_recipe(r_link):
     if not recipe_response:
         print "no content for: ", recipe_link
         return None
-    # else, return webpage content in beautifulsoup format
-    return BeautifulSoup(recipe_response)
-
-
-def get_recipe_title(soup_recipe):
-    """
-    Get recipe title from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe title
-    """
-    return soup_recipe.find("h1", {"class": "fn"}).get_text()
-
-
-def get_recipe_chef(soup_recipe):
-    """
-    Get recipe chef name from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe chef name or None for no content
-    """
-    chef_name = soup_recipe.find("span", {"class": "author"})
-    if not chef_name:
-        return None
-    return chef_name.get_text()
-
-
-def get_description(soup_recipe):
-    """
-    Get recipe description from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe description / summary
-    """
-    description = soup_recipe.find("span", {"class": "summary"})
-    if not description:
-        return None
-    return description.get_text()
-
-
-def get_recipe_ingredients(soup_recipe):
-    """
-    Get recipe ingredients from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe ingredient list
-    """
-    ingredients_list = soup_recipe.find_all("p", {"class": "ingredient"})
-    ingredients = []
-    for ing in ingredients_list:
-        ingredients.append(ing.get_text())
-    return ingredients
-
-
-def get_recipe_preperation(soup_recipe):
-    """
-    Get recipe preperation steps from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe preperation steps as a list
-    """
-    prep_steps = soup_recipe.find_all("li", {"class": "instruction"})
-    prep = []
-    for step in prep_steps:
-        prep.append(step.get_text().strip())
-    return prep
-
-
-def get_recipe_time(soup_recipe):
-    """
-    Get recipe prep and cooking times from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe preperation time and recipe cooking time
-                or None if content not available
-    """
-    prep_time = soup_recipe.find("span", {"class": "prepTime"})
-    if prep_time:
-        prep_time = prep_time.get_text()
-    else:
-        prep_time = None
-    cooking_time = soup_recipe.find("span", {"class": "cookTime"})
-    if cooking_time:
-        cooking_time = cooking_time.get_text()
-    else:
-        cooking_time = None
-    return prep_time, cooking_time
-
-
-def get_servings(soup_recipe):
-    """
-    Get recipe servings/yield from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe servings/yield or None if content not available
-    """
-    servings = soup_recipe.find("h3", {"class": "yield"})
-    if not servings:
-        return None
-    return servings.get_text()
-
-
-def get_recommendations(soup_recipe):
-    """
-    Get recipe recommendation score from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe recommendation score or None if content not available
-    """
-    recommendations = soup_recipe.find("h2", {"class": "description"})
-    if not recommendations:
-        return None
-    return recommendations.get_text()
+    return recipe_response
 
 
-def get_image_source(soup_recipe):
+def parse_recipe(r_link, recipe_content):
     """
-    Get recipe image source from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe image source or None if content not available
+    Get necessary recipe details from recipe page, parsed once for all \
+    fields in RECIPE_FIELDS
+    :params  r_link (str): recipe link
+             recipe_content (str): html content for recipe page
+    :return  recipe details in dictionary format
     """
-    image_source = soup_recipe.find("img", {"id": "food-image"})
-    if not image_source:
-        return None
-    return image_source["src"]
+    recipe = page_parser.parse(recipe_content)
+    recipe['r_link'] = r_link
+    return recipe
 
 
-def get_recipe_details(recipe_links):
+def get_recipe_details(link_index):
     """
-    Get necessary recipe details from all recipe links and store in dictionary
-    with (key, value) pairs as (recipe title, corresponding details dictionary)
-    :param  recipe_links (list): recipe links for each cuisine
-    :return  recipe details in dictionary format
+    Get necessary recipe details for each unique recipe link, fetching each \
+    recipe page once, and write each recipe to MongoDB as soon as it is \
+    parsed, once for every cuisine it was found under. Pages are fetched, \
+    parsed (in parser processes) and written in a pipeline of stages
+    recipe links are tracked in the crawl frontier, recipes already scraped \
+    are taken from the frontier and failed recipe pages are skipped
+    :param  link_index (RecipeLinkIndex): unique recipe links with the cuisine \
+                fields of the cuisines they were found under
+    :return  number of recipe documents written
     """
-    cuisine_recipes = {}
-    for r in recipe_links:
-        recipe = {}
-        recipe['r_link'] = r.a["href"]
-        print "recipe link: ", recipe['r_link']
-        soup_recipe = get_recipe(recipe['r_link'])
-        recipe['recipe title'] = get_recipe_title(soup_recipe)
-        recipe['chef'] = get_recipe_chef(soup_recipe)
-        recipe['description'] = get_description(soup_recipe)
-        recipe['ingredient list'] = get_recipe_ingredients(soup_recipe)
-        recipe['preperation steps'] = get_recipe_preperation(soup_recipe)
-        recipe['prep_time'], recipe['cook_time'] = get_recipe_time(soup_recipe)
-        recipe['servings'] = get_servings(soup_recipe)
-        recipe['recommendations'] = get_recommendations(soup_recipe)
-        recipe['image_source'] = get_image_source(soup_recipe)
-        cuisine_recipes[recipe['recipe title']] = recipe
-    return cuisine_recipes
+    recipe_pipeline = RecipePipeline(COLLECTION_NAME, SCRAPER_NAME, get_recipe,
+        recipe_writer)
+    return recipe_pipeline.run(link_index.items())
 
 
 def get_recipe_links(cuisine, pages):
     """
-    Get recipe details from cuisine search pages
+    Get recipe links from cuisine search pages
     :params  cuisine (str): cuisine name
              pages (int): number of search result pages for cuisine
-    :return  recipe details in dictionary format
+    :return  list of recipe links
     """
     recipe_links = []
     for page in xrange(1, pages + 1):
-        sleep(SCRAPING_REQUEST_STAGGER)
-        recipe_links.extend(get_cuisine_pages(cuisine, page))
-    cuisine_recipes = get_recipe_details(recipe_links)
-    return cuisine_recipes
+        recipe_links.extend(get_cuisine_pages(cuisine, page) or [])
+    return [r.a["href"] for r in recipe_links]
 
 
 def get_cuisine_recipes(cuisines):
     """
-    Get recipe details for cuisines, store in mongoDB,
-    and convert details dictionary into pandas dataframe
+    Get recipe details for cuisines, store in mongoDB one document per recipe,
+    and write the recipe documents to the Parquet file in chunks
+    recipe links of all cuisines are collected first, so each recipe page is \
+    fetched once, even if the recipe is listed under several cuisines
     :param  cuisines (list): cuisines in BBC Food
-    :return  recipe details in pandas dataframe
+    :return  number of recipes saved
     """
-    cuisine_df = pd.DataFrame()
+    link_index = RecipeLinkIndex(RECIPE_URL.format(''))
     for cuisine in cuisines:
         cuisine_dict = {}
         cuisine_dict['cuisine'] = cuisine
@@ -294,19 +186,27 @@ def get_cuisine_recipes(cuisines):
         print '#####'
         print "Cuisine: %s \t Number of recipes: %d \t\t Number of pages: %d" \
             % (cuisine, cuisine_dict['num_recipes'], cuisine_dict['pages'])
-        cuisine_dict['recipes_details'] = get_recipe_links(cuisine_no_space,
-            cuisine_dict['pages'])
-        coll.insert_one(cuisine_dict)
-        cuisine_df = cuisine_df.append(pd.DataFrame.from_dict(cuisine_dict,
-            orient='columns'), ignore_index=True)
-    return cuisine_df
+        link_index.add(get_recipe_links(cuisine_no_space, cuisine_dict['pages']),
+            cuisine_dict)
+    print "Unique recipes: %d" % len(link_index)
+    get_recipe_details(link_index)
+    return recipe_writer.save_recipes('BBC Food', "recipes_data_bbc_food")
 
 
-if __name__ == '__main__':
+def main():
+    """
+    Scrape recipes for all cuisines and store them in MongoDB and Parquet file
+    :param  none
+    :return  none
+    """
     # list of cuisines on BBC Food
-    cuisines = ['African', 'American', 'British', 'Caribbean', 'Chinese', , 'French',
+    cuisines = ['African', 'American', 'British', 'Caribbean', 'Chinese', 'French',
     'Greek', 'Indian', 'Irish', 'Italian', 'Japanese', 'Mexican', 'Nordic',
     'North African', 'Portuguese', 'South American', 'Spanish', 'Thai and South-east Asian',
     'Turkish and Middle Eastern']
-    cuisine_dataframe = get_cuisine_recipes(cuisines)
-    save_obj(cuisine_dataframe, "recipes_data_bbc_food")
+    get_cuisine_recipes(cuisines)
+
+
+if __name__ == '__main__':
+
+    main()
@@ -1,19 +1,19 @@
 """
 ##### Web scrape BBC Good Food website for recipes by cuisine
 ##### using both static and dynamic webscraping techniques
-##### store recipe details for all cuisines in MongoDB and a pickle file
+##### store recipe details for all cuisines in MongoDB and a Parquet file
 """
 
-from time import sleep
-import time
 from math import ceil
-import requests
 from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.support.ui import WebDriverWait
-import pandas as pd
 from pymongo import MongoClient
-import pickle
+from fetch import rate_limiter, http_client
+from pipeline import RecipePipeline
+from link_index import RecipeLinkIndex
+from writer import RecipeWriter
+from response_cache import SEARCH_PAGE, RECIPE_PAGE
+from recipe_parser import RecipeParser, has_class
+from browser_pool import browser_pool
 
 
 # sleep time between web requests (in seconds)
@@ -26,6 +26,50 @@ COLLECTION_URL = 'http://www.bbcgoodfood.com/recipes/collection/{}'
 RECIPE_URL = 'http://www.bbcgoodfood.com{}'
 # number of recipes per page for search results
 NUMBER_OF_RECIPES_PER_SEARCH_PAGE = 15.
+# css selector of recipe titles, present once search results are loaded
+SEARCH_RESULT_SELECTOR = 'h2.node-title'
+
+# recipe fields on recipe pages, as field specs for the recipe parser
+RECIPE_FIELDS = {
+    'recipe title': {'path': '//h1[@itemprop="name"]', 'schema': 'name',
+        'required': True},
+    # if chef name is not given for the recipe, submitter name is the chef name
+    'chef': {'path': ['(//div[@class="recipe-header__chef '
+        'recipe-header__chef--first"])[1]//a', '(//div[@class="recipe-header__chef '
+        'recipe-header__chef--first"])[1]//span']},
+    'description': {'path': '((//div[@itemprop="description"])[1]//div[%s])[1]//div'
+        % has_class('field-items')},
+    'ingredient list': {'path': '//li[@itemprop="ingredients"]', 'many': True,
+        'post': lambda x: x.split('\n')[0],
+        'schema': ['recipeIngredient', 'ingredients']},
+    'preperation steps': {'path': '//li[@itemprop="recipeInstructions"]',
+        'many': True, 'strip': True, 'schema': 'recipeInstructions'},
+    # times are given as "Prep: time" and "Cook: time"
+    'prep_time': {'path': '//span[%s]' % has_class('recipe-details__cooking-time-prep'),
+        'post': lambda x: x.split(":")[1].strip()},
+    'cook_time': {'path': '//span[%s]' % has_class('recipe-details__cooking-time-cook'),
+        'post': lambda x: x.split(":")[1].strip()},
+    'servings': {'path': '//span[@itemprop="recipeYield"]', 'strip': True,
+        'schema': 'recipeYield'},
+    'skill_level': {'path': '(//section[@class="recipe-details__item '
+        'recipe-details__item--skill-level"])[1]//span[%s]'
+        % has_class('recipe-details__text'), 'strip': True},
+    'rating': {'path': '//meta[@itemprop="ratingValue"]/@content',
+        'schema': 'aggregateRating.ratingValue'},
+    'rating count': {'path': '//meta[@itemprop="ratingCount"]/@content',
+        'schema': 'aggregateRating.ratingCount'},
+    # dictionary of (nutrition name, value) pairs, without missing values
+    'nutritional_info': {'path': '//span[%s]' % has_class('nutrition__value'),
+        'many': True, 'value': lambda x: (x.get('itemprop'), unicode(x.text_content())),
+        'combine': lambda x: dict(pair for pair in x if pair[1] != u'-'),
+        'default': None},
+    'image_source': {'path': '//img[@itemprop="image"]/@src'},
+}
+# parser for recipe pages
+page_parser = RecipeParser(RECIPE_FIELDS)
+# name of this module, imported by the parser processes to parse recipe
+# pages (__name__ is '__main__' when the scraper is run as a script)
+SCRAPER_NAME = 'bbc_good_food'
 
 
 # create MongoDB database and collection
@@ -36,66 +80,34 @@ COLLECTION_NAME = 'BBC_GOOD_FOOD'
 client = MongoClient()
 db = client[DB_NAME]
 coll = db[COLLECTION_NAME]
+# writer of recipe documents to the collection
+recipe_writer = RecipeWriter(coll)
 
 
-def save_obj(obj, name):
-    """
-    Dump object in pickel file in data folder
-    :params  obj (object): object to be saved (can be in any form)
-             name (str): file-name to save object with
-    """
-    with open('../../data/' + name + '.pkl', 'wb') as f:
-        pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
-
-
-def load_obj(name):
-    """
-    Load object from pickel file in data folder
-    :param  name (str): file-name to load object from
-    :return  object in original format
-    """
-    with open('../../data/' + name + '.pkl', 'rb') as f:
-        return pickle.load(f)
-
-
-def get_content_from_static_url(link):
+def get_content_from_static_url(link, page_type=RECIPE_PAGE):
     """
     Make web request to static url and collect webpage content
-    :param  link (str): web page link
+    :params  link (str): web page link
+             page_type (str): SEARCH_PAGE or RECIPE_PAGE, for how long the \
+                cached page is used
     :return  html content for web page
     """
-    # sleep time before making web request
-    sleep(SCRAPING_REQUEST_STAGGER)
-    # header details for web request
-    headers = {"User-agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, \
-        like Gecko) Chrome/47.0.2526.80 Safari/537.36"}
-    response = requests.get(link, headers=headers)
-    if response.status_code != 200:
-        return False
-    return response.content
+    # shared http client sends the user agent header, waits for the host's
+    # request rate limit and caches responses
+    return http_client.get_content(link, SCRAPING_REQUEST_STAGGER, page_type)
 
 
 def get_content_from_dynamic_url(link):
     """
-    Make web request to dynamic webpage url and collect webpage content.
-    Required content loads in about 10 seconds, as a buffer set the page load timeout \
-    to 25 seconds. If the page load timeout exception is raised, return content of page \
-    (this will include required content since that loads in about 10 seconds)
+    Make web request to dynamic webpage url and collect webpage content, \
+    once the search results (recipe titles) are loaded, using a browser \
+    from the shared browser pool
     :param  link (str): web page link
     :return  html content for web page
     """
-    # make web request using Selenium chrome browser driver
-    browser = webdriver.Chrome("/Applications/chromedriver")
-    browser.set_page_load_timeout(25)
-    try:
-        browser.get(link)
-    except:
-        page_source = browser.page_source
-        browser.quit()
-        return page_source
-    page_source = browser.page_source
-    browser.quit()
-    return page_source
+    # wait for the host's request rate limit before making web request
+    rate_limiter.wait(link, SCRAPING_REQUEST_STAGGER)
+    return browser_pool.get_page_source(link, SEARCH_RESULT_SELECTOR)
 
 
 def get_number_of_search_recipes(cuisine):
@@ -137,7 +149,7 @@ def get_cuisine_collection_page(cuisine):
     :return  list of recipe links for colelction first page url or None (if no content)
     """
     cuisine_link = COLLECTION_URL.format(cuisine)
-    cuisine_recipes = get_content_from_static_url(cuisine_link)
+    cuisine_recipes = get_content_from_static_url(cuisine_link, SEARCH_PAGE)
     if not cuisine_recipes:
         print "no content for:", cuisine_link
         return None
@@ -149,229 +161,76 @@ def get_recipe(r_link):
     """
     Make web request to recipe page and get the recipe content
     :param  r_link (str): recipe link
-    :return  html content for the web page in beautifulsoup format
-                    or None (if no content)
+    :return  html content for web page or None (if no content)
     """
     recipe_link = RECIPE_URL.format(r_link)
     recipe_response = get_content_from_static_url(recipe_link)
     if not recipe_response:
         print "no content for: ", recipe_link
         return None
-    return BeautifulSoup(recipe_response)
-
-
-def get_recipe_title(soup_recipe):
-    """
-    Get recipe title from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe title
-    """
-    return soup_recipe.find("h1", {"itemprop": "name"}).get_text()
-
-
-def get_recipe_chef(soup_recipe):
-    """
-    Get recipe chef name from recipe content.
-    If chef name is not given for the recipe, get submitter name as the chef name
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe chef name or None for no content
-    """
-    chef_name = soup_recipe.find("div",
-        {"class": "recipe-header__chef recipe-header__chef--first"}).find("a")
-    if not chef_name:
-        chef_name = soup_recipe.find("div",
-            {"class": "recipe-header__chef recipe-header__chef--first"}).find("span")
-    if not chef_name:
-        return None
-    return chef_name.get_text()
-
-
-def get_description(soup_recipe):
-    """
-    Get recipe description from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe description / summary
-    """
-    description = soup_recipe.find("div", {"itemprop": "description"}).find("div",
-        {"class": "field-items"}).find("div")
-    if not description:
-        return None
-    return description.get_text()
-
-
-def get_recipe_ingredients(soup_recipe):
-    """
-    Get recipe ingredients from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe ingredient list
-    """
-    ingredients_list = soup_recipe.find_all("li", {"itemprop": "ingredients"})
-    ingredients = []
-    for ing in ingredients_list:
-        ingredients.append(ing.get_text().split('\n')[0])
-    return ingredients
-
-
-def get_recipe_preperation(soup_recipe):
-    """
-    Get recipe preperation steps from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe preperation steps as a list
-    """
-    prep_steps = soup_recipe.find_all("li", {"itemprop": "recipeInstructions"})
-    prep = []
-    for step in prep_steps:
-        prep.append(step.get_text().strip())
-    return prep
-
-
-def get_recipe_time(soup_recipe):
-    """
-    Get recipe prep and cooking times from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe preperation time and recipe cooking time
-                or None if content not available
-    """
-    prep_time_check = soup_recipe.find("span", {"class": "recipe-details__cooking-time-prep"})
-    prep_time, cooking_time = None, None
-    if prep_time_check:
-        prep_time = prep_time_check.get_text().split(":")[1].strip()
-    cooking_time_check = soup_recipe.find("span", {"class": "recipe-details__cooking-time-cook"})
-    if cooking_time_check:
-        cooking_time = cooking_time_check.get_text().split(":")[1].strip()
-    return prep_time, cooking_time
-
-
-def get_servings(soup_recipe):
-    """
-    Get recipe servings/yield from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe servings/yield or None if content not available
-    """
-    servings = soup_recipe.find("span", {"itemprop": "recipeYield"})
-    if not servings:
-        return None
-    return servings.get_text().strip()
+    return recipe_response
 
 
-def get_skill_level(soup_recipe):
-    """
-    Get recipe skill level from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe skill level or None if content not available
-    """
-    skill_level = soup_recipe.find("section",
-        {"class": "recipe-details__item recipe-details__item--skill-level"}).find("span",
-        {"class": "recipe-details__text"})
-    if not skill_level:
-        return None
-    return skill_level.get_text().strip()
-
-
-def get_recommendations(soup_recipe):
-    """
-    Get recipe recommendation score and number of recommendations from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe recommendation score and number of recommendations \
-                or None if content not available
-    """
-    ratings = soup_recipe.find("meta", {"itemprop": "ratingValue"})["content"]
-    ratings_count = soup_recipe.find("meta", {"itemprop": "ratingCount"})["content"]
-    if ratings == 0:
-        return None, None
-    return ratings, ratings_count
-
-
-def get_nutrition_per_serving(soup_recipe):
-    """
-    Get nutritional values per serving for recipe from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  dictionary of (nutrition name, value) as (key, value) pairs \
-                or None if content not available
+def parse_recipe(r_link, recipe_content):
     """
-    nutritional_info = soup_recipe.find_all("span", {"class": "nutrition__value"})
-    if not nutritional_info:
-        return None
-    nutrition_name, nutrition_value = [], []
-    for nutrition in nutritional_info:
-        if nutrition.get_text() != '-':
-            nutrition_name.append(nutrition["itemprop"])
-            nutrition_value.append(nutrition.get_text())
-    return dict(zip(nutrition_name, nutrition_value))
-
-
-def get_image_source(soup_recipe):
-    """
-    Get recipe image source from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe image source or None if content not available
+    Get necessary recipe details from recipe page, parsed once for all \
+    fields in RECIPE_FIELDS
+    :params  r_link (str): recipe link
+             recipe_content (str): html content for recipe page
+    :return  recipe details in dictionary format
     """
-    image_source = soup_recipe.find("img", {"itemprop": "image"})
-    if not image_source:
-        return None
-    return image_source["src"]
+    recipe = page_parser.parse(recipe_content)
+    recipe['r_link'] = r_link
+    return recipe
 
 
-def get_recipe_details(recipe_links):
+def get_recipe_details(link_index):
     """
-    Get necessary recipe details from all recipe links and store in dictionary
-    with (key, value) pairs as (recipe title, corresponding details dictionary)
-    :param  recipe_links (list): recipe links for each cuisine
-    :return  recipe details in dictionary format
+    Get necessary recipe details for each unique recipe link, fetching each \
+    recipe page once, and write each recipe to MongoDB as soon as it is \
+    parsed, once for every cuisine it was found under. Pages are fetched, \
+    parsed (in parser processes) and written in a pipeline of stages
+    recipe links are tracked in the crawl frontier, recipes already scraped \
+    are taken from the frontier and failed recipe pages are skipped
+    :param  link_index (RecipeLinkIndex): unique recipe links with the cuisine \
+                fields of the cuisines they were found under
+    :return  number of recipe documents written
     """
-    cuisine_recipes = {}
-    for r in recipe_links:
-        recipe = {}
-        recipe_link = r.a["href"]
-        print "recipe link: ", recipe_link
-        soup_recipe = get_recipe(recipe_link)
-        if soup_recipe:
-            recipe['r_link'] = recipe_link
-            recipe['recipe title'] = get_recipe_title(soup_recipe)
-            recipe['chef'] = get_recipe_chef(soup_recipe)
-            recipe['description'] = get_description(soup_recipe)
-            recipe['ingredient list'] = get_recipe_ingredients(soup_recipe)
-            recipe['preperation steps'] = get_recipe_preperation(soup_recipe)
-            recipe['prep_time'], recipe['cook_time'] = get_recipe_time(soup_recipe)
-            recipe['servings'] = get_servings(soup_recipe)
-            recipe['skill_level'] = get_skill_level(soup_recipe)
-            recipe['rating'], recipe['rating count'] = get_recommendations(soup_recipe)
-            recipe['nutritional_info'] = get_nutrition_per_serving(soup_recipe)
-            recipe['image_source'] = get_image_source(soup_recipe)
-            cuisine_recipes[recipe['recipe title']] = recipe
-    return cuisine_recipes
+    recipe_pipeline = RecipePipeline(COLLECTION_NAME, SCRAPER_NAME, get_recipe,
+        recipe_writer)
+    return recipe_pipeline.run(link_index.items())
 
 
 def get_recipe_links(cuisine, pages, collection):
     """
-    Get recipe details from cuisine search pages \
+    Get recipe links from cuisine search pages \
     and cuisine colections first page (if cuisine has a collection)
     :params  cuisine (str): cuisine name
              pages (int): number of search result pages for cuisine
              collection (boolean): True if cuisine has collection, else False
-    :return  recipe details in dictionary format
+    :return  list of recipe links
     """
     recipe_links = []
     for page in xrange(0, pages):
-        sleep(SCRAPING_REQUEST_STAGGER)
-        recipe_links.extend(get_cuisine_search_pages(cuisine, page))
+        recipe_links.extend(get_cuisine_search_pages(cuisine, page) or [])
     if collection:
-        recipe_links.extend(get_cuisine_collection_page(cuisine))
-    cuisine_recipes = get_recipe_details(list(set(recipe_links)))
-    return cuisine_recipes
+        recipe_links.extend(get_cuisine_collection_page(cuisine) or [])
+    return [r.a["href"] for r in recipe_links]
 
 
 def get_cuisine_recipes(search_cuisisnes, cuisines):
     """
-    Get recipe details for cuisines, store in mongoDB,
-    and convert details dictionary into pandas dataframe
+    Get recipe details for cuisines, store in mongoDB one document per recipe,
+    and write the recipe documents to the Parquet file in chunks
     convert number of recipes into pages to scrape, which will be number search pages \
     and one page for cuisine collection (if there is collection)
+    recipe links of all cuisines are collected first, so each recipe page is \
+    fetched once, even if the recipe is listed under several cuisines
     :params  search_cuisines (list): cuisines under BBC Good Food search
              cuisines (list): cuisines under BBC Good Food collections
-    :return  recipe details in pandas dataframe
+    :return  number of recipes saved
     """
-    cuisine_df = pd.DataFrame()
+    link_index = RecipeLinkIndex(RECIPE_URL.format(''))
     for cuisine in search_cuisisnes:
         cuisine_dict = {}
         cuisine_dict['cuisine'] = cuisine
@@ -384,20 +243,23 @@ def get_cuisine_recipes(search_cuisisnes, cuisines):
         if cuisine in cuisines:
             cuisine_dict['pages'] += 1
             collection = True
-        cuisine_dict['recipes_details'] = get_recipe_links(cuisine_no_space,
-            cuisine_dict['pages']-1, collection)
-        cuisine_dict['num_recipes'] = len(cuisine_dict['recipes_links'])
+        # number of recipes is the number of unique recipe links for cuisine
+        cuisine_dict['num_recipes'] = link_index.add(get_recipe_links(
+            cuisine_no_space, cuisine_dict['pages']-1, collection), cuisine_dict)
         print '#####'
         print "Cuisine: %s \t Number of recipes: %d \t\t Number of pages: %d" \
             % (cuisine, cuisine_dict['num_recipes'], cuisine_dict['pages'])
-        coll.insert_one(cuisine_dict)
-    cuisine_df = cuisine_df.append(pd.DataFrame.from_dict(cuisine_dict, orient='columns'),
-            ignore_index=True)
-    return cuisine_df
+    print "Unique recipes: %d" % len(link_index)
+    get_recipe_details(link_index)
+    return recipe_writer.save_recipes('BBC Good Food', "recipes_data_bbc_good_food")
 
 
-if __name__ == '__main__':
-
+def main():
+    """
+    Scrape recipes for all cuisines and store them in MongoDB and Parquet file
+    :param  none
+    :return  none
+    """
     # list of cuisines under BBC Good Food collections
     cuisines = ['American', 'British', 'Caribbean', 'Chinese', 'French', 'Greek', 'Indian',
     'Italian', 'Japanese', 'Mediterranean', 'Mexican', 'Moroccan', 'Spanish', 'Thai',
@@ -410,5 +272,9 @@ if __name__ == '__main__':
     'Latin American', 'Mediterranean', 'Mexican', 'Middle Eastern', 'Moroccan',
     'North African', 'Portuguese', 'Scandinavian', 'Scottish', 'Southern & Soul',
     'Spanish', 'Swedish', 'Swiss', 'Thai', 'Tunisian', 'Turkish', 'Vietnamese']
-    cuisine_dataframe = get_cuisine_recipes(search_cuisisnes, cuisines)
-    save_obj(cuisine_dataframe, "recipes_data_bbc_good_food")
+    get_cuisine_recipes(search_cuisisnes, cuisines)
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,193 @@
+"""
+##### Benchmarks for the scrapers, run on html fixtures (saved recipe pages)
+##### in the fixtures folder, each with the recipe details expected from it in
+##### a json file of the same name, one sample page per site is kept with the code:
+#####     python benchmarks.py save      save fixtures from scraped recipes
+#####     python benchmarks.py check     check canonical urls of recipe links
+#####     python benchmarks.py           run benchmarks on saved fixtures
+"""
+
+import os
+import sys
+import time
+import json
+
+import bbc_food
+import bbc_good_food
+import chowhound
+import epicurious
+import saveur
+from frontier import frontier, stored_recipe
+from link_index import canonical_url
+
+
+# folder of html fixtures next to the scrapers, one sub-folder per scraper
+FIXTURES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    'fixtures') + '/'
+# number of recipe pages saved as fixtures for each scraper
+NUMBER_OF_FIXTURES = 50
+# scraper modules for all recipe sources
+SCRAPERS = [bbc_food, bbc_good_food, chowhound, epicurious, saveur]
+# (link, canonical url) pairs checked by check_canonical_urls: non-ascii
+# links, unicode or percent-escaped, give the same ascii url
+CANONICAL_URL_CASES = [
+    (u'/r/x?q=caf\xe9', 'http://www.bbc.co.uk/r/x?q=caf%C3%A9'),
+    (u'/r/x?q=caf%C3%A9', 'http://www.bbc.co.uk/r/x?q=caf%C3%A9'),
+    ('/r/x?q=caf%C3%A9', 'http://www.bbc.co.uk/r/x?q=caf%C3%A9'),
+    (u'/r/x?k=%C3%A8&utm_source=a', 'http://www.bbc.co.uk/r/x?k=%C3%A8'),
+    (u'/r/caf\xe9/?b=2&a=1#top', 'http://www.bbc.co.uk/r/caf%C3%A9?a=1&b=2'),
+    ('HTTP://WWW.BBC.CO.UK:80/r/y/', 'http://www.bbc.co.uk/r/y')]
+
+
+def fixtures_folder(scraper):
+    """
+    Get folder of html fixtures for scraper
+    :param  scraper (module): scraper module
+    :return  path of fixtures folder
+    """
+    return FIXTURES_FOLDER + scraper.__name__ + '/'
+
+
+def save_fixtures(scraper, number_of_fixtures=NUMBER_OF_FIXTURES):
+    """
+    Save recipe pages of recipes scraped before (done in the crawl frontier) \
+    as html fixtures, with the recipe details scraped from them as expected \
+    values, pages are read from the response cache where cached
+    :params  scraper (module): scraper module
+             number_of_fixtures (int): number of recipe pages to save
+    :return  number of fixtures saved
+    """
+    folder = fixtures_folder(scraper)
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    number_saved = 0
+    for recipe in frontier.done_recipes(scraper.COLLECTION_NAME, number_of_fixtures):
+        recipe_content = scraper.get_recipe(recipe['r_link'])
+        if not recipe_content:
+            continue
+        with open(folder + '%04d.html' % number_saved, 'wb') as f:
+            f.write(recipe_content)
+        expected = dict(recipe['recipe'])
+        expected.pop('r_link', None)
+        with open(folder + '%04d.json' % number_saved, 'wb') as f:
+            json.dump(expected, f, indent=2, separators=(',', ': '),
+                sort_keys=True)
+        number_saved += 1
+    return number_saved
+
+
+def load_fixtures(scraper):
+    """
+    Load html fixtures for scraper, with the recipe details expected from them
+    :param  scraper (module): scraper module
+    :return  list of (html content, expected recipe details) tuples, expected \
+                details None for fixtures without a json file, empty if there \
+                are no fixtures
+    """
+    folder = fixtures_folder(scraper)
+    if not os.path.exists(folder):
+        return []
+    fixtures = []
+    for file_name in sorted(os.listdir(folder)):
+        name, extension = os.path.splitext(file_name)
+        if extension != '.html':
+            continue
+        with open(folder + file_name, 'rb') as f:
+            content = f.read()
+        expected = None
+        if os.path.exists(folder + name + '.json'):
+            with open(folder + name + '.json', 'rb') as f:
+                expected = json.load(f)
+        fixtures.append((content, expected))
+    return fixtures
+
+
+def pages_per_second(parse, pages):
+    """
+    Time parse function over pages
+    :params  parse (function): function of html content
+             pages (list): html contents
+    :return  pages parsed per second and list of parse results (None for \
+                pages that raised an error)
+    """
+    results = []
+    start = time.time()
+    for page in pages:
+        try:
+            results.append(parse(page))
+        except Exception:
+            results.append(None)
+    return len(pages) / max(time.time() - start, 1e-9), results
+
+
+def benchmark_recipe_parsing(scraper):
+    """
+    Parse fixtures with lxml and the recipe field spec, report pages per \
+    second, the fields that differ from the expected recipe details stored \
+    with the fixtures and the number of fields taken from structured data \
+    (JSON-LD or microdata)
+    :param  scraper (module): scraper module
+    :return  dictionary of pages per second, number of differing fields and \
+                number of fields from structured data
+    """
+    fixtures = load_fixtures(scraper)
+    if not fixtures:
+        print "%s: \t no fixtures in %s" % (scraper.__name__, fixtures_folder(scraper))
+        return None
+    field_sources = dict(scraper.page_parser.field_sources)
+    speed, recipes = pages_per_second(scraper.page_parser.parse,
+        [content for content, expected in fixtures])
+    structured_fields = scraper.page_parser.field_sources['structured'] - \
+        field_sources['structured']
+    selector_fields = scraper.page_parser.field_sources['selector'] - \
+        field_sources['selector']
+    differences = 0
+    for page, ((content, expected), recipe) in enumerate(zip(fixtures, recipes)):
+        if expected is None:
+            continue
+        recipe = stored_recipe(recipe) or {}
+        for field in sorted(set(expected) | set(recipe)):
+            if expected.get(field) != recipe.get(field):
+                differences += 1
+                print "page %d \t %s: \t %r != %r" % (page, field,
+                    expected.get(field), recipe.get(field))
+    print "%s: \t pages: %d \t %.1f pages/s \t differing fields: %d \t \
+fields from structured data: %d of %d" % (scraper.__name__, len(fixtures),
+        speed, differences, structured_fields, structured_fields + selector_fields)
+    return {'pages_per_second': speed, 'differences': differences,
+        'structured_fields': structured_fields}
+
+
+def check_canonical_urls(base_url='http://www.bbc.co.uk'):
+    """
+    Check canonical urls of recipe links with non-ascii characters, \
+    tracking query parameters, fragments and default ports
+    :param  base_url (str): url relative links are resolved against
+    :return  list of links whose canonical url is wrong
+    """
+    mismatches = []
+    for link, url in CANONICAL_URL_CASES:
+        try:
+            result = canonical_url(link, base_url)
+        except Exception as error:
+            result = repr(error)
+        if result != url:
+            mismatches.append(link)
+            print "%r: \t %r != %r" % (link, result, url)
+    print "canonical urls: \t links: %d \t mismatches: %d" % (
+        len(CANONICAL_URL_CASES), len(mismatches))
+    return mismatches
+
+
+if __name__ == '__main__':
+
+    if sys.argv[1:] == ['check']:
+        if check_canonical_urls():
+            sys.exit("canonical url mismatches")
+    elif sys.argv[1:] == ['save']:
+        for scraper in SCRAPERS:
+            print "%s: \t fixtures saved: %d" % (scraper.__name__,
+                save_fixtures(scraper))
+    else:
+        for scraper in SCRAPERS:
+            benchmark_recipe_parsing(scraper)
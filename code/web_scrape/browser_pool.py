@@ -0,0 +1,217 @@
+"""
+##### Pool of long-lived headless Chrome browsers for scraping dynamic pages,
+##### shared by the scrapers, with explicit waits for the content selector
+##### of each page instead of waiting for the full page load timeout
+"""
+
+import os
+import atexit
+import threading
+from Queue import Queue
+from contextlib import contextmanager
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
+from selenium.webdriver.support import expected_conditions
+from selenium.webdriver.support.ui import WebDriverWait
+
+
+# path of chromedriver binary, can be set with the CHROMEDRIVER_PATH variable
+CHROMEDRIVER_PATH = os.environ.get('CHROMEDRIVER_PATH', '/Applications/chromedriver')
+# maximum number of browsers open at the same time
+BROWSER_POOL_SIZE = 2
+# maximum time to wait for a page's content selector (in seconds)
+SELECTOR_TIMEOUT = 60
+# maximum time for a page load, pages return once the document is parsed
+# and the content selector is waited for separately (in seconds)
+PAGE_LOAD_TIMEOUT = 60
+
+
+def new_browser(driver_path=CHROMEDRIVER_PATH, headless=True):
+    """
+    Start Chrome browser that does not load images and returns from page \
+    loads once the document is parsed
+    :params  driver_path (str): path of chromedriver binary
+             headless (bool): run browser without a window
+    :return  Selenium chrome browser driver
+    """
+    options = webdriver.ChromeOptions()
+    if headless:
+        options.add_argument('--headless')
+        options.add_argument('--disable-gpu')
+    options.add_experimental_option('prefs',
+        {'profile.managed_default_content_settings.images': 2})
+    capabilities = DesiredCapabilities.CHROME.copy()
+    capabilities['pageLoadStrategy'] = 'eager'
+    browser = webdriver.Chrome(driver_path, chrome_options=options,
+        desired_capabilities=capabilities)
+    browser.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+    return browser
+
+
+def wait_for_selector(browser, selector, timeout=SELECTOR_TIMEOUT):
+    """
+    Wait until an element matching css selector is on the page
+    :params  browser (webdriver): Selenium browser driver
+             selector (str): css selector of required content
+             timeout (float): maximum time to wait (in seconds)
+    :return  boolean, true if element was found, false on timeout
+    """
+    try:
+        WebDriverWait(browser, timeout).until(
+            expected_conditions.presence_of_element_located((By.CSS_SELECTOR,
+            selector)))
+    except TimeoutException:
+        return False
+    return True
+
+
+def wait_for_replaced(browser, element, selector, timeout=SELECTOR_TIMEOUT):
+    """
+    Wait until element is removed from the page and a new element matching \
+    css selector is on the page (e.g. search results replaced by next page)
+    :params  browser (webdriver): Selenium browser driver
+             element (webelement): element to be replaced
+             selector (str): css selector of required content
+             timeout (float): maximum time to wait (in seconds)
+    :return  boolean, true if element was replaced, false on timeout
+    """
+    try:
+        WebDriverWait(browser, timeout).until(
+            expected_conditions.staleness_of(element))
+    except TimeoutException:
+        return False
+    return wait_for_selector(browser, selector, timeout)
+
+
+def load_page(browser, link, selector, timeout=SELECTOR_TIMEOUT):
+    """
+    Open link in browser and wait for the content selector
+    :params  browser (webdriver): Selenium browser driver
+             link (str): web page link
+             selector (str): css selector of required content
+             timeout (float): maximum time to wait for selector (in seconds)
+    :return  boolean, true if content was found, false on timeout
+    """
+    # a link that differs from the open page only by fragment would not
+    # reload the page, and the old content would match the selector
+    if browser.current_url.split('#')[0] == link.split('#')[0]:
+        browser.get('about:blank')
+    try:
+        browser.get(link)
+    except TimeoutException:
+        # content may be on the page even if the page load did not finish
+        pass
+    return wait_for_selector(browser, selector, timeout)
+
+
+class BrowserPool(object):
+    """
+    Browsers started when first needed, up to size, and reused for later \
+    pages. A browser is used by one thread at a time
+    """
+
+    def __init__(self, size=BROWSER_POOL_SIZE, driver_path=CHROMEDRIVER_PATH,
+        headless=True):
+        """
+        :params  size (int): maximum number of browsers open at the same time
+                 driver_path (str): path of chromedriver binary
+                 headless (bool): run browsers without a window
+        """
+        self.size = size
+        self.driver_path = driver_path
+        self.headless = headless
+        self.idle_browsers = Queue()
+        self.number_of_browsers = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take an idle browser, start one if none is idle and the pool is not \
+        full, else wait for a browser to be released
+        :param  none
+        :return  Selenium chrome browser driver
+        """
+        with self.lock:
+            start_browser = self.idle_browsers.empty() and \
+                self.number_of_browsers < self.size
+            if start_browser:
+                self.number_of_browsers += 1
+        if not start_browser:
+            return self.idle_browsers.get()
+        try:
+            return new_browser(self.driver_path, self.headless)
+        except:
+            with self.lock:
+                self.number_of_browsers -= 1
+            raise
+
+    def release(self, browser):
+        """
+        Return browser to the pool
+        :param  browser (webdriver): Selenium browser driver
+        :return  none
+        """
+        self.idle_browsers.put(browser)
+
+    def discard(self, browser):
+        """
+        Quit broken browser, so a new one is started in its place
+        :param  browser (webdriver): Selenium browser driver
+        :return  none
+        """
+        with self.lock:
+            self.number_of_browsers -= 1
+        try:
+            browser.quit()
+        except WebDriverException:
+            pass
+
+    @contextmanager
+    def browser(self):
+        """
+        Use a browser from the pool for the duration of a with block, a \
+        browser that fails with a webdriver error is discarded
+        :param  none
+        :return  Selenium chrome browser driver
+        """
+        browser = self.acquire()
+        try:
+            yield browser
+        except WebDriverException:
+            self.discard(browser)
+            raise
+        except:
+            self.release(browser)
+            raise
+        self.release(browser)
+
+    def get_page_source(self, link, selector, timeout=SELECTOR_TIMEOUT):
+        """
+        Open link in a pooled browser and collect page content once the \
+        content selector is on the page
+        :params  link (str): web page link
+                 selector (str): css selector of required content
+                 timeout (float): maximum time to wait for selector (in seconds)
+        :return  html content for web page (without the required content if \
+                    the selector was not found in time)
+        """
+        with self.browser() as browser:
+            if not load_page(browser, link, selector, timeout):
+                print "timed out waiting for %s on: %s" % (selector, link)
+            return browser.page_source
+
+    def quit_all(self):
+        """
+        Quit all idle browsers
+        :param  none
+        :return  none
+        """
+        while not self.idle_browsers.empty():
+            self.discard(self.idle_browsers.get())
+
+
+# browser pool shared by all scrapers in this process
+browser_pool = BrowserPool()
+atexit.register(browser_pool.quit_all)
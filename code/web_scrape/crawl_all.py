@@ -0,0 +1,68 @@
+"""
+##### Web scrape all recipe sources at the same time, one thread per source,
+##### each source still limited to its own per-host request rate
+"""
+
+import threading
+import time
+
+import bbc_food
+import bbc_good_food
+import chowhound
+import epicurious
+import saveur
+from fetch import http_client
+from frontier import frontier
+from pipeline import get_parser_pool
+
+
+# scraper modules for all recipe sources
+SCRAPERS = [bbc_food, bbc_good_food, chowhound, epicurious, saveur]
+
+
+def run_scraper(scraper, wall_times):
+    """
+    Run scraper for one source and record its wall time
+    :params  scraper (module): scraper module with a main function
+             wall_times (dictionary): wall time (in seconds) by scraper name
+    :return  none
+    """
+    start = time.time()
+    scraper.main()
+    wall_times[scraper.__name__] = time.time() - start
+
+
+def crawl_all(scrapers=SCRAPERS):
+    """
+    Run scrapers for all sources concurrently, requests to each site are \
+    rate limited per host, so total wall time approaches the slowest site. \
+    Recipe pages of all sources are parsed in one pool of parser processes
+    :param  scrapers (list): scraper modules with a main function
+    :return  dictionary of wall time (in seconds) by scraper name
+    """
+    wall_times = {}
+    start = time.time()
+    # parser processes are forked before the scraper threads start
+    get_parser_pool()
+    threads = [threading.Thread(target=run_scraper, args=(scraper, wall_times),
+        name=scraper.__name__) for scraper in scrapers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for name, wall_time in sorted(wall_times.iteritems()):
+        print "%s: \t %.0fs" % (name, wall_time)
+    for scraper in scrapers:
+        print "%s: \t frontier: %r" % (scraper.__name__,
+            frontier.state_counts(scraper.COLLECTION_NAME))
+    print "frontier: \t recipes scraped again: changed %(changed)d, unchanged \
+%(unchanged)d" % frontier.refresh_stats
+    print "total: \t %.0fs" % (time.time() - start)
+    http_client.print_connection_stats()
+    http_client.cache.print_stats()
+    return wall_times
+
+
+if __name__ == '__main__':
+
+    crawl_all()
@@ -1,15 +1,17 @@
 """
 ##### Web scrape Epicurious website for recipes by cuisine
-##### store recipe details for all cuisines in MongoDB and a pickle file
+##### store recipe details for all cuisines in MongoDB and a Parquet file
 """
 
-from time import sleep
-import requests
 from bs4 import BeautifulSoup
 from math import ceil
-import pandas as pd
 from pymongo import MongoClient
-import pickle
+from fetch import http_client
+from pipeline import RecipePipeline
+from link_index import RecipeLinkIndex
+from writer import RecipeWriter
+from response_cache import SEARCH_PAGE, RECIPE_PAGE
+from recipe_parser import RecipeParser, has_class
 
 
 # sleep time between web requests (in seconds)
@@ -23,6 +25,33 @@ RECIPE_URL = 'http://www.epicurious.com{}'
 # first page has 20 recipes and all other pages have 30 each
 NUMBER_OF_RECIPES_PER_PAGE = [20., 30.]
 
+# recipe fields on recipe pages, as field specs for the recipe parser
+RECIPE_FIELDS = {
+    'recipe title': {'path': '//h1[@itemprop="name"]', 'strip': True,
+        'schema': 'name', 'required': True},
+    # chef name follows "by "
+    'chef': {'path': '//span[@itemprop="author"]', 'strip': True,
+        'post': lambda x: x[3:]},
+    'description': {'path': '(//div[@itemprop="description"])[1]//p', 'strip': True},
+    'ingredient list': {'path': '//li[%s]' % has_class('ingredient'), 'many': True,
+        'schema': ['recipeIngredient', 'ingredients']},
+    'preperation steps': {'path': '//li[%s]' % has_class('preparation-step'),
+        'many': True, 'strip': True, 'schema': 'recipeInstructions'},
+    'prep_time': {'path': '//p[%s]' % has_class('recipe-metadata__prep-time')},
+    'cook_time': {'path': '//p[%s]' % has_class('recipe-metadata__cook-time')},
+    'servings': {'path': '//dd[@itemprop="recipeYield"]', 'schema': 'recipeYield'},
+    'rating': {'path': '//span[%s]' % has_class('rating')},
+    'recommendation': {'path': '(//div[%s])[1]//span' %
+        has_class('prepare-again-rating')},
+    'nutritional_info': {'path': '//div[%s]' % has_class('nutritional-info')},
+    'image_source': {'path': '(//div[%s])[1]//img/@src' % has_class('recipe-image')},
+}
+# parser for recipe pages
+page_parser = RecipeParser(RECIPE_FIELDS)
+# name of this module, imported by the parser processes to parse recipe
+# pages (__name__ is '__main__' when the scraper is run as a script)
+SCRAPER_NAME = 'epicurious'
+
 
 # create MongoDB database and collection
 DB_NAME = 'PROJECT_RECIPIES'
@@ -32,40 +61,21 @@ COLLECTION_NAME = 'EPICUR'
 client = MongoClient()
 db = client[DB_NAME]
 coll = db[COLLECTION_NAME]
+# writer of recipe documents to the collection
+recipe_writer = RecipeWriter(coll)
 
 
-def save_obj(obj, name):
-    """
-    Dump object in pickel file in data folder
-    :params  obj (object): object to be saved (can be in any form)
-             name (str): file-name to save object with
-    """
-    with open('../../data/' + name + '.pkl', 'wb') as f:
-        pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
-
-
-def load_obj(name):
-    """
-    Load object from pickel file in data folder
-    :param  name (str): file-name to load object from
-    :return  object in original format
-    """
-    with open('../../data/' + name + '.pkl', 'rb') as f:
-        return pickle.load(f)
-
-
-def get_content_from_url(link):
+def get_content_from_url(link, page_type=RECIPE_PAGE):
     """
     Make web request and collect webpage content
-    :param  link (str): web page link
+    :params  link (str): web page link
+             page_type (str): SEARCH_PAGE or RECIPE_PAGE, for how long the \
+                cached page is used
     :return  html content for web page
     """
-    # sleep time before making web request
-    sleep(SCRAPING_REQUEST_STAGGER)
-    response = requests.get(link)
-    if response.status_code != 200:
-        return False
-    return response.content
+    # shared http client waits for the host's request rate limit and caches
+    # responses
+    return http_client.get_content(link, SCRAPING_REQUEST_STAGGER, page_type)
 
 
 def get_number_of_recipes(att_value):
@@ -76,7 +86,7 @@ def get_number_of_recipes(att_value):
     :return  number of recipes (int) or None if no content for url
     """
     cuisine_link = CUISINE_URL.format(att_value)
-    cuisine_recipes = get_content_from_url(cuisine_link)
+    cuisine_recipes = get_content_from_url(cuisine_link, SEARCH_PAGE)
     if not cuisine_recipes:
         print "no content for:", cuisine_link
         return None
@@ -103,7 +113,7 @@ def get_cuisine_pages(att_value, page):
         link = CUISINE_RECIPES_URL.format(att_value, page,
             int(NUMBER_OF_RECIPES_PER_PAGE[0] +
                 (page-2)*NUMBER_OF_RECIPES_PER_PAGE[1] + 1))
-    cuisine_recipe_links = get_content_from_url(link)
+    cuisine_recipe_links = get_content_from_url(link, SEARCH_PAGE)
     if not cuisine_recipe_links:
         print "no content for:", link
         return None
@@ -116,206 +126,71 @@ def get_recipe(r_link):
     """
     Make web request to recipe page and get the recipe content
     :param  r_link (str): recipe link
-    :return  html content for web page in beautifulsoup format
-                    or None (if no content)
+    :return  html content for web page or None (if no content)
     """
     recipe_link = RECIPE_URL.format(r_link)
     recipe_response = get_content_from_url(recipe_link)
     if not recipe_response:
         print "no content for:", recipe_link
         return None
-    return BeautifulSoup(recipe_response)
-
-
-def get_recipe_title(soup_recipe):
-    """
-    Get recipe title from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe title
-    """
-    return soup_recipe.find("h1", {"itemprop": "name"}).get_text().strip()
-
-
-def get_recipe_chef(soup_recipe):
-    """
-    Get recipe chef name from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe chef name or None for no content
-    """
-    chef_name = soup_recipe.find("span", {"itemprop": "author"})
-    if not chef_name:
-        return None
-    return chef_name.get_text().strip()[3:]
-
-
-def get_description(soup_recipe):
-    """
-    Get recipe description from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe description / summary
-    """
-    summary = soup_recipe.find("div", {"itemprop": "description"})
-    if not summary:
-        return None
-    return summary.find("p").get_text().strip()
-
-
-def get_recipe_ingredients(soup_recipe):
-    """
-    Get recipe ingredients from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe ingredient list
-    """
-    ingredients_list = soup_recipe.find_all("li", {"class": "ingredient"})
-    ingredients = []
-    for ing in ingredients_list:
-        ingredients.append(ing.get_text())
-    return ingredients
-
-
-def get_recipe_preperation(soup_recipe):
-    """
-    Get recipe preperation steps from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe preperation steps as a list
-    """
-    prep_steps = soup_recipe.find_all("li", {"class": "preparation-step"})
-    prep = []
-    for step in prep_steps:
-        prep.append(step.get_text().strip())
-    return prep
-
-
-def get_recipe_time(soup_recipe):
-    """
-    Get recipe prep and cooking times from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe preperation time and recipe cooking time
-                or None if content not available
-    """
-    prep_time = soup_recipe.find("p", {"class": "recipe-metadata__prep-time"})
-    if prep_time:
-        prep_time = prep_time.get_text()
-    else:
-        prep_time = None
-    cooking_time = soup_recipe.find("p", {"class": "recipe-metadata__cook-time"})
-    if cooking_time:
-        cooking_time = cooking_time.get_text()
-    else:
-        cooking_time = None
-    return prep_time, cooking_time
-
-
-def get_servings(soup_recipe):
-    """
-    Get recipe servings/yield from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe servings/yield or None if content not available
-    """
-    servings = soup_recipe.find("dd", {"itemprop": "recipeYield"})
-    if not servings:
-        return None
-    return servings.get_text()
-
-
-def get_recommendations(soup_recipe):
-    """
-    Get recipe ratings score and number of recommendations from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe ratings score and the number of recommendations \
-                 or None if content not available
-    """
-    ratings = soup_recipe.find("span", {"class": "rating"})
-    if not ratings:
-        ratings = None
-    else:
-        ratings = ratings.get_text()
-    recommendations = soup_recipe.find("div", {"class": "prepare-again-rating"})
-    if not recommendations:
-        recommendations = None
-    else:
-        recommendations = recommendations.find("span").get_text()
-    return ratings, recommendations
-
-
-def get_nutrition_per_serving(soup_recipe):
-    """
-    Get nutritional values per serving for recipe from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  nutrition information in string format or None if content not available
-    """
-    nutritional_info = soup_recipe.find("div", {"class": "nutritional-info"})
-    if not nutritional_info:
-        return None
-    return nutritional_info.get_text()
+    return recipe_response
 
 
-def get_image_source(soup_recipe):
+def parse_recipe(r_link, recipe_content):
     """
-    Get recipe image source from recipe content
-    :param  soup_recipe (str): recipe content in beautifulsoup format
-    :return  recipe image source or None if content not available
+    Get necessary recipe details from recipe page, parsed once for all \
+    fields in RECIPE_FIELDS
+    :params  r_link (str): recipe link
+             recipe_content (str): html content for recipe page
+    :return  recipe details in dictionary format
     """
-    image_source = soup_recipe.find("div", {"class": "recipe-image"})
-    if not image_source:
-        return None
-    return image_source.find("img")["src"]
+    recipe = page_parser.parse(recipe_content)
+    recipe['r_link'] = r_link
+    return recipe
 
 
-def get_recipe_details(recipe_links):
+def get_recipe_details(link_index):
     """
-    Get necessary recipe details from all recipe links and store in dictionary \
-    with (key, value) pairs as (recipe title, corresponding details dictionary)
-    :param  recipe_links (list): recipe links for each cuisine
-    :return  recipe details in dictionary format
+    Get necessary recipe details for each unique recipe link, fetching each \
+    recipe page once, and write each recipe to MongoDB as soon as it is \
+    parsed, once for every cuisine it was found under. Pages are fetched, \
+    parsed (in parser processes) and written in a pipeline of stages
+    recipe links are tracked in the crawl frontier, recipes already scraped \
+    are taken from the frontier and failed recipe pages are skipped
+    :param  link_index (RecipeLinkIndex): unique recipe links with the cuisine \
+                fields of the cuisines they were found under
+    :return  number of recipe documents written
     """
-    cuisine_recipes = {}
-    for r in recipe_links:
-        recipe = {}
-        recipe_link = r["href"]
-        print "recipe link: ", recipe_link
-        soup_recipe = get_recipe(recipe_link)
-        if soup_recipe:
-            recipe['r_link'] = recipe_link
-            recipe['recipe title'] = get_recipe_title(soup_recipe)
-            recipe['chef'] = get_recipe_chef(soup_recipe)
-            recipe['description'] = get_description(soup_recipe)
-            recipe['ingredient list'] = get_recipe_ingredients(soup_recipe)
-            recipe['preperation steps'] = get_recipe_preperation(soup_recipe)
-            recipe['prep_time'], recipe['cook_time'] = get_recipe_time(soup_recipe)
-            recipe['servings'] = get_servings(soup_recipe)
-            recipe['rating'], recipe['recommendation'] = get_recommendations(soup_recipe)
-            recipe['nutritional_info'] = get_nutrition_per_serving(soup_recipe)
-            recipe['image_source'] = get_image_source(soup_recipe)
-        cuisine_recipes[recipe['recipe title']] = recipe
-    return cuisine_recipes
+    recipe_pipeline = RecipePipeline(COLLECTION_NAME, SCRAPER_NAME, get_recipe,
+        recipe_writer)
+    return recipe_pipeline.run(link_index.items())
 
 
 def get_recipe_links(att_value, pages):
     """
-    Get recipe details from cuisine search pages
+    Get recipe links from cuisine search pages
     :params  att_value (int): attribute value for cuisine (unique for each cuisine)
              pages (int): number of search result pages for cuisine
-    :return  recipe details for cuisine in dictionary format
+    :return  list of recipe links
     """
     recipe_links = []
     for page in xrange(1, pages + 1):
-        sleep(SCRAPING_REQUEST_STAGGER)
-        recipe_links.extend(get_cuisine_pages(att_value, page))
-    cuisine_recipes = get_recipe_details(recipe_links)
-    return cuisine_recipes
+        recipe_links.extend(get_cuisine_pages(att_value, page) or [])
+    return [r["href"] for r in recipe_links]
 
 
 def get_cuisine_recipes(cuisines, att_values):
     """
-    Get recipe details for cuisines, store in mongoDB,
-    and convert details dictionary into pandas dataframe
+    Get recipe details for cuisines, store in mongoDB one document per recipe,
+    and write the recipe documents to the Parquet file in chunks
     There are 20 search results for first search page and 30 each for the remaining
+    recipe links of all cuisines are collected first, so each recipe page is \
+    fetched once, even if the recipe is listed under several cuisines
     :params  cuisines (list): cuisines under Epicurious search
              att_values (list): corresponding attribute values for the cuisines
-    :return  recipe details in pandas dataframe
+    :return  number of recipes saved
     """
-    cuisine_df = pd.DataFrame()
+    link_index = RecipeLinkIndex(RECIPE_URL.format(''))
     for cuisine, att_value in zip(cuisines, att_values):
         cuisine_dict = {}
         cuisine_dict['cuisine'] = cuisine
@@ -330,16 +205,19 @@ def get_cuisine_recipes(cuisines, att_values):
         print '#####'
         print "Cuisine: %s \t Number of recipes: %r \t\t Number of pages: %r" % \
             (cuisine, cuisine_dict['num_recipes'], cuisine_dict['pages'])
-        cuisine_dict['recipes_details'] = get_recipe_links(att_value,
-            cuisine_dict['pages'])
-        coll.insert_one(cuisine_dict)
-        cuisine_df = cuisine_df.append(pd.DataFrame.from_dict(cuisine_dict,
-            orient='columns'), ignore_index=True)
-    return cuisine_df
+        link_index.add(get_recipe_links(att_value, cuisine_dict['pages']),
+            cuisine_dict)
+    print "Unique recipes: %d" % len(link_index)
+    get_recipe_details(link_index)
+    return recipe_writer.save_recipes('Epicurious', "recipes_data_epicurious")
 
 
-if __name__ == '__main__':
-
+def main():
+    """
+    Scrape recipes for all cuisines and store them in MongoDB and Parquet file
+    :param  none
+    :return  none
+    """
     # dictionary of cuisines on Epicurious with their corresponding attribute values
     cuisine_att_values = {'African': 1, 'Argentine': 329, 'Asian': 3, 'British': 315,
     'Cajun/Creole': 4, 'Californian': 334, 'Central American/Caribbean': 5,
@@ -353,5 +231,9 @@ if __name__ == '__main__':
     'Spanish/Portuguese': 24, 'Thai': 25, 'Tex-Mex': 339, 'Turkish': 331, 'Vietnamese': 26}
     cuisines = cuisine_att_values.keys()
     att_values = cuisine_att_values.values()
-    cuisine_dataframe = get_cuisine_recipes(cuisines, att_values)
-    save_obj(cuisine_dataframe, "recipes_data_epicurious")
+    get_cuisine_recipes(cuisines, att_values)
+
+
+if __name__ == '__main__':
+
+    main()
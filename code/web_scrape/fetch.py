@@ -0,0 +1,253 @@
+"""
+##### Shared fetching for the web scrapers: a token-bucket rate limiter per
+##### host, so that the scrapers for different sites can crawl at the same
+##### time while each site still gets a polite request rate, and a shared
+##### HTTP client with pooled keep-alive connections per host, compression
+##### and an on-disk response cache
+"""
+
+import os
+import sys
+import threading
+import time
+import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from response_cache import ResponseCache, RECIPE_PAGE, CACHE_NAME
+
+# shared storage module is in the parent code folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from storage import DATA_FOLDER
+
+
+# default time between web requests to the same host (in seconds)
+DEFAULT_REQUEST_INTERVAL = 5.0
+# number of requests that can be made back to back to a host after idling
+DEFAULT_BURST = 1
+# user agent header for web requests
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, \
+like Gecko) Chrome/47.0.2526.80 Safari/537.36"
+# (connect, read) timeouts for web requests (in seconds)
+REQUEST_TIMEOUT = (10, 30)
+# number of hosts to keep connection pools for
+POOL_CONNECTIONS = 10
+# number of keep-alive connections kept per host
+POOL_MAXSIZE = 4
+
+
+class TokenBucket(object):
+    """
+    Token bucket rate limiter, refilled with one token every interval \
+    seconds up to burst tokens, where each request takes one token
+    """
+
+    def __init__(self, interval=DEFAULT_REQUEST_INTERVAL, burst=DEFAULT_BURST):
+        """
+        :params  interval (float): seconds between requests
+                 burst (int): maximum number of tokens in bucket
+        """
+        self.interval = interval
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last_refill = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take one token from bucket, sleeping until one is available
+        :param  none
+        :return  none
+        """
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.burst, self.tokens +
+                    (now - self.last_refill) / self.interval)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) * self.interval
+            time.sleep(wait_time)
+
+
+class HostRateLimiter(object):
+    """
+    Token bucket for each host, created on the first request to that host
+    """
+
+    def __init__(self, burst=DEFAULT_BURST):
+        """
+        :param  burst (int): number of requests that can be made back to back \
+                    to a host after idling
+        """
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def wait(self, link, interval=DEFAULT_REQUEST_INTERVAL):
+        """
+        Wait until a request can be made to the host of link
+        :params  link (str): web page link
+                 interval (float): seconds between requests to the host, \
+                    used when the host's bucket is created
+        :return  none
+        """
+        host = urlparse.urlparse(link).netloc
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(interval, self.burst)
+            bucket = self.buckets[host]
+        bucket.acquire()
+
+
+# rate limiter shared by all scrapers in this process
+rate_limiter = HostRateLimiter()
+
+
+def accept_encoding():
+    """
+    Get content encodings to accept, brotli only if it can be decoded \
+    (brotli package installed)
+    :param  none
+    :return  Accept-Encoding header value
+    """
+    try:
+        import brotli
+    except ImportError:
+        return 'gzip, deflate'
+    return 'gzip, deflate, br'
+
+
+class FetchClient(object):
+    """
+    HTTP client shared by the scrapers, with one session keeping pooled \
+    keep-alive connections per host, compressed responses, timeouts and the \
+    scrapers' user agent. Requests wait for the host's rate limit, and pages \
+    are served from the response cache while fresh. The response cache file \
+    is opened on first use, not when the client is created, so importing the \
+    scrapers does not open or create files in the data folder
+    """
+
+    def __init__(self, timeout=REQUEST_TIMEOUT, user_agent=USER_AGENT,
+        limiter=rate_limiter, cache_path=None):
+        """
+        :params  timeout (tuple): (connect, read) timeouts (in seconds)
+                 user_agent (str): user agent header for web requests
+                 limiter (HostRateLimiter): rate limiter for requests
+                 cache_path (str): path of response cache file, None to not cache
+        """
+        self.timeout = timeout
+        self.rate_limiter = limiter
+        self.cache_path = cache_path
+        self.response_cache = None
+        self.cache_lock = threading.Lock()
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS,
+            pool_maxsize=POOL_MAXSIZE)
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        self.session.headers.update({'User-agent': user_agent,
+            'Accept-Encoding': accept_encoding()})
+
+    @property
+    def cache(self):
+        """
+        Response cache, opened on first use
+        :param  none
+        :return  ResponseCache, or None if the client does not cache
+        """
+        if self.response_cache is None and self.cache_path is not None:
+            with self.cache_lock:
+                if self.response_cache is None:
+                    self.response_cache = ResponseCache(self.cache_path)
+        return self.response_cache
+
+    def get(self, link, interval=DEFAULT_REQUEST_INTERVAL, headers=None):
+        """
+        Make web request after waiting for the host's rate limit
+        :params  link (str): web page link
+                 interval (float): seconds between requests to the host
+                 headers (dictionary): extra headers for web request
+        :return  requests response
+        """
+        self.rate_limiter.wait(link, interval)
+        return self.session.get(link, headers=headers, timeout=self.timeout)
+
+    def get_content(self, link, interval=DEFAULT_REQUEST_INTERVAL,
+        page_type=RECIPE_PAGE):
+        """
+        Collect webpage content, from the response cache if it is fresh for \
+        page type, else make web request, conditional on the cached \
+        response's validators if the page is cached (a 304 response reuses \
+        the cached content)
+        :params  link (str): web page link
+                 interval (float): seconds between requests to the host
+                 page_type (str): SEARCH_PAGE or RECIPE_PAGE, sets how long \
+                    a cached page is used without revalidating
+        :return  html content for web page or False if request failed
+        """
+        cache = self.cache
+        entry = None
+        headers = None
+        if cache is not None:
+            entry = cache.get(link)
+            if entry is not None:
+                if cache.is_fresh(entry, page_type):
+                    cache.count('fresh')
+                    return entry['body']
+                headers = cache.conditional_headers(entry)
+        try:
+            response = self.get(link, interval, headers)
+        except requests.exceptions.RequestException as error:
+            print "request failed for:", link, error
+            return False
+        if response.status_code == 304 and entry is not None:
+            cache.touch(link)
+            cache.count('revalidated')
+            return entry['body']
+        if response.status_code != 200:
+            return False
+        if cache is not None:
+            cache.put(link, response.content, response.headers.get('ETag'),
+                response.headers.get('Last-Modified'))
+            cache.count('downloaded')
+        return response.content
+
+    def connection_stats(self):
+        """
+        Get number of requests and new connections for each host, from the \
+        session's connection pools
+        :param  none
+        :return  dictionary of (host, dictionary of requests, connections and \
+                    connection reuse ratio) pairs
+        """
+        stats = {}
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            host_stats = stats.setdefault(pool.host, {'requests': 0,
+                'connections': 0})
+            host_stats['requests'] += pool.num_requests
+            host_stats['connections'] += pool.num_connections
+        for host_stats in stats.itervalues():
+            host_stats['reuse_ratio'] = 1 - host_stats['connections'] / \
+                float(max(host_stats['requests'], 1))
+        return stats
+
+    def print_connection_stats(self):
+        """
+        Print number of requests, new connections and connection reuse ratio \
+        for each host
+        :param  none
+        :return  none
+        """
+        for host, host_stats in sorted(self.connection_stats().iteritems()):
+            print "%s: \t requests: %d \t connections: %d \t reuse: %.2f" % \
+                (host, host_stats['requests'], host_stats['connections'],
+                host_stats['reuse_ratio'])
+
+
+# HTTP client shared by all scrapers in this process, caching responses in
+# the data folder
+http_client = FetchClient(cache_path=DATA_FOLDER + CACHE_NAME)
@@ -0,0 +1,289 @@
+"""
+##### Persistent crawl frontier for the scrapers, in a SQLite file in the data
+##### folder. Tracks the state of each recipe url (pending, in-flight, done,
+##### failed), its number of attempts and the hash of its recipe details, and
+##### keeps the recipe details of done urls, so an interrupted scraper resumes
+##### where it stopped and skips recipe pages it already scraped. Recipes older
+##### than a maximum age are scraped again, and their hash tells if they changed
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import hashlib
+import threading
+import time
+
+# shared storage module is in the parent code folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from storage import DATA_FOLDER
+
+
+# file-name of crawl frontier in data folder
+FRONTIER_NAME = 'crawl_frontier.sqlite'
+# url states
+PENDING = 'pending'
+IN_FLIGHT = 'in-flight'
+DONE = 'done'
+FAILED = 'failed'
+# number of attempts after which a failed url is not tried again
+MAX_ATTEMPTS = 3
+# time (in seconds) after which a done url is scraped again, the time a cached
+# recipe page is used without revalidating (see response_cache)
+MAX_RECIPE_AGE = 30 * 24 * 60 * 60
+
+
+def recipe_hash(recipe):
+    """
+    Get hash of recipe details, to tell if a recipe changed between crawls
+    :param  recipe (dictionary): dict of recipe details for one recipe
+    :return  sha1 hex digest of recipe details in json format
+    """
+    return hashlib.sha1(json.dumps(recipe, sort_keys=True)).hexdigest()
+
+
+def stored_recipe(recipe):
+    """
+    Get recipe details as they are read back from the frontier (json types: \
+    unicode strings, lists), so scraped and resumed recipes are the same
+    :param  recipe (dictionary): dict of recipe details for one recipe
+    :return  dictionary of recipe details
+    """
+    return json.loads(json.dumps(recipe))
+
+
+class CrawlFrontier(object):
+    """
+    State, attempts, content hash and recipe details of each url. The SQLite \
+    connection is opened on first use (not when the frontier is created, so \
+    importing the scrapers does not open or create files in the data folder) \
+    and shared by the scraper threads, guarded by a lock
+    """
+
+    def __init__(self, path=DATA_FOLDER + FRONTIER_NAME, max_attempts=MAX_ATTEMPTS,
+                 max_age=MAX_RECIPE_AGE):
+        """
+        :params  path (str): path of SQLite frontier file
+                 max_attempts (int): number of attempts after which a failed \
+                    url is not tried again
+                 max_age (float): seconds after which a done url is scraped \
+                    again, None to never scrape done urls again
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.connect_lock = threading.Lock()
+        self.sqlite_connection = None
+        # number of recipes scraped again that changed or not
+        self.refresh_stats = {'changed': 0, 'unchanged': 0}
+
+    @property
+    def connection(self):
+        """
+        SQLite connection, opened on first use
+        :param  none
+        :return  sqlite3 connection
+        """
+        if self.sqlite_connection is None:
+            with self.connect_lock:
+                if self.sqlite_connection is None:
+                    self.sqlite_connection = self.connect()
+        return self.sqlite_connection
+
+    def connect(self):
+        """
+        Open SQLite frontier file, creating the frontier table if needed
+        :param  none
+        :return  sqlite3 connection
+        """
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        with connection:
+            connection.execute("""CREATE TABLE IF NOT EXISTS frontier (
+                url TEXT PRIMARY KEY, source TEXT, state TEXT,
+                attempts INTEGER DEFAULT 0, content_hash TEXT, recipe TEXT,
+                updated_at REAL)""")
+            connection.execute("""CREATE INDEX IF NOT EXISTS
+                frontier_source_state ON frontier (source, state)""")
+            # urls in flight when the last run stopped are tried again, urls
+            # in flight to be scraped again keep their recipe (done, still due
+            # to be scraped again)
+            connection.execute("""UPDATE frontier SET state = ?, updated_at =
+                NULL WHERE state = ? AND recipe IS NOT NULL""", (DONE, IN_FLIGHT))
+            connection.execute("UPDATE frontier SET state = ? WHERE state = ?",
+                (PENDING, IN_FLIGHT))
+        return connection
+
+    def add(self, urls, source):
+        """
+        Add urls as pending, urls already in the frontier keep their state
+        :params  urls (iterable): recipe links
+                 source (str): source of recipes
+        :return  none
+        """
+        with self.lock, self.connection:
+            self.connection.executemany("""INSERT OR IGNORE INTO frontier
+                (url, source, state, updated_at) VALUES (?, ?, ?, ?)""",
+                [(url, source, PENDING, time.time()) for url in urls])
+
+    def get(self, url):
+        """
+        Get frontier entry for url
+        :param  url (str): recipe link
+        :return  dictionary of state, attempts, recipe (None unless scraped), \
+                    content hash and update time, or None if url is not in \
+                    the frontier
+        """
+        with self.lock:
+            row = self.connection.execute("""SELECT state, attempts, recipe,
+                content_hash, updated_at FROM frontier WHERE url = ?""",
+                (url,)).fetchone()
+        if row is None:
+            return None
+        return {'state': row[0], 'attempts': row[1],
+            'recipe': json.loads(row[2]) if row[2] else None,
+            'content_hash': row[3], 'updated_at': row[4]}
+
+    def set_state(self, url, source, state, recipe=None):
+        """
+        Set state of url, counting an attempt when it goes in flight, and \
+        storing recipe details and their hash when it is done
+        :params  url (str): recipe link
+                 source (str): source of recipes
+                 state (str): PENDING, IN_FLIGHT, DONE or FAILED
+                 recipe (dictionary): dict of recipe details for done url
+        :return  none
+        """
+        content_hash = recipe_hash(recipe) if recipe is not None else None
+        recipe_json = json.dumps(recipe) if recipe is not None else None
+        with self.lock, self.connection:
+            self.connection.execute("""INSERT OR IGNORE INTO frontier
+                (url, source, state, updated_at) VALUES (?, ?, ?, ?)""",
+                (url, source, state, time.time()))
+            self.connection.execute("""UPDATE frontier SET state = ?,
+                attempts = attempts + ?, content_hash = COALESCE(?, content_hash),
+                recipe = COALESCE(?, recipe), updated_at = ? WHERE url = ?""",
+                (state, int(state == IN_FLIGHT), content_hash, recipe_json,
+                time.time(), url))
+
+    def is_stale(self, entry):
+        """
+        Check if recipe of done url is due to be scraped again
+        :param  entry (dictionary): frontier entry of done url
+        :return  boolean, true if the recipe is older than max_age or was \
+                    reset, else false
+        """
+        if entry['updated_at'] is None:
+            return True
+        return self.max_age is not None and \
+            time.time() - entry['updated_at'] >= self.max_age
+
+    def claim(self, url, source):
+        """
+        Claim url for scraping: urls that are done give their recipe details \
+        (unless stale, then they are scraped again), urls that failed \
+        max_attempts times are skipped, other urls are set in flight
+        :params  url (str): recipe link
+                 source (str): source of recipes
+        :return  tuple of recipe details (dictionary, None unless url is \
+                    done) and True if url was set in flight to be scraped
+        """
+        entry = self.get(url)
+        if entry is not None and entry['state'] == DONE and \
+            not self.is_stale(entry):
+            return entry['recipe'], False
+        if entry is not None and entry['state'] == FAILED and \
+            entry['attempts'] >= self.max_attempts:
+            return None, False
+        self.set_state(url, source, IN_FLIGHT)
+        return None, True
+
+    def finish(self, url, source, recipe):
+        """
+        Set url claimed for scraping done with its recipe details, or failed. \
+        A recipe scraped again is compared with the one scraped before by \
+        content hash (counted in refresh_stats), and when scraping it again \
+        fails, the recipe scraped before is kept (and scraped again next time)
+        :params  url (str): recipe link
+                 source (str): source of recipes
+                 recipe (dictionary): recipe details or None if scraping failed
+        :return  recipe details as stored in the frontier, or None if url failed
+        """
+        entry = self.get(url)
+        previous_recipe = entry is not None and entry['recipe'] is not None
+        if recipe is None:
+            if not previous_recipe:
+                self.set_state(url, source, FAILED)
+                return None
+            with self.lock, self.connection:
+                self.connection.execute("""UPDATE frontier SET state = ?,
+                    updated_at = NULL WHERE url = ?""", (DONE, url))
+            return entry['recipe']
+        recipe = stored_recipe(recipe)
+        if previous_recipe:
+            outcome = 'unchanged' if recipe_hash(recipe) == \
+                entry['content_hash'] else 'changed'
+            with self.lock:
+                self.refresh_stats[outcome] += 1
+        self.set_state(url, source, DONE, recipe)
+        return recipe
+
+    def reset(self, source):
+        """
+        Mark done urls of source to be scraped again on their next claim
+        :param  source (str): source of recipes
+        :return  number of urls reset
+        """
+        with self.lock, self.connection:
+            return self.connection.execute("""UPDATE frontier SET updated_at =
+                NULL WHERE source = ? AND state = ?""", (source, DONE)).rowcount
+
+    def crawl(self, url, source, scrape_recipe):
+        """
+        Get recipe details for url, from the frontier if the url is done, \
+        else by scraping the recipe page. Urls that failed max_attempts \
+        times are skipped. An error while scraping marks the url failed
+        :params  url (str): recipe link
+                 source (str): source of recipes
+                 scrape_recipe (function): function without arguments that \
+                    returns recipe details (dictionary) or None if no content
+        :return  recipe details in dictionary format or None if url failed
+        """
+        recipe, claimed = self.claim(url, source)
+        if not claimed:
+            return recipe
+        try:
+            recipe = scrape_recipe()
+        except Exception as error:
+            print "failed to scrape:", url, repr(error)
+            recipe = None
+        return self.finish(url, source, recipe)
+
+    def done_recipes(self, source, limit=None):
+        """
+        Get recipe details of done urls for source
+        :params  source (str): source of recipes
+                 limit (int): maximum number of recipes, None for all
+        :return  list of recipe details in dictionary format
+        """
+        with self.lock:
+            rows = self.connection.execute("""SELECT recipe FROM frontier
+                WHERE source = ? AND state = ? ORDER BY updated_at LIMIT ?""",
+                (source, DONE, -1 if limit is None else limit)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def state_counts(self, source):
+        """
+        Get number of urls in each state for source
+        :param  source (str): source of recipes
+        :return  dictionary of (state, number of urls) pairs
+        """
+        with self.lock:
+            rows = self.connection.execute("""SELECT state, COUNT(*) FROM
+                frontier WHERE source = ? GROUP BY state""", (source,)).fetchall()
+        return dict(rows)
+
+
+# crawl frontier shared by all scrapers in this process, opened on first use
+frontier = CrawlFrontier()
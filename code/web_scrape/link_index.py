@@ -0,0 +1,86 @@
+"""
+##### Dedup recipe links found on search and collection pages by canonical url,
+##### across all cuisines of a source, keeping the cuisines each recipe was
+##### found under, so each recipe page is fetched once and tagged with every
+##### cuisine it belongs to
+"""
+
+import urllib
+import urlparse
+from collections import OrderedDict
+
+
+# prefix of tracking query parameters, which do not change the page
+TRACKING_QUERY_PREFIX = 'utm_'
+# characters of url paths not percent-escaped (reserved, unreserved and '%')
+PATH_SAFE_CHARACTERS = "/:@!$&'()*+,;=%-._~"
+
+
+def canonical_url(link, base_url=''):
+    """
+    Get canonical form of recipe link: absolute, with lower-case scheme and \
+    host, without default port, fragment, tracking query parameters and \
+    trailing slash, and with sorted query parameters. Non-ascii characters \
+    are utf-8 encoded and percent-escaped, so unicode and escaped forms of \
+    a link give the same url
+    :params  link (str): recipe link as found on page (absolute or relative)
+             base_url (str): url relative links are resolved against
+    :return  canonical url (ascii str)
+    """
+    link, base_url = [url.encode('utf-8') if isinstance(url, unicode) else url
+        for url in (link.strip(), base_url)]
+    parts = urlparse.urlsplit(urlparse.urljoin(base_url, link))
+    scheme = parts.scheme.lower()
+    host = parts.netloc.lower()
+    if (scheme, host.rsplit(':', 1)[-1]) in [('http', '80'), ('https', '443')]:
+        host = host.rsplit(':', 1)[0]
+    path = urllib.quote(parts.path.rstrip('/') or '/', PATH_SAFE_CHARACTERS)
+    query = urllib.urlencode(sorted((key, value) for key, value in
+        urlparse.parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith(TRACKING_QUERY_PREFIX)))
+    return urlparse.urlunsplit((scheme, host, path, query, ''))
+
+
+class RecipeLinkIndex(object):
+    """
+    Recipe links by canonical url, in order found, with the link first found \
+    for each url and the cuisine fields of each cuisine it was found under
+    """
+
+    def __init__(self, base_url=''):
+        """
+        :param  base_url (str): url relative recipe links are resolved against
+        """
+        self.base_url = base_url
+        self.links = OrderedDict()
+        self.cuisine_dicts = {}
+
+    def add(self, links, cuisine_dict):
+        """
+        Add recipe links found under cuisine
+        :params  links (list): recipe links (str) found for cuisine
+                 cuisine_dict (dictionary): cuisine fields, with cuisine name
+        :return  number of unique recipes among links
+        """
+        urls = set()
+        for link in links:
+            url = canonical_url(link, self.base_url)
+            urls.add(url)
+            if url not in self.links:
+                self.links[url] = link
+                self.cuisine_dicts[url] = OrderedDict()
+            self.cuisine_dicts[url].setdefault(cuisine_dict['cuisine'],
+                cuisine_dict)
+        return len(urls)
+
+    def items(self):
+        """
+        Get each unique recipe with the cuisines it was found under
+        :param  none
+        :return  list of (canonical url, link, list of cuisine fields) tuples
+        """
+        return [(url, link, self.cuisine_dicts[url].values())
+            for url, link in self.links.iteritems()]
+
+    def __len__(self):
+        return len(self.links)
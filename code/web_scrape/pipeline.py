@@ -0,0 +1,290 @@
+"""
+##### Scrape recipe pages in a pipeline of three stages connected by bounded
+##### queues: fetcher threads download recipe pages, parser threads hand the
+##### html to a pool of parser processes shared by all sources, and a writer
+##### thread stores the recipes in the crawl frontier and MongoDB. Network
+##### waits and parsing overlap, and a full queue blocks the stage feeding it,
+##### so memory stays bounded by the queue sizes
+"""
+
+import atexit
+import importlib
+import multiprocessing
+import threading
+from Queue import Queue
+
+from frontier import frontier
+
+
+# number of fetcher threads for each source (requests stay rate limited per host)
+FETCHER_THREADS = 4
+# number of parser processes shared by all sources
+PARSER_PROCESSES = multiprocessing.cpu_count()
+# maximum number of fetched recipe pages waiting to be parsed
+HTML_QUEUE_SIZE = 32
+# maximum number of parsed recipes waiting to be written
+RECIPE_QUEUE_SIZE = 100
+# seconds between queue depth reports
+QUEUE_REPORT_INTERVAL = 30
+# marker put on a queue after its last item, one for each thread reading it
+END = None
+
+# pool of parser processes, created on first use
+parser_pool = None
+parser_pool_lock = threading.Lock()
+
+
+def get_parser_pool(processes=PARSER_PROCESSES):
+    """
+    Get pool of parser processes shared by all pipelines, created on first \
+    use. Parser processes are forked with the scraper modules loaded, so \
+    call this before starting scraper threads
+    :param  processes (int): number of parser processes
+    :return  multiprocessing pool
+    """
+    global parser_pool
+    with parser_pool_lock:
+        if parser_pool is None:
+            parser_pool = multiprocessing.Pool(processes)
+            atexit.register(parser_pool.terminate)
+    return parser_pool
+
+
+def parse_page(scraper_name, r_link, recipe_content):
+    """
+    Parse recipe page in a parser process
+    :params  scraper_name (str): name of scraper module with a parse_recipe \
+                function (of recipe link and html content)
+             r_link (str): recipe link
+             recipe_content (str): html content for recipe page
+    :return  recipe details in dictionary format
+    """
+    return importlib.import_module(scraper_name).parse_recipe(r_link,
+        recipe_content)
+
+
+def start_threads(target, number, name):
+    """
+    Start daemon threads running target
+    :params  target (function): function without arguments run by each thread
+             number (int): number of threads
+             name (str): thread name prefix
+    :return  list of started threads
+    """
+    threads = [threading.Thread(target=target, name='%s-%d' % (name, i))
+        for i in xrange(number)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    return threads
+
+
+class RecipePipeline(object):
+    """
+    Fetch, parse and write stages for the recipe pages of one source. Urls \
+    are claimed in the crawl frontier before fetching: recipes already \
+    scraped (and not due to be scraped again) go straight to the writer and \
+    urls that failed too often are skipped. Failed fetches and parses mark \
+    the url failed, or write the recipe scraped before when scraping a done \
+    url again
+    """
+
+    def __init__(self, source, scraper_name, get_recipe, recipe_writer,
+                 fetchers=FETCHER_THREADS, parsers=PARSER_PROCESSES,
+                 html_queue_size=HTML_QUEUE_SIZE,
+                 recipe_queue_size=RECIPE_QUEUE_SIZE,
+                 report_interval=QUEUE_REPORT_INTERVAL):
+        """
+        :params  source (str): source of recipes (frontier source)
+                 scraper_name (str): name of scraper module, parsed in the \
+                    parser processes with its parse_recipe function
+                 get_recipe (function): function of recipe link that returns \
+                    html content for recipe page or None (if no content)
+                 recipe_writer (RecipeWriter): writer of recipe documents
+                 fetchers (int): number of fetcher threads
+                 parsers (int): number of parser threads, each waiting on one \
+                    page parsed in the parser processes
+                 html_queue_size (int): maximum number of pages waiting to be \
+                    parsed
+                 recipe_queue_size (int): maximum number of recipes waiting \
+                    to be written
+                 report_interval (float): seconds between queue depth reports
+        """
+        self.source = source
+        self.scraper_name = scraper_name
+        self.get_recipe = get_recipe
+        self.recipe_writer = recipe_writer
+        self.fetchers = fetchers
+        self.parsers = parsers
+        self.report_interval = report_interval
+        self.queues = {'links': Queue(), 'html': Queue(html_queue_size),
+            'recipes': Queue(recipe_queue_size)}
+        self.max_depths = dict.fromkeys(self.queues, 0)
+        self.number_written = 0
+        self.write_error = None
+        self.pool = None
+
+    def put(self, name, item):
+        """
+        Put item on queue, waiting while the queue is full
+        :params  name (str): queue name (links, html or recipes)
+                 item (tuple): queue item, or END
+        :return  none
+        """
+        queue = self.queues[name]
+        queue.put(item)
+        self.max_depths[name] = max(self.max_depths[name], queue.qsize())
+
+    def fetch(self):
+        """
+        Fetcher thread: claim recipe links in the frontier and fetch their \
+        recipe pages onto the html queue
+        :param  none
+        :return  none
+        """
+        while True:
+            item = self.queues['links'].get()
+            if item is END:
+                return
+            url, link, cuisine_dicts = item
+            recipe, claimed = frontier.claim(url, self.source)
+            if recipe is not None:
+                self.put('recipes', (url, cuisine_dicts, recipe, False))
+            if not claimed:
+                continue
+            print "recipe link: ", link
+            try:
+                recipe_content = self.get_recipe(link)
+            except Exception as error:
+                print "failed to fetch:", url, repr(error)
+                recipe_content = None
+            if not recipe_content:
+                self.fail(url, cuisine_dicts)
+                continue
+            self.put('html', (url, link, cuisine_dicts, recipe_content))
+
+    def parse(self):
+        """
+        Parser thread: parse recipe pages from the html queue in the parser \
+        processes onto the recipe queue
+        :param  none
+        :return  none
+        """
+        while True:
+            item = self.queues['html'].get()
+            if item is END:
+                return
+            url, link, cuisine_dicts, recipe_content = item
+            try:
+                recipe = self.pool.apply(parse_page, (self.scraper_name, link,
+                    recipe_content))
+            except Exception as error:
+                print "failed to parse:", url, repr(error)
+                self.fail(url, cuisine_dicts)
+                continue
+            self.put('recipes', (url, cuisine_dicts, recipe, True))
+
+    def fail(self, url, cuisine_dicts):
+        """
+        Mark url failed in the frontier, and write the recipe scraped before \
+        if the url was being scraped again
+        :params  url (str): recipe link
+                 cuisine_dicts (list): cuisine fields of the cuisines of recipe
+        :return  none
+        """
+        recipe = frontier.finish(url, self.source, None)
+        if recipe is not None:
+            self.put('recipes', (url, cuisine_dicts, recipe, False))
+
+    def write(self):
+        """
+        Writer thread: mark scraped recipes done in the frontier and write \
+        each recipe once for every cuisine it was found under. After a write \
+        error the queue is still drained, so the other stages do not block
+        :param  none
+        :return  none
+        """
+        while True:
+            item = self.queues['recipes'].get()
+            if item is END:
+                return
+            url, cuisine_dicts, recipe, scraped = item
+            if scraped:
+                recipe = frontier.finish(url, self.source, recipe)
+            if self.write_error is not None:
+                continue
+            try:
+                for cuisine_dict in cuisine_dicts:
+                    self.recipe_writer.write(cuisine_dict, recipe)
+                    self.number_written += 1
+            except Exception as error:
+                print "failed to write:", url, repr(error)
+                self.write_error = error
+
+    def queue_depths(self):
+        """
+        Get number of items waiting in each queue
+        :param  none
+        :return  dictionary of (queue name, number of items) pairs
+        """
+        return dict((name, queue.qsize()) for name, queue in self.queues.iteritems())
+
+    def print_queue_depths(self):
+        """
+        Print current and maximum queue depths
+        :param  none
+        :return  none
+        """
+        depths = self.queue_depths()
+        print "%s: \t queue depths: %s" % (self.source, ", ".join("%s %d (max %d)"
+            % (name, depths[name], self.max_depths[name])
+            for name in ['links', 'html', 'recipes']))
+
+    def report(self, stopped):
+        """
+        Reporter thread: print queue depths every report_interval seconds \
+        until stopped
+        :param  stopped (Event): set when the pipeline is done
+        :return  none
+        """
+        while not stopped.wait(self.report_interval):
+            self.print_queue_depths()
+
+    def run(self, recipes):
+        """
+        Scrape recipes through the pipeline and wait until all are written
+        :param  recipes (list): (canonical url, link, list of cuisine fields) \
+                    tuples, as from RecipeLinkIndex.items
+        :return  number of recipe documents written
+        """
+        # parser processes are forked before the frontier is opened and any
+        # thread of the pipeline is started
+        self.pool = get_parser_pool()
+        frontier.add([url for url, link, cuisine_dicts in recipes], self.source)
+        for recipe in recipes:
+            self.put('links', recipe)
+        for i in xrange(self.fetchers):
+            self.put('links', END)
+        stopped = threading.Event()
+        reporter = threading.Thread(target=self.report, args=(stopped,),
+            name=self.source + '-report')
+        reporter.daemon = True
+        reporter.start()
+        fetchers = start_threads(self.fetch, self.fetchers, self.source + '-fetch')
+        parsers = start_threads(self.parse, self.parsers, self.source + '-parse')
+        writer = start_threads(self.write, 1, self.source + '-write')
+        # each stage ends after the stage feeding it, when its queue is drained
+        for thread in fetchers:
+            thread.join()
+        for thread in parsers:
+            self.put('html', END)
+        for thread in parsers:
+            thread.join()
+        self.put('recipes', END)
+        writer[0].join()
+        stopped.set()
+        reporter.join()
+        self.print_queue_depths()
+        if self.write_error is not None:
+            raise self.write_error
+        return self.number_written
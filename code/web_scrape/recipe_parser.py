@@ -0,0 +1,326 @@
+"""
+##### Parse recipe pages once with lxml and extract all recipe fields from a
+##### declarative per-site field spec, instead of walking the page tree again
+##### with BeautifulSoup for each field. Fields are taken from the page's
+##### schema.org Recipe (JSON-LD or microdata) where the page has one, and
+##### from the site's selectors otherwise
+"""
+
+import json
+import lxml.html
+from lxml import etree
+
+
+# script elements holding JSON-LD structured data
+JSON_LD_SCRIPTS = etree.XPath('//script[@type="application/ld+json"]')
+# first element holding a schema.org Recipe in microdata
+MICRODATA_RECIPE = etree.XPath("(//*[@itemscope][contains(@itemtype, \
+'schema.org/Recipe')])[1]")
+# attribute holding the microdata value of elements, by tag (other elements
+# use their text)
+MICRODATA_VALUE_ATTRIBUTES = {'meta': 'content', 'img': 'src', 'audio': 'src',
+    'video': 'src', 'source': 'src', 'embed': 'src', 'iframe': 'src',
+    'a': 'href', 'link': 'href', 'area': 'href', 'time': 'datetime'}
+# Recipe properties holding steps, used only as a list or as HowToStep and
+# HowToSection objects: a single text (JSON-LD string, or microdata on the
+# element around the steps) runs all steps together
+STEP_PROPERTIES = ['recipeInstructions']
+# schema.org types of step objects
+STEP_TYPES = ['HowToStep', 'HowToSection']
+
+
+def has_class(name):
+    """
+    Get XPath condition for elements with class name among their classes
+    :param  name (str): class name
+    :return  XPath condition
+    """
+    return "contains(concat(' ', normalize-space(@class), ' '), ' %s ')" % name
+
+
+def parse_html(content):
+    """
+    Parse html content into lxml tree, decoding utf-8 content, other content \
+    is decoded by lxml from the page's charset
+    :param  content (str): html content for web page
+    :return  root element of lxml html tree
+    """
+    if isinstance(content, str):
+        try:
+            content = content.decode('utf-8')
+        except UnicodeDecodeError:
+            pass
+    return lxml.html.document_fromstring(content)
+
+
+def text_value(match):
+    """
+    Get text of XPath match, the text content of an element or the value of \
+    an attribute
+    :param  match (element or str): XPath match
+    :return  text in unicode format
+    """
+    if isinstance(match, basestring):
+        return unicode(match)
+    return unicode(match.text_content())
+
+
+def find_json_ld_recipe(data):
+    """
+    Find schema.org Recipe object in JSON-LD data
+    :param  data (object): decoded JSON-LD data (object, list or @graph)
+    :return  dictionary of Recipe properties or None if there is no Recipe
+    """
+    if isinstance(data, list):
+        for item in data:
+            recipe = find_json_ld_recipe(item)
+            if recipe is not None:
+                return recipe
+        return None
+    if not isinstance(data, dict):
+        return None
+    types = data.get('@type')
+    if 'Recipe' == types or (isinstance(types, list) and 'Recipe' in types):
+        return data
+    return find_json_ld_recipe(data.get('@graph'))
+
+
+def json_ld_recipe(root):
+    """
+    Get schema.org Recipe from JSON-LD scripts of parsed page
+    :param  root (element): root element of lxml html tree
+    :return  dictionary of Recipe properties or None if there is no Recipe
+    """
+    for script in JSON_LD_SCRIPTS(root):
+        try:
+            data = json.loads(script.text or '')
+        except ValueError:
+            continue
+        recipe = find_json_ld_recipe(data)
+        if recipe is not None:
+            return recipe
+    return None
+
+
+def microdata_value(element):
+    """
+    Get microdata value of element with itemprop
+    :param  element (element): lxml element
+    :return  value in unicode format
+    """
+    if element.get('content') is not None:
+        return unicode(element.get('content'))
+    attribute = MICRODATA_VALUE_ATTRIBUTES.get(element.tag)
+    if attribute and element.get(attribute) is not None:
+        return unicode(element.get(attribute))
+    return unicode(element.text_content())
+
+
+def microdata_item(scope):
+    """
+    Get properties of microdata item, nested items (elements with itemprop \
+    and itemscope) as dictionaries of their own properties
+    :param  scope (element): lxml element with itemscope
+    :return  dictionary of (property, value or list of values) pairs
+    """
+    properties = {}
+    elements = list(scope.iterchildren(tag=etree.Element))
+    while elements:
+        element = elements.pop(0)
+        names = element.get('itemprop')
+        nested_item = element.get('itemscope') is not None
+        if names:
+            value = microdata_item(element) if nested_item else \
+                microdata_value(element)
+            for name in names.split():
+                properties.setdefault(name, []).append(value)
+        if not nested_item:
+            elements[:0] = element.iterchildren(tag=etree.Element)
+    return dict((name, values[0] if len(values) == 1 else values)
+        for name, values in properties.iteritems())
+
+
+def structured_recipe(root):
+    """
+    Get schema.org Recipe of parsed page from JSON-LD and microdata, JSON-LD \
+    properties are used over microdata properties
+    :param  root (element): root element of lxml html tree
+    :return  dictionary of Recipe properties or None if page has no Recipe
+    """
+    microdata_scopes = MICRODATA_RECIPE(root)
+    recipe = microdata_item(microdata_scopes[0]) if microdata_scopes else None
+    json_ld = json_ld_recipe(root)
+    if json_ld is not None:
+        recipe = dict(recipe or {}, **json_ld)
+    return recipe
+
+
+def schema_property(recipe, name):
+    """
+    Get property of structured Recipe, a dotted name (e.g. \
+    'aggregateRating.ratingValue') gets property of nested object
+    :params  recipe (dictionary): Recipe properties
+             name (str): property name
+    :return  property value or None if missing
+    """
+    value = recipe
+    for key in name.split('.'):
+        if isinstance(value, list):
+            value = value[0] if value else None
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def is_step_list(value):
+    """
+    Check if structured data value holds separate steps, a list or a \
+    HowToStep or HowToSection object
+    :param  value (object): structured data value
+    :return  boolean, true if value holds separate steps, else false
+    """
+    if isinstance(value, list):
+        return True
+    if not isinstance(value, dict):
+        return False
+    types = value.get('@type')
+    return any(step_type == types or (isinstance(types, list) and step_type in
+        types) for step_type in STEP_TYPES)
+
+
+def schema_texts(value):
+    """
+    Flatten structured data value into texts: lists are flattened, objects \
+    give their text, name or url (e.g. HowToStep, Person, ImageObject) and \
+    sections their list of items
+    :param  value (object): structured data value
+    :return  list of texts in unicode format
+    """
+    if value is None or isinstance(value, bool):
+        return []
+    if isinstance(value, list):
+        return [text for item in value for text in schema_texts(item)]
+    if isinstance(value, dict):
+        if 'itemListElement' in value:
+            return schema_texts(value['itemListElement'])
+        for key in ('text', 'name', 'url', '@id'):
+            if key in value:
+                return schema_texts(value[key])
+        return []
+    return [unicode(value)]
+
+
+class RecipeParser(object):
+    """
+    Extracts recipe fields from html content, with each field described by a \
+    spec dictionary with keys:
+        path: XPath, or list of XPaths tried in order until one matches, \
+            matching elements (for their text) or attributes
+        many: True for a list of all matches, else the first match is used
+        strip: True to strip whitespace from text
+        value: function of match to use instead of its text
+        post: function applied to each value
+        combine: function applied to the list of values (many fields)
+        default: value when nothing matches (None, or [] for many fields)
+        required: True to raise ValueError when nothing matches
+        schema: schema.org Recipe property, or list of properties tried in \
+            order, to take the field from (strip and post apply to its texts), \
+            step properties only when they hold separate steps
+    Fields with a schema property are taken from the page's structured \
+    Recipe where it has the property, other fields from the path
+    """
+
+    def __init__(self, fields):
+        """
+        :param  fields (dictionary): (field name, field spec) pairs
+        """
+        self.fields = []
+        for name, spec in sorted(fields.iteritems()):
+            paths = spec['path']
+            if isinstance(paths, basestring):
+                paths = [paths]
+            self.fields.append((name, dict(spec,
+                path=[etree.XPath(path) for path in paths])))
+        # number of fields taken from structured data and from selectors
+        self.field_sources = {'structured': 0, 'selector': 0}
+
+    def structured_value(self, recipe, spec):
+        """
+        Get field from structured Recipe
+        :params  recipe (dictionary): Recipe properties
+                 spec (dictionary): field spec with schema property
+        :return  field value or None if Recipe does not have the property
+        """
+        names = spec['schema']
+        if isinstance(names, basestring):
+            names = [names]
+        for name in names:
+            value = schema_property(recipe, name)
+            if name in STEP_PROPERTIES and not is_step_list(value):
+                continue
+            texts = schema_texts(value)
+            if texts:
+                break
+        else:
+            return None
+        if spec.get('strip'):
+            texts = [text.strip() for text in texts]
+        if 'post' in spec:
+            texts = map(spec['post'], texts)
+        return texts if spec.get('many') else texts[0]
+
+    def extract(self, root, name, spec):
+        """
+        Extract one field from parsed page
+        :params  root (element): root element of lxml html tree
+                 name (str): field name
+                 spec (dictionary): field spec with compiled XPaths
+        :return  field value
+        """
+        many = spec.get('many', False)
+        matches = []
+        for path in spec['path']:
+            matches = path(root)
+            if matches:
+                break
+        if not matches:
+            if spec.get('required'):
+                raise ValueError("no match for required field: %s" % name)
+            return spec.get('default', [] if many else None)
+        values = []
+        for match in (matches if many else matches[:1]):
+            value = spec['value'](match) if 'value' in spec else text_value(match)
+            if spec.get('strip'):
+                value = value.strip()
+            if 'post' in spec:
+                value = spec['post'](value)
+            values.append(value)
+        if not many:
+            return values[0]
+        if 'combine' in spec:
+            return spec['combine'](values)
+        return values
+
+    def parse(self, content):
+        """
+        Parse html content once and extract all recipe fields, from the \
+        structured Recipe where the field has a schema property the Recipe \
+        has, else from the field's path
+        :param  content (str): html content for recipe page
+        :return  dictionary of (field name, value) pairs
+        """
+        root = parse_html(content)
+        recipe = structured_recipe(root)
+        fields = {}
+        for name, spec in self.fields:
+            value = None
+            if recipe is not None and 'schema' in spec:
+                value = self.structured_value(recipe, spec)
+            if value is None:
+                value = self.extract(root, name, spec)
+                self.field_sources['selector'] += 1
+            else:
+                self.field_sources['structured'] += 1
+            fields[name] = value
+        return fields
@@ -0,0 +1,134 @@
+"""
+##### On-disk cache of web responses for the scrapers, keyed by url, in a
+##### SQLite file in the data folder. Bodies are stored zlib compressed with
+##### their ETag and Last-Modified headers, so stale pages are revalidated
+##### with conditional requests, and fresh pages are not requested at all
+"""
+
+import os
+import sys
+import sqlite3
+import threading
+import time
+import zlib
+
+# shared storage module is in the parent code folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from storage import DATA_FOLDER
+
+
+# file-name of response cache in data folder
+CACHE_NAME = 'response_cache.sqlite'
+# page types, search listing pages change as recipes are added, recipe pages rarely
+SEARCH_PAGE = 'search'
+RECIPE_PAGE = 'recipe'
+# time (in seconds) a cached page is used without revalidating, by page type
+PAGE_TTLS = {SEARCH_PAGE: 24 * 60 * 60, RECIPE_PAGE: 30 * 24 * 60 * 60}
+# compression level for cached bodies
+COMPRESSION_LEVEL = 6
+
+
+class ResponseCache(object):
+    """
+    Cached response body, validators and fetch time for each url. The SQLite \
+    connection is shared by the scraper threads, guarded by a lock
+    """
+
+    def __init__(self, path=DATA_FOLDER + CACHE_NAME, ttls=PAGE_TTLS):
+        """
+        :params  path (str): path of SQLite cache file
+                 ttls (dictionary): time (in seconds) a cached page is fresh, \
+                    by page type
+        """
+        self.ttls = ttls
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY, body BLOB, etag TEXT,
+                last_modified TEXT, fetched_at REAL)""")
+        # number of pages served fresh from cache, revalidated by a 304
+        # response, and downloaded
+        self.stats = {'fresh': 0, 'revalidated': 0, 'downloaded': 0}
+
+    def get(self, url):
+        """
+        Get cached response for url
+        :param  url (str): web page link
+        :return  dictionary of body, etag, last_modified and fetched_at, \
+                    or None if url is not cached
+        """
+        with self.lock:
+            row = self.connection.execute("""SELECT body, etag, last_modified,
+                fetched_at FROM responses WHERE url = ?""", (url,)).fetchone()
+        if row is None:
+            return None
+        return {'body': zlib.decompress(row[0]), 'etag': row[1],
+            'last_modified': row[2], 'fetched_at': row[3]}
+
+    def is_fresh(self, entry, page_type):
+        """
+        Check if cached response can be used without revalidating
+        :params  entry (dictionary): cached response
+                 page_type (str): SEARCH_PAGE or RECIPE_PAGE
+        :return  boolean, true if cached response is younger than the ttl \
+                    for page type, else false
+        """
+        return time.time() - entry['fetched_at'] < self.ttls[page_type]
+
+    def conditional_headers(self, entry):
+        """
+        Get headers to revalidate cached response with a conditional request
+        :param  entry (dictionary): cached response
+        :return  dictionary of If-None-Match and If-Modified-Since headers \
+                    for the validators the response had
+        """
+        headers = {}
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def put(self, url, body, etag=None, last_modified=None):
+        """
+        Store response for url, replacing any cached response
+        :params  url (str): web page link
+                 body (str): html content for web page
+                 etag (str): ETag header of response
+                 last_modified (str): Last-Modified header of response
+        :return  none
+        """
+        compressed_body = sqlite3.Binary(zlib.compress(body, COMPRESSION_LEVEL))
+        with self.lock, self.connection:
+            self.connection.execute("""INSERT OR REPLACE INTO responses
+                VALUES (?, ?, ?, ?, ?)""", (url, compressed_body, etag,
+                last_modified, time.time()))
+
+    def touch(self, url):
+        """
+        Mark cached response for url as fetched now, after it was revalidated
+        :param  url (str): web page link
+        :return  none
+        """
+        with self.lock, self.connection:
+            self.connection.execute("""UPDATE responses SET fetched_at = ?
+                WHERE url = ?""", (time.time(), url))
+
+    def count(self, outcome):
+        """
+        Count a page served from cache, revalidated or downloaded
+        :param  outcome (str): 'fresh', 'revalidated' or 'downloaded'
+        :return  none
+        """
+        with self.lock:
+            self.stats[outcome] += 1
+
+    def print_stats(self):
+        """
+        Print number of pages served fresh from cache, revalidated and downloaded
+        :param  none
+        :return  none
+        """
+        print "cache: \t fresh: %(fresh)d \t revalidated: %(revalidated)d \t \
+downloaded: %(downloaded)d" % self.stats
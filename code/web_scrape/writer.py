@@ -0,0 +1,107 @@
+"""
+##### Write scraped recipes to MongoDB one document per recipe, as soon as each
+##### recipe is parsed, with batched upserts, instead of one document holding
+##### all recipes of a cuisine, and write the recipes of a source from MongoDB
+##### to its Parquet file in chunks
+"""
+
+import os
+import sys
+import pandas as pd
+from pymongo import ReplaceOne
+
+# shared storage module is in the parent code folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from storage import save_recipe_chunks, ROW_GROUP_SIZE
+
+
+# number of recipe documents written to MongoDB in one bulk write
+WRITE_FLUSH_SIZE = 100
+
+
+class RecipeWriter(object):
+    """
+    Buffer of recipe upserts for a MongoDB collection, written in batches of \
+    flush_size. Each document holds the cuisine fields (cuisine, source, \
+    num_recipes, pages) and the recipe details of one recipe, and is keyed \
+    by source, cuisine and recipe link, so scraping a recipe again replaces it
+    """
+
+    def __init__(self, coll, flush_size=WRITE_FLUSH_SIZE):
+        """
+        :params  coll (collection): MongoDB collection to write recipes in
+                 flush_size (int): number of recipes written in one bulk write
+        """
+        self.coll = coll
+        self.flush_size = flush_size
+        self.operations = []
+        self.number_written = 0
+        self.index_created = False
+
+    def write(self, cuisine_dict, recipe):
+        """
+        Add upsert of recipe document, and write buffered upserts if there \
+        are flush_size of them
+        :params  cuisine_dict (dictionary): cuisine fields for recipe (cuisine, \
+                    source and optionally num_recipes and pages)
+                 recipe (dictionary): dict of recipe details for one recipe
+        :return  none
+        """
+        document = dict(cuisine_dict)
+        document['recipes_details'] = recipe
+        self.operations.append(ReplaceOne({'source': cuisine_dict['source'],
+            'cuisine': cuisine_dict['cuisine'],
+            'recipes_details.r_link': recipe['r_link']}, document, upsert=True))
+        if len(self.operations) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write buffered upserts to MongoDB
+        :param  none
+        :return  none
+        """
+        if not self.operations:
+            return
+        if not self.index_created:
+            # index on the upsert key, so each upsert finds its recipe directly
+            self.coll.create_index([('source', 1), ('cuisine', 1),
+                ('recipes_details.r_link', 1)])
+            self.index_created = True
+        self.coll.bulk_write(self.operations, ordered=False)
+        self.number_written += len(self.operations)
+        self.operations = []
+
+    def recipe_chunks(self, source, chunk_size=ROW_GROUP_SIZE):
+        """
+        Read recipe documents of source from MongoDB in chunks of dataframes \
+        with one row per recipe, in the format of the scraped recipe \
+        dataframes, so only one chunk of recipes is in memory
+        :params  source (str): source of recipes
+                 chunk_size (int): number of recipes in each chunk
+        :return  generator of recipe details in pandas dataframes
+        """
+        documents = self.coll.find({'source': source,
+            'recipes_details.r_link': {'$exists': True}},
+            {'_id': False}).sort('_id', 1).batch_size(chunk_size)
+        chunk = []
+        for document in documents:
+            chunk.append(document)
+            if len(chunk) == chunk_size:
+                yield pd.DataFrame(chunk)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk)
+
+    def save_recipes(self, source, name, chunk_size=ROW_GROUP_SIZE):
+        """
+        Write buffered upserts, then write recipe documents of source from \
+        MongoDB in Parquet file in data folder, one chunk (row group) at a time
+        :params  source (str): source of recipes
+                 name (str): file-name to save recipes with
+                 chunk_size (int): number of recipes in each chunk
+        :return  number of recipes written
+        """
+        self.flush()
+        return save_recipe_chunks(lambda: self.recipe_chunks(source, chunk_size),
+            name, chunk_size)